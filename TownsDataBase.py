@@ -28,13 +28,73 @@ reCompileDB():
                     Scrape - type Boolean True|False. If false, it downloads a
                     precompiled dataset from an online repository. If True, the
                     Data is scraped from the original sources (GeoNames, Wiki).  
+                    binary - type Boolean True|False. If True, the compiled 
+                    (memory-mappable) dataset is also written, see compileBinaryDB.
+                    workers - number of countries scraped concurrently, and of
+                    the processes (at most one per core) which compile the 
+                    country tables: from the archive, each <CC>.json is read 
+                    straight from the zip, completed (alias list, name keys)
+                    and saved as soon as it is done, while ProvinceDB is 
+                    gathered from the finished countries. Every file is written
+                    atomically (temporary file + rename).
+                    session - ScrapeSession (shared pooled HTTP client with per-
+                    host concurrency/rate limits and retries with backoff).
+                    resume - type Boolean True|False. If True (default), countries
+                    already recorded in the scrape manifest (ScrapeManifest.json:
+                    per-country timestamp, content hash & provinces) are skipped,
+                    so an interrupted scrape continues where it stopped.
+                    countries - list of 2-char country IDs to (re-)scrape; the
+                    other countries are left as they are.
+                    maxAge - seconds after which manifest entries are stale and
+                    get re-scraped (None: never stale).
     >output         Saves datafiles locally on host system.
 
+compileBinaryDB():
+    >description    Compiles the local JSON dataset into a compact binary format:
+                    string tables plus columnar NumPy arrays (Latitude, Longitude,
+                    Population, TownClass, AliasIndex, ...) which loadDB can 
+                    memory-map, e.g. townsDB = TownsDataBase.loadDB(mmap=True)
+    >inputs         PATH - Where local dataset is saved.
+                    OUT - Where to save the compiled dataset (PATH/Compiled/).
+    >output         Saves the compiled datafiles locally on host system.
+
 loadDB():
     >description    Loads the local dataset into memory as an object type DICT. 
                     Assign a name to this object, e.g. 
                         townsDB = TownsDataBase.loadDB()
     >inputs         PATH - Where local dataset is saved.
+                    ngramIndex - type Boolean True|False. If True (default), an
+                    inverted character-trigram index over every TownName and
+                    Alias is used, so that queryCityName without a countryID
+                    only scores a few hundred candidate towns.
+                    typoIndex - type Boolean True|False. If True (default),
+                    delete-variant (SymSpell-style, edit distance 1 for towns,
+                    2 for country names & aliases) and Soundex indexes are 
+                    used, so misspellings ('Britin', 'Dublni') are found by
+                    a dictionary lookup before the fuzzy scorers run.
+                    The indexes are built on the first query that needs them
+                    (or all at once by warmIndexes(townsDB), as serveDB does),
+                    so loading stays fast.
+                    cacheSize - if > 0, attach a memoizing LRU query cache of
+                    this many results (see enableQueryCache).
+                    cachePATH - JSON file to warm-start the query cache from.
+                    mmap - type Boolean True|False. If True, the compiled binary
+                    dataset (see compileBinaryDB) is memory-mapped instead of 
+                    parsing the JSON files; worker processes then share one
+                    page-cached copy of the towns tables.
+                    lazy - type Boolean True|False. If True, townsDB['TOWNS'] is
+                    a lazy mapping which reads a country's table the first time
+                    it is accessed (useful when countryID is known before the
+                    city lookup). Tables can be released with unloadCountry().
+                    preload - list of countryIDs to load up front (lazy only).
+                    columnar - type Boolean True|False. If True, the towns tables
+                    are stored as compact typed columns (NumPy arrays, category
+                    codes, interned strings) instead of lists of Python objects;
+                    they read back the same, e.g. TOWNS[cc]['Population'][idx],
+                    and townRecord() gives a row view of one town.
+                    spatialIndex - kept for compatibility: the grid index over 
+                    the town Latitude/Longitude is built on the first 
+                    reverseGeocode call.
     >output         object dict containing standardised information on all known
                     countries, provinces, counties, cities and towns. Additional
                     information on these places, such as Latitude,Longitude, 
@@ -52,8 +112,134 @@ queryCountryName():
                                              which allows the best match to be 
                                              returned after a thorough matching
                                              process [it can take ~10 seconds]
+                    scorer - scoring engine: 'rapidfuzz' (fast, default when the
+                             rapidfuzz package is installed) or 'fuzzywuzzy' (v1.0
+                             fuzzywuzzy + difflib scoring), see scoreEngines.
+                    budget, workBudget - optional bound on the query: seconds,
+                             and/or number of candidate names scored (also for
+                             queryCityName, which searches the countries in 
+                             priority order: countryHint, past matches, 
+                             population). The result is then returned as 
+                             [result, budgetHit]; when budgetHit is True the 
+                             search was cut short and result is the best match
+                             found so far.
     >ouput          returns list containing the two-char country ID, and the 
                     liklihood metric of the matching process [0.0 --> 1.0].
+                    Exact names, ISO codes, aliases, capitals and provinces 
+                    (ignoring case, accents & punctuation) are looked up in a
+                    dictionary built by loadDB, and return a score of 1.0 
+                    without any fuzzy matching.
+
+queryLocationNames(), parallelQueryNames():
+    >description    Match aligned COUNTRY & CITY columns in one call: countries are
+                    resolved first, then cities within the resolved country.
+                    parallelQueryNames shards the distinct (country, city) pairs
+                    over a pool of worker processes, which share the loaded 
+                    dataset (fork-inherited, or memory-mapped with mmap=True).
+    >inputs         CountryEntries, CityEntries - aligned Series/lists/arrays
+                    TownsDB, Threshold, LowestAllowedThreshold - as above
+                    workers - number of worker processes (default: all cores)
+                    chunkSize - number of distinct pairs per work item
+    >ouput          pandas DataFrame, in input order, with columns countryID, 
+                    countryScore, townName, cityScore and townIdx.
+
+reverseGeocode():
+    >description    Finds the towns nearest to a location (or to arrays of 
+                    locations, vectorized), using the spatial grid index built
+                    by loadDB.
+    >inputs         Latitude, Longitude - degrees, scalars or arrays
+                    TownsDB - var name of dataset loaded in memory
+                    k - number of nearest towns to return (default 1)
+                    radiusKM - only return towns within this distance; with 
+                               k=None all towns within the radius are returned
+    >ouput          scalar location: list of [TownName, distanceKM, townIdx, 
+                    countryID] (nearest first). Arrays: pandas DataFrame with
+                    columns query (position of the location in the input), 
+                    rank, TownName, distanceKM, townIdx and countryID.
+
+parseAddress(), parseAddresses():
+    >description    Matches free-text address lines ("12 Main St, Cork, Co. Cork,
+                    Ireland"): the line is split into fragments, the country is
+                    resolved first (exact name/code/alias lookup, fuzzy as a last
+                    resort), then the province, and the city is searched within
+                    that country's towns only.
+    >inputs         Address - address line (parseAddresses: Series/list/array)
+                    TownsDB, Threshold, LowestAllowedThreshold - as above
+    >ouput          DICT (parseAddresses: pandas DataFrame aligned with the input
+                    index) of countryID, countryScore, province (as named by
+                    the address), townName, cityScore, townIdx, townProvince
+                    (of the matched town) and remainder (unmatched fragments).
+
+enrichFile():
+    >description    Streams an address table (CSV, Parquet or Excel) through the
+                    matcher in chunks and writes each enriched chunk out before
+                    reading the next (flat memory use), joining the matched 
+                    town's Population, Latitude, Longitude, Province & TownClass.
+                    Also run from the command line:
+                        python TownsDataBase.py enrich IN.xlsx OUT.csv --path PATH
+    >inputs         inPATH, outPATH - input & output files (format by extension)
+                    countryColumn, cityColumn - or addressColumn (parseAddress)
+                    chunkSize - rows per chunk; startRow - rows to skip (resume)
+                    TownsDB, Threshold, LowestAllowedThreshold - as above
+    >ouput          Writes outPATH; returns a DICT of rows, matched and nextRow.
+
+serveDB():
+    >description    Matching service: loads the dataset once and serves matches
+                    over HTTP or a Unix socket, so many jobs share one warm 
+                    dataset, index and cache. Concurrent requests are micro-
+                    batched and matched on a pool of worker processes. Also
+                    started from the command line:
+                        python TownsDataBase.py serve --path PATH --port 8765
+    >inputs         PATH, host, port / unixSocket, workers, batchWindow, 
+                    maxBatch, mmap, cacheSize, Threshold, LowestAllowedThreshold
+    >ouput          Endpoints GET /health, /stats, /match?country=..&city=.. and
+                    POST /match {"country":..,"city":..} or {"address":..}, 
+                    POST /batch [{...}, ...], all answering JSON.
+
+normalizeName(), normalizeNames():
+    >description    Normalized matching key of a name: accents stripped, letters
+                    transliterated (ß -> ss, ø -> o), '&' -> 'and', casefolded,
+                    punctuation collapsed. The keys of every TownName, Alias,
+                    country, capital & province are precomputed (recompileDB
+                    writes them, loadDB adds any missing), and the rapidfuzz 
+                    scorer compares the normalized query with them.
+    >inputs         strs - a name (normalizeNames: Series/list/array of names)
+    >ouput          the key string (normalizeNames: list of keys)
+
+enableMetrics(), getMetrics(), metricsText(), resetMetrics():
+    >description    Opt-in profiling of the query cascades: per-stage timers and
+                    counters (capFix, cache, TownName/Aliases passes, country/
+                    alias/capital/province passes, fallback), candidates scored,
+                    which stage produced each match, fallback frequency and 
+                    budget hits. Near-zero overhead while disabled.
+    >inputs         TownsDB - var name of dataset loaded in memory
+    >ouput          getMetrics returns a DICT per query function, metricsText 
+                    the same counters in the Prometheus text format.
+
+enableQueryCache(), queryCacheStats(), saveQueryCache():
+    >description    Memoizes queryCountryName/queryCityName results in a bounded
+                    LRU cache attached to the dataset object, keyed on the
+                    normalized entry, countryID and thresholds. Address data is
+                    very repetitive, so most queries become dictionary lookups.
+                    A saved cache records the hash of its dataset, and is only
+                    warm-started from by the same dataset.
+    >inputs         TownsDB - var name of dataset loaded in memory
+                    maxSize - maximum number of cached results (LRU eviction)
+                    PATH - JSON file to warm-start from / persist to
+    >ouput          queryCacheStats returns a DICT of hits, misses, evictions,
+                    size, maxSize and hitRate.
+
+queryCountryNames(), queryCityNames():
+    >description    Batch versions of queryCountryName and queryCityName for whole
+                    columns of an address table. Identical entries are matched
+                    only once, and city lookups are grouped by countryID.
+    >inputs         CountryEntries / CityEntries - pandas Series, list or array
+                    CountryIDs - (queryCityNames only) Series/list of two-char
+                                 country IDs aligned with CityEntries, or None
+                    TownsDB, Threshold, LowestAllowedThreshold - as above
+    >ouput          pandas DataFrame, aligned with the input index, with columns
+                    countryID, countryScore (queryCountryNames) or townName,
+                    cityScore, townIdx, countryID (queryCityNames).
                     
                     
                 
@@ -82,25 +268,77 @@ v1.0 Initial writing and testing. 09-Apr-2019. Brian Scanlon
 
 ToDoList:
 ---------
-1. Write up a function to query town/city. It should return townIndex (primary key)
-   so that Latitude, lngitude, population of town/city can be easily found at a
-   later date.
+1. (done) queryCityName returns the townIdx (primary key) of the matched town, so
+   that its Latitude, Longitude, Population, etc. are found with townRecord().
+2. (done) Faster fuzzy search: the n-gram candidate index, the typo indexes and 
+   the town priors are built on the first query that needs them, or up front by
+   warmIndexes (see loadDB), and the query cache memoizes repeated entries.
 
 
 """
 
-import json, glob, difflib, os
+import json, glob, difflib, os, sys, hashlib, argparse, shutil
 import requests
-from bs4 import BeautifulSoup
-import re
+from html.parser import HTMLParser
+import re, unicodedata
 import pandas as pd
 from fuzzywuzzy import process
+try:   #optional, fast scoring engine (see scoreEngines)
+    from rapidfuzz import process as rfProcess, fuzz as rfFuzz, utils as rfUtils
+except ImportError:
+    rfProcess = None
+try:   #optional, vectorized edit distance of the typo indexes (see typoCandidates)
+    from rapidfuzz.distance import OSA as rfOSA
+except ImportError:
+    rfOSA = None
+try:   #optional, Parquet input/output of enrichFile
+    import pyarrow as pa, pyarrow.parquet as pq
+except ImportError:
+    pq = None
+try:   #optional, Excel input/output of enrichFile
+    import openpyxl
+except ImportError:
+    openpyxl = None
 #import requests
 import zipfile
 import numpy as np
+import multiprocessing as mp
+import threading, time, asyncio, signal
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from urllib.parse import urlparse, parse_qs
+from collections import OrderedDict, namedtuple, deque
+from collections.abc import Sequence, MutableMapping
 
 DelimAliases = re.compile(r";|,| - ")
-coding='lxml'  #coding='html5lib'\
+#normalized name keys (see normalizeName) precomputed for the name columns of the towns tables,
+#and for the country-level tables (see addTableKeys):
+nameKeyColumns = {'TownName':'TownKey', 'Aliases':'AliasKey'}
+tableKeyColumns = {'COUNTRIES':['country', 'capital'], 'COUNTRY_ALIAS':['countryAlias'], 'PROVINCES':['province']}
+#letters which NFKD does not decompose into a base letter + accent, and '&' (-> 'and'):
+nameTransliteration = str.maketrans({'ß':'ss', 'æ':'ae', 'Æ':'ae', 'ø':'o', 'Ø':'o', 'œ':'oe', 'Œ':'oe', 'ł':'l', 'Ł':'l',
+                                     'đ':'d', 'Đ':'d', 'ð':'d', 'Ð':'d', 'þ':'th', 'Þ':'th', 'ı':'i', '&':' and '})
+ngramSize = 3        #length of the character n-grams used by the candidate index
+ngramCandidateLimit = 300   #number of candidate towns (all countries) kept per query
+townTypoDistance = 1        #edit distance of the typo index of the towns (see buildTypoIndex)
+countryTypoDistance = 2     #edit distance of the typo index of the country names & aliases
+typoPrefixLength = 7        #the town typo index only indexes the first characters of a name
+typoCandidateLimit = 500    #Soundex codes shared by more names than this give no candidates
+soundexDigits = {c:d for letters, d in [('bfpv','1'), ('cgjkqsxz','2'), ('dt','3'), ('l','4'), ('mn','5'), ('r','6')] for c in letters}
+budgetChunkSize = 2000     #names scored between two budget checks (queries with a budget)
+enrichColumns = ['Population', 'Latitude', 'Longitude', 'Province', 'TownClass']  #town columns joined by enrichFile
+serviceItemFields = ['country', 'city', 'countryID', 'address']  #fields of a matching service request (see matchItem)
+httpReasons = {200:'OK', 400:'Bad Request', 404:'Not Found', 405:'Method Not Allowed', 500:'Internal Server Error'}
+addressCitySpans = 3       #number of address fragments tried as the city by parseAddress
+#generic words in front of a province name in an address ("Co. Cork", "State of ..."), after normalizeName:
+addressProvincePrefix = re.compile(r"^(co|county|province|prov|state|state of|region|department|dept|prefecture|district) ")
+populationWeight = 1e-2     #largest score bonus of the population/TownClass prior (at gammaParameter=1)
+#prior of a town by its TownClass (GeoNames feature class), unlisted classes get 0.0:
+townClassPriors = {'capital of a political entity':1.0,
+                   'seat of a first-order administrative division':0.6,
+                   'seat of a second-order administrative division':0.4,
+                   'seat of a third-order administrative division':0.3,
+                   'seat of a fourth-order administrative division':0.2,
+                   'populated place':0.1}
 
 #Preamble / definitions:
 dataBaseParentPath = './DataBaseLocal/CountryInfo/'
@@ -109,11 +347,15 @@ dataBaseParentPath = './DataBaseLocal/CountryInfo/'
 ArchiveUrl = 'https://drive.google.com/open?id=1nd2yS9HTeGqdcMUvz35WQ1p9QF13tWVj'
 ArchiveID = '1nd2yS9HTeGqdcMUvz35WQ1p9QF13tWVj'
 
-def loadDB(PATH =dataBaseParentPath):
+def loadDB(PATH =dataBaseParentPath, ngramIndex=True, cacheSize=0, cachePATH=None, mmap=False, lazy=False, preload=None, spatialIndex=True,
+           columnar=False, typoIndex=True):
     #==============================================================================
     #       LOAD THE REQUIRED DATABASES  (output of setup_TownsDB.py required)
     #==============================================================================
-    TownDB={} #initialize our Town DB
+    if mmap: #memory-map the compiled (binary) dataset instead of parsing the JSON files
+        TownDB = loadBinaryDB('{}{}'.format(PATH,compiledDirName))
+        return finaliseDB(TownDB, ngramIndex, cacheSize, cachePATH, spatialIndex, typoIndex)
+    TownDB={'DATASET':{'PATH':PATH, 'hash':None}} #initialize our Town DB (hashed when a query cache is saved/loaded, see datasetHash)
     # load Country DB
     with open('{}CountriesDB.json'.format(PATH),'r') as JSONfile:
         TownDB['COUNTRIES'] = json.loads(JSONfile.read())
@@ -124,31 +366,204 @@ def loadDB(PATH =dataBaseParentPath):
     with open('{}ProvinceDB.json'.format(PATH),'r') as JSONfile:
         TownDB['PROVINCES'] = json.loads(JSONfile.read())
     #Create a country-specific DICT of town listings:
-    TownDB['TOWNS']={} #make this a dict for simplicity
+    countryFiles = {}
     dbNames = glob.glob("{}*.{}".format(PATH,'json'))
     for DBs in dbNames:
         DBs = DBs.replace('\\','/') #convert Microsoft GLOB PATH back to UNIX
         fileName = DBs.split('/')[-1].split('.')[0]
         if len(fileName) == 2:  #if true, then it is a country-specific DB of towns
-            with open(DBs,'r') as JSONfile:
-                TownDB['TOWNS'][fileName] = json.loads(JSONfile.read())
-    return TownDB #return the DataSet to the user
+            countryFiles[fileName] = DBs
+    if lazy: #country tables are only read the first time they are accessed
+        TownDB['TOWNS'] = LazyTowns(countryFiles, columnar)
+        if preload != None:
+            preloadCountries(TownDB, preload)
+    else:
+        TownDB['TOWNS']={} #make this a dict for simplicity
+        for fileName in countryFiles:
+            TownDB['TOWNS'][fileName] = loadCountryTable(countryFiles[fileName], columnar)
+    return finaliseDB(TownDB, ngramIndex, cacheSize, cachePATH, spatialIndex, typoIndex) #return the DataSet to the user
     #==============================================================================       
+
+
+
+def finaliseDB(TownDB, ngramIndex=True, cacheSize=0, cachePATH=None, spatialIndex=True, typoIndex=True):
+    #Builds the in-memory indexes and attachments of a freshly loaded dataset (see loadDB).
+    TownDB['OPTIONS'] = {'ngramIndex':ngramIndex, 'spatialIndex':spatialIndex, 'typoIndex':typoIndex}
+    #The n-gram candidate index (used when no countryID is given), the typo indexes, the 
+    #town priors and the spatial index (used by reverseGeocode) are built on the first query
+    #that needs them (see getNgramIndex, getTypoIndex, getTownPriors, getSpatialIndex), so
+    #that loading stays fast; warmIndexes builds them up front. The name keys of a country,
+    #decoded once from memory-mapped columns, are kept next to its priors (see getTownKeys).
+    TownDB['PRIORS'] = {}
+    TownDB['KEYS'] = {}
+    #Normalized keys of the country names, aliases, capitals & provinces (the scorers compare
+    #normalized queries with them), and the exact-match dictionary of these and the codes:
+    addTableKeys(TownDB)
+    TownDB['COUNTRY_KEYS'] = buildCountryKeys(TownDB)
+    #Attach a query cache (optionally warm-started from disk):
+    if cacheSize > 0:
+        enableQueryCache(TownDB, cacheSize, cachePATH)
+    return TownDB
+
+
+
+def warmIndexes(townsDB):
+    #Builds the query indexes now instead of on the first query which needs them (see finaliseDB):
+    #the n-gram & typo indexes and the town priors. With lazy loading, this loads every country.
+    getNamePriors(townsDB)
+    getTypoIndex(townsDB, 'COUNTRIES')
+    getTypoIndex(townsDB, 'TOWNS')
+    return townsDB
+
+
+
+def loadCountryTable(fileName, columnar=False):
+    #Reads the towns table of one country (<CC>.json), optionally converted into typed columns
+    with open(fileName,'r') as JSONfile:
+        Towns = addNameKeys(json.loads(JSONfile.read()))  #(datasets compiled before the key columns)
+    if columnar:
+        return columnarTable(Towns)
+    return Towns
+
+
+
+def columnarTable(Towns):
+    '''columnarTable converts a country's towns table (DICT of parallel lists) into
+    the compact in-memory column store used by loadDB(columnar=True): typed NumPy
+    arrays for the numeric columns (NumericColumn), integer codes into a list of
+    categories for the repetitive string columns (CategoryColumn), and interned
+    strings for TownName & Aliases (kept as lists, as the scorers read them as
+    strings). Items still read back like the JSON lists, e.g. Population[idx] is
+    an int or None.'''
+    table = {}
+    numericColumns = dict(townNumericColumns, **aliasNumericColumns)
+    for name, values in Towns.items():
+        if name in numericColumns:
+            dtype = columnarDtypes.get(name, numericColumns[name])
+            if np.issubdtype(dtype, np.floating): #None converts to nan
+                table[name] = NumericColumn(np.array(values, dtype=dtype))
+            else:
+                table[name] = NumericColumn(np.array([-1 if v == None else v for v in values], dtype=dtype))
+        elif name in townCategoryColumns:
+            codes, categories = pd.factorize(pd.Series(values, dtype=object))
+            table[name] = CategoryColumn(codes.astype(np.int16 if len(categories) < 2**15 else np.int32), [str(c) for c in categories])
+        else:
+            table[name] = [sys.intern(v) if type(v) is str else v for v in values]
+    return table
+
+
+
+class TownRecord:
+    '''Lightweight, read-only view of one town: row townIdx of a country's towns
+    table. Columns read as attributes or items (record.Population, 
+    record['TownName']), and asDict() copies the row, including the town's
+    Aliases (and their AliasKeys). See townRecord().'''
+    __slots__ = ('table', 'townIdx')
+    def __init__(self, table, townIdx):
+        self.table = table
+        self.townIdx = townIdx
+    def __getitem__(self, name):
+        if name in aliasStringColumns: #(the alias columns are parallel to AliasIndex, not to the towns)
+            aliasIndex = self.table['AliasIndex']
+            if isinstance(aliasIndex, NumericColumn):
+                return [self.table[name][int(i)] for i in np.flatnonzero(aliasIndex.values == self.townIdx)]
+            return [alias for alias, i in zip(self.table[name], aliasIndex) if i == self.townIdx]
+        return self.table[name][self.townIdx]
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+    def asDict(self):
+        return {name:self[name] for name in self.table if name != 'AliasIndex'}
+    def __repr__(self):
+        return 'TownRecord({})'.format(self.asDict())
+
+
+
+def townRecord(townsDB, countryID, townIdx):
+    #Returns a TownRecord view of town townIdx of country countryID (e.g. from a query result).
+    return TownRecord(townsDB['TOWNS'][countryID], townIdx)
+
+
+
+class LazyTowns(MutableMapping):
+    '''DICT-like mapping of countryID -> towns table (townsDB['TOWNS'] when loadDB
+    is called with lazy=True). The keys are known up front, but a country's table
+    is only read from its <CC>.json file the first time it is accessed. Tables
+    can be released again with unloadCountry, and are re-read on the next access.'''
+    def __init__(self, countryFiles, columnar=False):
+        self.countryFiles = dict(countryFiles)
+        self.columnar = columnar
+        self.tables = {}
+    def __getitem__(self, countryID):
+        if countryID not in self.tables:
+            self.tables[countryID] = loadCountryTable(self.countryFiles[countryID], self.columnar)
+        return self.tables[countryID]
+    def __setitem__(self, countryID, table):
+        self.countryFiles.setdefault(countryID, None)
+        self.tables[countryID] = table
+    def __delitem__(self, countryID):
+        del self.countryFiles[countryID]
+        self.tables.pop(countryID, None)
+    def __iter__(self):
+        return iter(self.countryFiles)
+    def __len__(self):
+        return len(self.countryFiles)
+    def __contains__(self, countryID):
+        return countryID in self.countryFiles
+    def loaded(self):
+        #countryIDs whose tables are currently in memory
+        return list(self.tables)
+    def unload(self, countryID):
+        #release a country's table; it is re-read on the next access (tables without a file are kept)
+        if self.countryFiles.get(countryID) != None:
+            self.tables.pop(countryID, None)
+
+
+
+def preloadCountries(townsDB, countryIDs):
+    #Loads the towns tables of the listed countries up front (lazy datasets only).
+    for countryID in countryIDs:
+        townsDB['TOWNS'][countryID]
+
+
+
+def unloadCountry(townsDB, countryID=None):
+    #Evicts a country's towns table (or all of them, if countryID is None) from a lazy dataset.
+    if not isinstance(townsDB['TOWNS'], LazyTowns):
+        print('unloadCountry: dataset was not loaded with lazy=True, nothing to unload')
+        return
+    for coCode in ([countryID] if countryID != None else townsDB['TOWNS'].loaded()):
+        townsDB['TOWNS'].unload(coCode)
   
 
 
-def recompileDB(PATH=dataBaseParentPath, Scrape=False, repoID = ArchiveID):
+def recompileDB(PATH=dataBaseParentPath, Scrape=False, repoID = ArchiveID, binary=False, workers=8, session=None, resume=True, countries=None, maxAge=None):
     mdir(PATH)
     if Scrape == True:
+        if session == None:
+            session = getScrapeSession()
+        #The scrape manifest records each finished country (timestamp, content hash, provinces),
+        #so an interrupted scrape resumes where it stopped and fresh countries are skipped:
+        if resume:
+            manifest = loadScrapeManifest(PATH)
+        else:
+            manifest = {'countries':{}, 'files':{}}
         #==============================================================================       
         # ::1::  let's scrape a table containing info on all countries:
-        COUNTRIES = getCountries(Verbose=False)
-        with open('{}CountriesDB.json'.format(PATH),'w') as file:
-            json.dump(COUNTRIES,file)
+        if isFreshEntry(manifest['files'].get('CountriesDB.json'), maxAge) and os.path.isfile('{}CountriesDB.json'.format(PATH)):
+            with open('{}CountriesDB.json'.format(PATH),'r') as JSONfile:
+                COUNTRIES = json.loads(JSONfile.read())
+        else:
+            COUNTRIES = getCountries('{}countries/'.format(session.geonamesURL), Verbose=False, session=session)
+            manifest['files']['CountriesDB.json'] = {'timestamp':time.time(), 'sha1':writeJSON(COUNTRIES, '{}CountriesDB.json'.format(PATH))}
+            saveScrapeManifest(manifest, PATH)
         #==============================================================================       
         # ::2:: let's scrape tables of towns per country
         uniqueCountries=COUNTRIES['country']
         #CorrectCountries=pd.Series([]) #initiate a pandas series to store the correct country Names (according to our 'correct' country listing)
+        CountryCodes = []
         for cunts in uniqueCountries:
             if cunts==cunts: #false if cunts is a nan
                 fuz=process.extractOne(cunts,COUNTRIES['country'])
@@ -163,99 +578,76 @@ def recompileDB(PATH=dataBaseParentPath, Scrape=False, repoID = ArchiveID):
                 print('i = {}, country 2-char code is {}'.format(iC,COUNTRIES['id2c'][iC]))
                 #Great so we can assign a corresponding 2-char country ID to each of these
                 #unique countries:
-                CountryCode = COUNTRIES['id2c'][iC]
-                #scrape town name information!
-                Towns=CountryInfo(CountryCode)
-                #Compile Alias list:
-                Aliases=AliasList(Towns['AliasTownName'])
-                #merge results with Town dict:
-                Towns['Aliases'] = Aliases['Aliases']
-                Towns['AliasIndex'] = Aliases['Index']
-                del Towns['AliasTownName']
-                print('writing JSON file {}...'.format(CountryCode+'.json'))
-                with open('{}{}.json'.format(PATH,CountryCode),'w') as jsonFile:
-                    json.dump(Towns,jsonFile)
-                print('writing complete \n\n')  
+                CountryCodes.append(COUNTRIES['id2c'][iC])
+        #Only scrape the selected countries, or else the ones which are missing or stale:
+        if countries != None:
+            CountryCodes = [CountryCode for CountryCode in CountryCodes if CountryCode in countries]
+        else:
+            CountryCodes = [CountryCode for CountryCode in CountryCodes if not isFreshEntry(manifest['countries'].get(CountryCode), maxAge)
+                            or not os.path.isfile('{}{}.json'.format(PATH,CountryCode))]
+        print('{} countries to scrape'.format(len(CountryCodes)))
+        #scrape town name information of the countries concurrently (the shared session
+        #enforces the per-host concurrency & rate limits):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            jobs = {executor.submit(scrapeCountryTowns, CountryCode, PATH, session):CountryCode for CountryCode in CountryCodes}
+            for job in as_completed(jobs):
+                entry = job.result() #re-raise scraping errors
+                previous = manifest['countries'].get(jobs[job], {})
+                manifest['countries'][jobs[job]] = entry
+                saveScrapeManifest(manifest, PATH) #checkpoint after every country
+                print('writing complete ({}.json, {})'.format(jobs[job], 'unchanged' if previous.get('sha1') == entry['sha1'] else 'updated'))
         #==============================================================================           
         # ::3:: compile a table of provences, and a primary key as 
-        #as the country name (standard to our countryListDB), using 2-char country ID to save memory        
-        province = []
-        countryID = []
-        i=0
+        #as the country name (standard to our countryListDB), using 2-char country ID to save memory.
+        #The unique provinces of each country are kept in the manifest, so only country files
+        #which the manifest doesn't know yet (e.g. unpacked from the archive) are read here,
+        #by a pool of worker processes.
         dbNames = glob.glob("{}*.{}".format(PATH,'json')) #search for json files in the countryDB DIR
+        unknown = {}
         for js in dbNames:
-            fileName = js.split('/')[-1].split('.')[0]    #fileName of JSON file (parsed)
-            if len(fileName) == 2:  #if fileName is 2-char in length, then it is a Country DB, proceed::
-                i+=1
-                with open(js,'r') as jsonHandle:
-                    CountryDB = json.loads(jsonHandle.read())
-                Provinces = pd.Series(CountryDB['Address2'])
-                UniProv = Provinces.unique()
-                for up in UniProv:
-                    province.append(up)
-                    countryID.append(fileName)
-                print('i ={} {}: {} unique provinces found'.format(i,fileName,len(UniProv)))
+            fileName = js.replace('\\','/').split('/')[-1].split('.')[0]    #fileName of JSON file (parsed)
+            if len(fileName) == 2 and fileName not in manifest['countries']:
+                unknown[fileName] = js
+        if len(unknown) > 0:
+            with compilePool(workers) as executor:
+                jobs = {executor.submit(countryManifestEntry, js, os.path.getmtime(js)):fileName for fileName, js in unknown.items()}
+                for job in as_completed(jobs):
+                    manifest['countries'][jobs[job]] = job.result()
+            saveScrapeManifest(manifest, PATH)
+        provinces = {}
+        for i, fileName in enumerate(sorted(manifest['countries'])):
+            if os.path.isfile('{}{}.json'.format(PATH,fileName)):
+                provinces[fileName] = manifest['countries'][fileName]['provinces']
+                print('i ={} {}: {} unique provinces found'.format(i+1,fileName,len(provinces[fileName])))
         #Save the provincesDB:
-        with open('{}ProvinceDB.json'.format(PATH),'w') as file:
-            json.dump({'province':province, 'countryID':countryID},file) 
+        writeProvinceDB(provinces, PATH)
         #==============================================================================       
         # ::4:: Scrape alternative names from WikiPedia!
-        coding='lxml'  #coding='html5lib'
-        countryAliasList = []
-        countryID =[]
-        #
-        urlList = ["https://en.wikipedia.org/wiki/List_of_country_names_in_various_languages_(A%E2%80%93C)",
-            "https://en.wikipedia.org/wiki/List_of_country_names_in_various_languages_(D%E2%80%93I)",
-            "https://en.wikipedia.org/wiki/List_of_country_names_in_various_languages_(J%E2%80%93P)",
-            "https://en.wikipedia.org/wiki/List_of_country_names_in_various_languages_(Q%E2%80%93Z)"]
-        for url in urlList:
-            website_url = requests.get(url).text
-            soup = BeautifulSoup(website_url,coding)
-            My_table = soup.find('table',{'class':'wikitable'}) 
-            tr_BS=My_table.findAll('tr')
-            #
-            try:
-                tr_BS=My_table.findAll('tr')
-                isTable = True
-            except:
-                isTable = False
-            #
-            #parse the data; exit loop if     
-            if isTable:
-                #Print out the table contents (row, column, 'information')
-                for i in range(len(tr_BS)):
-                    try:
-                        nation=str(tr_BS[i].findAll('a')[0]['title'])
-                        iC = COUNTRIES['country'].index(nation)
-                        coCode = COUNTRIES['id2c'][iC]
-                        goodRow=True
-                    except:
-                        goodRow=False
-                    if goodRow:
-                        if len(tr_BS[i].findAll('td')[1].findAll('b')): #if aliases present
-                            for ii in range(len(tr_BS[i].findAll('td')[1].findAll('b'))):
-                                try:
-                                    countryAliasList.append(str(tr_BS[i].findAll('td')[1].findAll('b')[ii])[3:-4])
-                                    #countryID.append(tr_BS[i].findAll('a')[0]['title']) #name of country:         
-                                    countryID.append(coCode)
-                                except:
-                                    print('Error appending, skipping!')
-        #Save the CountryAliasDB:
-        with open('{}CountryAliasDB_scraped.json'.format(PATH),'w') as file:
-            json.dump({'countryAlias':countryAliasList, 'countryID':countryID},file)       
+        CountryAliases = None
+        if not isFreshEntry(manifest['files'].get('CountryAliasDB_scraped.json'), maxAge) or not os.path.isfile('{}CountryAliasDB_scraped.json'.format(PATH)):
+            CountryAliases = scrapeCountryAliases(COUNTRIES, session, workers)
+            #Save the CountryAliasDB:
+            manifest['files']['CountryAliasDB_scraped.json'] = {'timestamp':time.time(),
+                'sha1':writeJSON(CountryAliases, '{}CountryAliasDB_scraped.json'.format(PATH))}
+            saveScrapeManifest(manifest, PATH)
     else:
         print('Downloading Archive dataset from google Drive...')
         #with urllib.request.urlopen(repoURL) as response:
-        download_file_from_google_drive(repoID,'{}CountryArchive.zip'.format(PATH))   
+        #(downloaded under a temporary name, so an interrupted download never passes for the archive)
+        download_file_from_google_drive(repoID,'{}CountryArchive.zip.part'.format(PATH))
+        os.replace('{}CountryArchive.zip.part'.format(PATH), '{}CountryArchive.zip'.format(PATH))
         print('Unpacking Archive...')
-        with zipfile.ZipFile('{}CountryArchive.zip'.format(PATH),'r') as zip_ref:
-            zip_ref.extractall(PATH)
+        #The countries are compiled in parallel straight from the zip, and their provinces
+        #gathered as each one finishes (see unpackArchive):
+        provinces, CountryAliases = unpackArchive('{}CountryArchive.zip'.format(PATH), PATH, workers)
+        writeProvinceDB(provinces, PATH)
         print('Unpacking Complete')
     #==============================================================================       
     # ::5:: Compute a manual alias listing! (try not to put provinces or states in here!) 
     #I can't find an easy way to automate this from a willing source, so I will just roll up the sleeves and get'er done!
-    with open('{}CountryAliasDB_scraped.json'.format(PATH),'r') as JSONfile:
-        CountryAliases = json.loads(JSONfile.read())
+    if CountryAliases == None: #not scraped/unpacked by this run
+        with open('{}CountryAliasDB_scraped.json'.format(PATH),'r') as JSONfile:
+            CountryAliases = json.loads(JSONfile.read())
     aliasDB = {}
     aliasDB['GB'] = ['Great Britain', 'Britain','British Isles','UK','U. Kingdom','N. Ireland','Northern Ireland','Scotland','Wales','England', 'Brittania']
     aliasDB['US'] = ['USA', 'US', 'Uncle Sam']
@@ -275,8 +667,183 @@ def recompileDB(PATH=dataBaseParentPath, Scrape=False, repoID = ArchiveID):
             CountryAliases['countryAlias'].append(a)
             CountryAliases['countryID'].append(coCode)
     #Save the CountryAliasDB:
-    with open('{}CountryAliasDB.json'.format(PATH),'w') as file:
-        json.dump({'countryAlias':CountryAliases['countryAlias'], 'countryID':CountryAliases['countryID']},file)       
+    writeJSON({'countryAlias':CountryAliases['countryAlias'], 'countryID':CountryAliases['countryID']}, '{}CountryAliasDB.json'.format(PATH))
+    #==============================================================================       
+    # ::6:: Optionally, compile the JSON dataset into the binary (memory-mappable) format
+    if binary:
+        compileBinaryDB(PATH)
+
+
+
+#==============================================================================
+#  Compiled (binary) dataset
+#==============================================================================
+#The compiled dataset is a directory of NumPy .npy arrays (memory-mappable) plus a
+#small Meta.json. The towns tables of all countries are concatenated into columns;
+#Meta.json holds the row range of each country, the category lists of the
+#categorical columns and the (small) COUNTRIES, COUNTRY_ALIAS & PROVINCES tables.
+#   numeric columns:      <Column>.npy (missing values: nan, or -1 for integers)
+#   string columns:       <Column>.blob.npy (utf-8 bytes), <Column>.offsets.npy
+#                         and <Column>.null.npy
+#   categorical columns:  <Column>.codes.npy (-1 = missing) + categories in Meta.json
+compiledDirName = 'Compiled/'
+compiledVersion = 2
+townNumericColumns = {'TownIndex':np.int64, 'Latitude':np.float64, 'Longitude':np.float64, 'Population':np.int64}
+townStringColumns = ['TownName', 'TownKey']
+townCategoryColumns = ['Country', 'Province', 'County', 'Address2', 'TownClass']
+aliasNumericColumns = {'AliasIndex':np.int64}
+aliasStringColumns = ['Aliases', 'AliasKey']
+columnarDtypes = {'TownIndex':np.int32, 'AliasIndex':np.int32}  #narrower types of loadDB(columnar=True)
+
+
+
+class NumericColumn(Sequence):
+    '''Read-only, list-like view of a typed NumPy column. Items are returned as
+    Python numbers, and missing values (nan, or -1 for integer columns) as None,
+    so code written against the JSON lists (e.g. Population[idx] == None) keeps
+    working. The raw array is available as .values'''
+    __slots__ = ('values',)
+    def __init__(self, values):
+        self.values = values
+    def __len__(self):
+        return len(self.values)
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return NumericColumn(self.values[i])
+        value = self.values[i].item()
+        if value != value or (type(value) is int and value == -1):
+            return None
+        return value
+    def __iter__(self):
+        for value in self.values.tolist():
+            yield None if (value != value or (type(value) is int and value == -1)) else value
+
+
+
+class StringColumn(Sequence):
+    '''Read-only, list-like view of a column of strings stored as one utf-8 byte
+    blob plus an offsets array (n+1 entries). Missing strings read back as None.'''
+    __slots__ = ('blob', 'offsets', 'null')
+    def __init__(self, blob, offsets, null):
+        self.blob = blob
+        self.offsets = offsets
+        self.null = null
+    def __len__(self):
+        return len(self.null)
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return [self[ii] for ii in range(start, stop, step)]
+            stop = max(start, stop)
+            return StringColumn(self.blob, self.offsets[start:stop+1], self.null[start:stop])
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('StringColumn index out of range')
+        if self.null[i]:
+            return None
+        return bytes(self.blob[self.offsets[i]:self.offsets[i+1]]).decode('utf-8')
+    def __iter__(self):
+        offsets = self.offsets.tolist()
+        data = bytes(self.blob[offsets[0]:offsets[-1]])
+        for i, isNull in enumerate(self.null.tolist()):
+            yield None if isNull else data[offsets[i]-offsets[0]:offsets[i+1]-offsets[0]].decode('utf-8')
+
+
+
+class CategoryColumn(Sequence):
+    '''Read-only, list-like view of a categorical column: integer codes into a
+    list of categories (code -1 = missing, read back as None).'''
+    __slots__ = ('codes', 'categories')
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+    def __len__(self):
+        return len(self.codes)
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return CategoryColumn(self.codes[i], self.categories)
+        code = int(self.codes[i])
+        return None if code < 0 else self.categories[code]
+    def __iter__(self):
+        for code in self.codes.tolist():
+            yield None if code < 0 else self.categories[code]
+
+
+
+def compileBinaryDB(PATH=dataBaseParentPath, OUT=None):
+    '''compileBinaryDB reads the JSON dataset in PATH and writes the compiled
+    (memory-mappable) dataset into OUT (default: PATH/Compiled/), which
+    loadDB(PATH, mmap=True) loads in milliseconds.'''
+    if OUT == None:
+        OUT = '{}{}'.format(PATH,compiledDirName)
+    mdir(OUT)
+    townsDB = loadDB(PATH, ngramIndex=False, typoIndex=False)
+    countries = list(townsDB['TOWNS'].keys())
+    meta = {'version':compiledVersion, 'countries':countries, 'townOffsets':[], 'aliasOffsets':[], 'categories':{},
+            'COUNTRIES':townsDB['COUNTRIES'], 'COUNTRY_ALIAS':townsDB['COUNTRY_ALIAS'], 'PROVINCES':townsDB['PROVINCES'],
+            'datasetHash':datasetHash(PATH)}
+    nTowns = 0
+    nAliases = 0
+    for coCode in countries:
+        meta['townOffsets'].append([nTowns, nTowns+len(townsDB['TOWNS'][coCode]['TownName'])])
+        meta['aliasOffsets'].append([nAliases, nAliases+len(townsDB['TOWNS'][coCode]['Aliases'])])
+        nTowns = meta['townOffsets'][-1][1]
+        nAliases = meta['aliasOffsets'][-1][1]
+    def column(name):  #concatenate a column over all countries
+        values = []
+        for coCode in countries:
+            values.extend(townsDB['TOWNS'][coCode].get(name, [None]*len(townsDB['TOWNS'][coCode]['TownName'])))
+        return values
+    for name, dtype in list(townNumericColumns.items()) + list(aliasNumericColumns.items()):
+        missing = np.nan if dtype == np.float64 else -1
+        values = np.array([missing if v == None else v for v in column(name)], dtype=dtype)
+        np.save('{}{}.npy'.format(OUT,name), values)
+    for name in townStringColumns + aliasStringColumns:
+        values = column(name)
+        encoded = [b'' if v == None else str(v).encode('utf-8') for v in values]
+        offsets = np.zeros(len(encoded)+1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+        np.save('{}{}.blob.npy'.format(OUT,name), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+        np.save('{}{}.offsets.npy'.format(OUT,name), offsets)
+        np.save('{}{}.null.npy'.format(OUT,name), np.array([v == None for v in values], dtype=bool))
+    for name in townCategoryColumns:
+        codes, categories = pd.factorize(pd.Series(column(name), dtype=object))
+        np.save('{}{}.codes.npy'.format(OUT,name), codes.astype(np.int32))
+        meta['categories'][name] = [str(c) for c in categories]
+    with open('{}Meta.json'.format(OUT),'w') as file:
+        json.dump(meta,file)
+
+
+
+def loadBinaryDB(PATH):
+    '''loadBinaryDB memory-maps the compiled dataset in PATH (see compileBinaryDB)
+    and returns it with the same layout as loadDB: townsDB['TOWNS'][countryID] is a
+    DICT of list-like column views (NumericColumn, StringColumn, CategoryColumn)
+    which are slices of the shared memory-mapped arrays.'''
+    with open('{}Meta.json'.format(PATH),'r') as JSONfile:
+        meta = json.loads(JSONfile.read())
+    if meta['version'] != compiledVersion:
+        raise ValueError('compiled dataset version {} is not supported, run compileBinaryDB'.format(meta['version']))
+    def npy(name):
+        return np.load('{}{}.npy'.format(PATH,name), mmap_mode='r')
+    columns = {}
+    for name in list(townNumericColumns) + list(aliasNumericColumns):
+        columns[name] = NumericColumn(npy(name))
+    for name in townStringColumns + aliasStringColumns:
+        columns[name] = StringColumn(npy(name+'.blob'), npy(name+'.offsets'), npy(name+'.null'))
+    for name in townCategoryColumns:
+        columns[name] = CategoryColumn(npy(name+'.codes'), meta['categories'][name])
+    TownDB = {'COUNTRIES':meta['COUNTRIES'], 'COUNTRY_ALIAS':meta['COUNTRY_ALIAS'], 'PROVINCES':meta['PROVINCES'], 'TOWNS':{},
+              'DATASET':{'PATH':None, 'hash':meta.get('datasetHash')}}
+    for coCode, (t0, t1), (a0, a1) in zip(meta['countries'], meta['townOffsets'], meta['aliasOffsets']):
+        TownDB['TOWNS'][coCode] = {}
+        for name in list(townNumericColumns) + townStringColumns + townCategoryColumns:
+            TownDB['TOWNS'][coCode][name] = columns[name][t0:t1]
+        for name in list(aliasNumericColumns) + aliasStringColumns:
+            TownDB['TOWNS'][coCode][name] = columns[name][a0:a1]
+    return TownDB
 
 
 def capFix(strs):
@@ -299,65 +866,182 @@ def capFix(strs):
             
 
 
-def queryCityName(CityEntry,townsDB, countryID=None, threshold = 0.95,lowestAllowedThreshold = 0.65, Ver=False):
+def normalizeName(strs):
+    '''normalizeName maps a name onto its normalized key, used for exact matches
+    and by the scorers: accents stripped (NFKD), letters without a decomposition
+    transliterated (ß -> ss, ø -> o, ...), '&' spelled 'and', casefolded (so 
+    'and'/'of' compare alike however capFix cased them), full stops removed 
+    (U.S.A. -> usa) and other runs of punctuation/white-space collapsed into a
+    single space, e.g. ' Côte d'Ivoire ' -> 'cote d ivoire'. Non-strings map
+    onto ''.'''
+    if type(strs) is not str:
+        return ''
+    if not strs.isascii():
+        strs = ''.join(c for c in unicodedata.normalize('NFKD', strs) if not unicodedata.combining(c)).translate(nameTransliteration)
+    elif '&' in strs:
+        strs = strs.replace('&', ' and ')
+    return ' '.join(re.split(r'[\W_]+', strs.casefold().replace('.', ''))).strip()
+
+
+
+def normalizeNames(Names):
+    '''normalizeNames is the batch version of normalizeName, for whole columns
+    (pandas Series, list, array or column view). Each distinct name is
+    normalized only once. Returns a list of keys, in input order.'''
+    codes, uniques = pd.factorize(pd.Series(list(Names), dtype=object))  #None/nan get code -1
+    keys = np.array([normalizeName(name) for name in uniques] + [''], dtype=object)
+    return keys[codes].tolist()
+
+
+
+def addNameKeys(Towns):
+    #Adds the normalized key columns (see nameKeyColumns) to a country's towns table, unless it has them.
+    for field, keyField in nameKeyColumns.items():
+        if keyField not in Towns and field in Towns:
+            Towns[keyField] = normalizeNames(Towns[field])
+    return Towns
+
+
+
+def addTableKeys(TownDB):
+    #Adds the normalized key columns '<field>Key' to the country-level tables (see tableKeyColumns).
+    for table, fields in tableKeyColumns.items():
+        for field in fields:
+            if field+'Key' not in TownDB[table]:
+                TownDB[table][field+'Key'] = normalizeNames(TownDB[table][field])
+
+
+
+def buildCountryKeys(townsDB):
+    '''buildCountryKeys builds the exact-match DICT of queryCountryName: the 
+    normalized (see normalizeName) country names, ISO id2c/id3c codes and 
+    country aliases, then the capitals and provinces, each mapped onto their 
+    2-char country ID. Earlier sources take precedence, as in the fuzzy cascade,
+    and capitals/provinces whose name is shared by several countries are left
+    to the fuzzy search.'''
+    keys = {}
+    COUNTRIES = townsDB['COUNTRIES']
+    for field in ['country', 'id2c', 'id3c']:
+        for name, countryID in zip(COUNTRIES[field], COUNTRIES['id2c']):
+            keys.setdefault(normalizeName(name), countryID)
+    for name, countryID in zip(townsDB['COUNTRY_ALIAS']['countryAlias'], townsDB['COUNTRY_ALIAS']['countryID']):
+        keys.setdefault(normalizeName(name), countryID)
+    for names, countryIDs in [(COUNTRIES['capital'], COUNTRIES['id2c']),
+                              (townsDB['PROVINCES']['province'], townsDB['PROVINCES']['countryID'])]:
+        found = {}
+        for name, countryID in zip(names, countryIDs):
+            found.setdefault(normalizeName(name), set()).add(countryID)
+        for key, countryID in found.items():
+            if len(countryID) == 1:
+                keys.setdefault(key, countryID.pop())
+    keys.pop('', None)
+    return keys
+
+
+
+def queryCityName(CityEntry,townsDB, countryID=None, threshold = 0.95,lowestAllowedThreshold = 0.65, Ver=False, scorer=None, gammaParameter=1.0,
+                  budget=None, workBudget=None, countryHint=None):
+    #budget (seconds) and/or workBudget (number of candidate names scored) bound the search; when
+    #either is given, [result, budgetHit] is returned, budgetHit=True if the search was cut short
+    #and result is the best match found so far. countryHint (countryID or list of them) is
+    #searched first when no countryID is given.
+    queryBudget = QueryBudget(budget, workBudget) if (budget != None or workBudget != None) else None
+    metrics = townsDB.get('METRICS')
+    trace = None
+    if metrics is not None: #per-stage timers (see enableMetrics)
+        trace = [('start', 0, time.perf_counter())]
     if (CityEntry != CityEntry) or (CityEntry == None) or (CityEntry == 'nan') or (CityEntry == np.nan):
-        return [None, 0.0, None, None] #if the Entry is a Nan or empty, return negative
+        if metrics is not None: recordQueryMetrics(metrics, 'city', trace, 'empty')
+        return budgetResult([None, 0.0, None, None], queryBudget) #if the Entry is a Nan or empty, return negative
     try :
         CityEntry = capFix(CityEntry)
     except:
         pass
+    traceStage(trace, 'capFix')
+    cacheKey = cacheEntryKey(('city', CityEntry, countryID, threshold, lowestAllowedThreshold, scorerName(scorer), gammaParameter,
+                              countryHint))
+    if not Ver: #verbose queries always run, so that the candidates get printed
+        result = cacheLookup(townsDB, cacheKey)
+        if result is not None:
+            if metrics is not None: recordQueryMetrics(metrics, 'city', trace, 'cache')
+            return budgetResult(result, queryBudget)
+    result = searchCityName(CityEntry, townsDB, countryID, threshold, lowestAllowedThreshold, Ver, scorer, gammaParameter,
+                            queryBudget, countryHint, trace)
+    if result[3] != None: #prior match frequency of the countries (see countryPriority)
+        matchCounts = townsDB.setdefault('MATCH_COUNTS', {})
+        matchCounts[result[3]] = matchCounts.get(result[3], 0) + 1
+    if queryBudget is None or not queryBudget.hit: #results cut short by the budget are not cached
+        cacheStore(townsDB, cacheKey, result)
+    if metrics is not None: recordQueryMetrics(metrics, 'city', trace, queryOutcome(result, threshold, trace), queryBudget)
+    return budgetResult(result, queryBudget)
+
+
+
+def searchCityName(CityEntry, townsDB, countryID=None, threshold = 0.95, lowestAllowedThreshold = 0.65, Ver=False, scorer=None, gammaParameter=1.0,
+                   budget=None, countryHint=None, trace=None):
+    #The matching cascade of queryCityName (CityEntry already capFix'ed), without the query cache.
+    #trace (list) collects the stages run, for the metrics (see traceStage).
+    #Candidates with (near) equal scores are ranked by the population/TownClass prior of their town.
+    #Without a countryID, all countries are searched in a single pass over the global name table;
+    #with one, each pass only keeps candidates which can beat the best result so far (scoreCutoff).
+    #A QueryBudget stops the search once spent (the best result so far is returned).
     Possibilities=[]  #empty list to store results that don't meet the threshold liklihood for returning a match
+    if type(countryID) == str and countryID not in townsDB['TOWNS']: #e.g. 'XX' from dirty input: no towns, no match
+        return [None, 0.0, None, None]
+    #Typo stage: names within a small edit distance of the entry, or sounding alike (see typoCityMatch):
+    if countryID == None or (type(countryID) == str and len(countryID) == 2):
+        result, nCandidates = typoCityMatch(CityEntry, townsDB, countryID, threshold, lowestAllowedThreshold, gammaParameter, scorer, Ver,
+                                             budget)
+        traceStage(trace, 'typo', nCandidates)
+        if result != None:
+            return result
     #------------------------------------
     if countryID == None:    #No CountryID (Primary Key) is given, let's scan all countries!
-        for coCode in townsDB['TOWNS']:
-            result = pickBestQuery(CityEntry,townsDB['TOWNS'][coCode]['TownName'],Verbose=Ver)
-            if result[0] != None: #if result is successful:
-                result.append(townsDB['TOWNS'][coCode]['TownName'].index(result[0]))
-            else:
-                result.append(None)
-            result.append(coCode)
-            Possibilities.append(result) #append the results to a list in case we need them later
-            if result[1] >= threshold:
-                return result #If a suitable liklihood is found, return this!
-        #If we get to here, then the town      #Let's check town aliases!
-        for coCode in townsDB['TOWNS']:
-            result = pickBestQuery(CityEntry,townsDB['TOWNS'][coCode]['Aliases'],Verbose=Ver)
-            if result[0] != None: #if result is successful:
-                idxAlias = townsDB['TOWNS'][coCode]['Aliases'].index(result[0])
-                townIdx = townsDB['TOWNS'][coCode]['AliasIndex'][idxAlias]
-                result.append(townIdx)
-                result.append(coCode)
-                result.append(result[0])
-                result[0] = townsDB['TOWNS'][coCode]['TownName'][townIdx] #update it with offically accepted TownName
-            else:
-                result.append(None)
-                result.append(None)
-            Possibilities.append(result)
-            if result[1] >= threshold:
-                return result #again, if likelihood is sufficient, return the match!
-        #If we get to here, then the townName and townAliases don't match, time to check all results and see if any were satisfactory:
-        probScores = [row[1] for row in Possibilities]
-        #maxIdx = max(range(len(Possibilities)), key=Possibilities.__getitem__ )
-        maxIdx = max(range(len(probScores)), key=probScores.__getitem__ )
-        if Possibilities[maxIdx][1] > lowestAllowedThreshold:
-            return Possibilities[maxIdx]
-        else:
-            #No matches satisfy thresholds, return none!
+        #Every TownName and Alias of every country is scored in one pass over the global name table
+        #(see buildNameTable), and the best of all countries is picked at once:
+        nameTable = getNameTable(townsDB)
+        entries = citySearchSpace(CityEntry,townsDB,gammaParameter=gammaParameter,countryHint=countryHint,budget=budget)
+        traceStage(trace, 'searchSpace')
+        names = nameTable['name'] if entries is None else [nameTable['name'][e] for e in entries]
+        keys = nameTable['key'] if entries is None else [nameTable['key'][e] for e in entries]
+        candidates = scoreCandidates(CityEntry,names,scorer,lowestAllowedThreshold,Ver,budget,keys)
+        traceStage(trace, 'names', len(names))
+        if len(candidates) == 0: #no candidate towns at all (or no budget was left)
             return [None, 0.0, None, None]
+        matched = np.array([c[2] for c in candidates], dtype=np.int64)
+        if entries is not None:
+            matched = np.asarray(entries, dtype=np.int64)[matched] #entries of the name table
+        scores = np.array([c[1] for c in candidates], dtype=np.float64)
+        weighed = scores + gammaParameter*populationWeight*getNamePriors(townsDB)[matched]
+        isAlias = np.array([nameTable['field'][e] == 'Aliases' for e in matched])
+        #A TownName passing the threshold wins over an Alias passing it, and either over the
+        #best of all names which only passes lowestAllowedThreshold:
+        for select in [~isAlias & (scores >= threshold), isAlias & (scores >= threshold), scores > lowestAllowedThreshold]:
+            if select.any():
+                best = int(np.argmax(np.where(select, weighed, -np.inf)))
+                return nameTableResult(townsDB, int(matched[best]), float(scores[best]))
+        #No matches satisfy thresholds, return none!
+        return [None, 0.0, None, None]
     #------------------------------------
     ## Here we have a countryID specified
     elif type(countryID) == str and len(countryID) == 2: #check if countryID  is correct
-        result = pickBestQuery(CityEntry,townsDB['TOWNS'][countryID]['TownName'],Verbose=Ver)
-        if result[0] != None: #if result is successful:
-            result.append(townsDB['TOWNS'][countryID]['TownName'].index(result[0]))
+        result = pickBestQuery(CityEntry,townsDB['TOWNS'][countryID]['TownName'],gammaParameter,Verbose=Ver,scorer=scorer,returnIndex=True,
+                               prior=getTownPriors(townsDB, countryID),scoreCutoff=lowestAllowedThreshold,budget=budget,
+                               keys=getTownKeys(townsDB, countryID, 'TownKey'),threshold=threshold)
+        traceStage(trace, 'TownName', len(townsDB['TOWNS'][countryID]['TownName']))
+        townIdx = result.pop() #index of the matched TownName (None if unsuccessful)
+        result.append(townIdx)
         result.append(countryID)
         Possibilities.append(result) #append the results to a list in case we need them later
         if result[1] >= threshold:
             return result #If a suitable liklihood is found, return this!    
         else:
-            result = pickBestQuery(CityEntry,townsDB['TOWNS'][countryID]['Aliases'],Verbose=Ver)
+            result = pickBestQuery(CityEntry,townsDB['TOWNS'][countryID]['Aliases'],gammaParameter,Verbose=Ver,scorer=scorer,returnIndex=True,
+                                   prior=getAliasPriors(townsDB, countryID),scoreCutoff=cutoffScore(Possibilities, lowestAllowedThreshold),budget=budget,
+                                   keys=getTownKeys(townsDB, countryID, 'AliasKey'),threshold=threshold)
+            traceStage(trace, 'Aliases', len(townsDB['TOWNS'][countryID]['Aliases']))
+            idxAlias = result.pop() #index of the matched alias
             if result[0] != None: #if result is successful:
-                idxAlias = townsDB['TOWNS'][countryID]['Aliases'].index(result[0])
                 townIdx = townsDB['TOWNS'][countryID]['AliasIndex'][idxAlias]
                 result.append(townIdx)
                 result.append(countryID)
@@ -388,45 +1072,98 @@ def queryCityName(CityEntry,townsDB, countryID=None, threshold = 0.95,lowestAllo
 
 
 
-def queryCountryName(CountryEntry, townsDB, threshold = 0.95, lowestAllowedThreshold = 0.65, Ver=False):
+def queryCountryName(CountryEntry, townsDB, threshold = 0.95, lowestAllowedThreshold = 0.65, Ver=False, scorer=None, budget=None, workBudget=None):
+    #budget (seconds) and/or workBudget (number of candidate names scored) bound the search; when
+    #either is given, [result, budgetHit] is returned (see queryCityName).
+    queryBudget = QueryBudget(budget, workBudget) if (budget != None or workBudget != None) else None
+    metrics = townsDB.get('METRICS')
+    trace = None
+    if metrics is not None: #per-stage timers (see enableMetrics)
+        trace = [('start', 0, time.perf_counter())]
     if (CountryEntry != CountryEntry) or (CountryEntry == None) or (CountryEntry == 'nan') or (CountryEntry == np.nan):
-        return [None,0.0] #if the Entry is a Nan or empty, return negative
+        if metrics is not None: recordQueryMetrics(metrics, 'country', trace, 'empty')
+        return budgetResult([None,0.0], queryBudget) #if the Entry is a Nan or empty, return negative
     try :
         CountryEntry = capFix(CountryEntry)
     except:
         pass
+    traceStage(trace, 'capFix')
+    #Fast path: exact (normalized) country names, ISO codes, aliases, capitals and provinces
+    countryID = townsDB['COUNTRY_KEYS'].get(normalizeName(CountryEntry)) if 'COUNTRY_KEYS' in townsDB else None
+    traceStage(trace, 'exact')
+    if countryID != None:
+        if Ver: print('{} is an exact match of country {}'.format(CountryEntry, countryID))
+        if metrics is not None: recordQueryMetrics(metrics, 'country', trace, 'exact')
+        return budgetResult([countryID, 1.0], queryBudget)
+    cacheKey = cacheEntryKey(('country', CountryEntry, None, threshold, lowestAllowedThreshold, scorerName(scorer)))
+    if not Ver: #verbose queries always run, so that the candidates get printed
+        result = cacheLookup(townsDB, cacheKey)
+        if result is not None:
+            if metrics is not None: recordQueryMetrics(metrics, 'country', trace, 'cache')
+            return budgetResult(result, queryBudget)
+    result = searchCountryName(CountryEntry, townsDB, threshold, lowestAllowedThreshold, Ver, scorer, queryBudget, trace)
+    if queryBudget is None or not queryBudget.hit: #results cut short by the budget are not cached
+        cacheStore(townsDB, cacheKey, result)
+    if metrics is not None: recordQueryMetrics(metrics, 'country', trace, queryOutcome(result, threshold, trace), queryBudget)
+    return budgetResult(result, queryBudget)
+
+
+
+def searchCountryName(CountryEntry, townsDB, threshold = 0.95, lowestAllowedThreshold = 0.65, Ver=False, scorer=None, budget=None, trace=None):
+    #The matching cascade of queryCountryName (CountryEntry already capFix'ed), without the query cache.
+    #Later passes only keep candidates which can beat the best result so far, and once the
+    #QueryBudget is spent the remaining passes find nothing (the best result so far is returned).
     Possibilities=[]
+    #Typo stage: country names & aliases within a small edit distance of the entry, or sounding
+    #alike (see typoCountryMatch). A match within the edit distance is accepted straight away:
+    result, withinDistance, nCandidates = typoCountryMatch(CountryEntry, townsDB, scorer, Ver, budget)
+    traceStage(trace, 'typo', nCandidates)
+    if result != None:
+        if result[1] >= threshold or (withinDistance and result[1] > lowestAllowedThreshold):
+            return result
+        Possibilities.append(result)
     #Firstly, try the standardised GeoName list of countries:
-    result = pickBestQuery(CountryEntry,townsDB['COUNTRIES']['country'],Verbose=Ver)
+    result = pickBestQuery(CountryEntry,townsDB['COUNTRIES']['country'],Verbose=Ver,scorer=scorer,returnIndex=True,
+                           scoreCutoff=cutoffScore(Possibilities, lowestAllowedThreshold),budget=budget,keys=townsDB['COUNTRIES'].get('countryKey'))
+    traceStage(trace, 'country', len(townsDB['COUNTRIES']['country']))
+    iC = result.pop()
     if result[0] != None: #if result is successful:
-        iC = townsDB['COUNTRIES']['country'].index(result[0])
         result[0] = townsDB['COUNTRIES']['id2c'][iC] #change country to it's 2-char identifier
     if result[1] >= threshold:
         return result
     else:
         Possibilities.append(result) #save it incase we need it later
         #Second, let's try our list of Aliases (multilingual, nicknames, Abbreviations, variations etc.)
-        result = pickBestQuery(CountryEntry,townsDB['COUNTRY_ALIAS']['countryAlias'],Verbose=Ver)
+        result = pickBestQuery(CountryEntry,townsDB['COUNTRY_ALIAS']['countryAlias'],Verbose=Ver,scorer=scorer,returnIndex=True,
+                               scoreCutoff=cutoffScore(Possibilities, lowestAllowedThreshold),budget=budget,
+                               keys=townsDB['COUNTRY_ALIAS'].get('countryAliasKey'))
+        traceStage(trace, 'countryAlias', len(townsDB['COUNTRY_ALIAS']['countryAlias']))
+        iCa = result.pop()
         if result[0] != None: #if result is successful:
-            iCa = townsDB['COUNTRY_ALIAS']['countryAlias'].index(result[0])
             result[0] = townsDB['COUNTRY_ALIAS']['countryID'][iCa] #change country to it's 2-char identifier
         if result[1] >= threshold:
             return result
         else:
             Possibilities.append(result) #save it incase we need it later
             #Third, let's try our list of Capitals
-            result = pickBestQuery(CountryEntry,townsDB['COUNTRIES']['capital'],Verbose=Ver)
+            result = pickBestQuery(CountryEntry,townsDB['COUNTRIES']['capital'],Verbose=Ver,scorer=scorer,returnIndex=True,
+                                   scoreCutoff=cutoffScore(Possibilities, lowestAllowedThreshold),budget=budget,
+                                   keys=townsDB['COUNTRIES'].get('capitalKey'))
+            traceStage(trace, 'capital', len(townsDB['COUNTRIES']['capital']))
+            iCc = result.pop()
             if result[0] != None: #if result is successful:
-                iCc = townsDB['COUNTRIES']['capital'].index(result[0])
                 result[0] = townsDB['COUNTRIES']['id2c'][iCc] #change country to it's 2-char identifier
             if result[1] >= threshold:
                 return result
             else:
                 Possibilities.append(result) #save it incase we need it later
                 #Fourth, let's try our list of Provinces
-                result = pickBestQuery(CountryEntry,townsDB['PROVINCES']['province'],Verbose=Ver)
+                result = pickBestQuery(CountryEntry,townsDB['PROVINCES']['province'],Verbose=Ver,scorer=scorer,returnIndex=True,
+                                       scoreCutoff=cutoffScore(Possibilities, lowestAllowedThreshold),budget=budget,
+                                       keys=townsDB['PROVINCES'].get('provinceKey'))
+                traceStage(trace, 'province', len(townsDB['PROVINCES']['province']))
+                iCp = result.pop()
                 if result[0] != None: #if result is successful:
-                    iCp = townsDB['PROVINCES']['province'].index(result[0])
                     result[0] = townsDB['PROVINCES']['countryID'][iCp] #change country to it's 2-char identifier
                 if result[1] >=threshold:
                     return result
@@ -446,245 +1183,2438 @@ def queryCountryName(CountryEntry, townsDB, threshold = 0.95, lowestAllowedThres
                         return [None,0.0]
 
 
-#==============================================================================
-#  SubFunctions      
-#==============================================================================
-def pickBestQuery(Query, StandardList, gammaParameter = 1.0, Verbose=False):
-    #gammaParameter=1e1 #strength of population weighing, must be =<0, and recommend not going above 10 to minimise power-law error propogation
-    try:
-        candidates=process.extractBests(Query,StandardList,limit=10)    
-    except:
-        return [None, 0.0]
-    score=[]
-    for c in candidates:
-        if Verbose:
-            print('{} with {} probability'.format(c[0],c[1]))
-            print('{} with {} probability (weighed) & diflib'.format(c[0],c[1]*StrMatcher(Query,c[0])))
-        score.append(c[1]*(StrMatcher(Query,c[0])/100))
-    #Find the maximum weighed score and return best matching country:
-    maxIdx = max(range(len(score)), key=score.__getitem__)
-    return [candidates[maxIdx][0], score[maxIdx]]
-                
+def queryCountryNames(CountryEntries, townsDB, threshold = 0.95, lowestAllowedThreshold = 0.65, scorer=None):
+    '''queryCountryNames evaluates queryCountryName over a whole column of
+    entries (pandas Series, list or array). Each distinct entry is matched only
+    once, so repeated values ("Ireland", "UK", ...) cost a single lookup. Returns
+    a pandas DataFrame with columns countryID and countryScore, aligned with the
+    index of the input.'''
+    entries = pd.Series(CountryEntries)
+    codes, uniques = pd.factorize(entries.map(batchKey))  #NaN/None entries get code -1
+    countryID = np.empty(len(uniques)+1, dtype=object)
+    countryScore = np.zeros(len(uniques)+1)
+    countryID[-1] = None  #code -1 points here
+    for i, entry in enumerate(uniques):
+        result = queryCountryName(entry, townsDB, threshold, lowestAllowedThreshold, scorer=scorer)
+        countryID[i] = result[0]
+        countryScore[i] = result[1]
+    return pd.DataFrame({'countryID':countryID[codes], 'countryScore':countryScore[codes]}, index=entries.index)
 
-    
-def StrMatcher(str1, str2):
-    if type(str1) is list and type(str2) is list:
-        isList = True
-        if len(str1) != len(str2):
-            return -1 #input lists are not the same length
-    elif type(str1) is str and type(str2) is str:
-        #this is also fine
-        isList= False
-    else:
-        # argV have different types, so let's grow the string into a list of same length:
-        if type(str2) is str: #make str1 the small one, if it isn't, then perform swap:
-            temp=str2
-            str2=str1
-            str1=temp
-        temp=[]
-        for i in range(len(str2)):
-            temp.append(str1)
-        str1=temp #doing a soft copy here, as hard copy should not be needed
-        isList = True
-        #perform operations:
-    if isList:
-        OUTPUT=[]
-        for ii in range(len(str1)):
-            print('Length of str1 is {}'.format(len(str1)))
-            print('Length of str2 is {}'.format(len(str2)))
-            OUTPUT.append( difflib.SequenceMatcher(None, str1[ii],str2[ii]).ratio() )
+
+
+def queryCityNames(CityEntries, townsDB, CountryIDs=None, threshold = 0.95, lowestAllowedThreshold = 0.65, scorer=None):
+    '''queryCityNames evaluates queryCityName over a whole column of entries
+    (pandas Series, list or array). CountryIDs is an optional column of two-char
+    country IDs aligned with CityEntries (e.g. the countryID column returned by
+    queryCountryNames); missing IDs scan all countries, while IDs without a towns
+    table (e.g. 'XX' from dirty input) get no match. Distinct (city, countryID)
+    pairs are matched only once, and lookups are grouped by countryID so that each
+    country's town table is scanned by consecutive queries. Returns a pandas
+    DataFrame with columns townName, cityScore, townIdx and countryID, aligned
+    with the index of the input.'''
+    entries = pd.Series(CityEntries)
+    if CountryIDs is None:
+        countryIDs = pd.Series([None]*len(entries), index=entries.index, dtype=object)
     else:
-        OUTPUT = difflib.SequenceMatcher(None, str1,str2).ratio()
-    return OUTPUT    
-    
-    
-    
-    
-    
-    
-    
-def CountryInfo(CountryCode, Verbose=False):
-    fullTable = 50 #the expected number of rows for a full table (50 rows per page)
-    numTabCols = 6
-    #Allocate memory for the data lists:
-    TownIndex = []
-    TownAliases = []
-    TownNames = []
-    TownPopulation = []
-    ProvinceAddress = []
-    CountyAddress = []
-    TownClass = []
-    TownLat = []
-    TownLon = []
-    CountryName = []
-    SubAddressName = []
-    #
-    pageNum = 0
-    while True:
-        if Verbose: print('page {}, i={}'.format(pageNum//fullTable+1,pageNum))
-        url='http://www.geonames.org/search.html?q=&country={}&startRow={}'.format(CountryCode,pageNum)
-        website_url = requests.get(url).text
-        soup = BeautifulSoup(website_url,coding)
-        if Verbose: print('Original encoding found: {}'.format(soup.original_encoding))
-        #print(soup.prettify())
-        My_table = soup.find('table',{'class':'restable'})    
-        try:
-            tr_BS=My_table.findAll('tr')
-            isTable = True
-        except:
-            if Verbose: print('Table not found on page {}, skipping...'.format(pageNum//fullTable+1))
-            isTable = False
-        #parse the data; exit loop if     
-        iCaptured = 0 # number of rows captured
-        if isTable:
-            #Print out the table contents (row, column, 'information')
-            for i in range(len(tr_BS)):
-                if (len(tr_BS[i]) == numTabCols): #ensure that there are the right number of Cols
-                    #we will test that the zeroth column is a table row index (int)
-                    try:
-                        rowIdx=int(tr_BS[i].findAll('small')[0].contents[0])/1
-                        if Verbose: print('table row {}:\n'.format(rowIdx))
-                        goodRow = True
-                    except:
-                        if Verbose: print('header table entry, skipping...')
-                        goodRow = False
-                    finally:
-                        if goodRow:
-                            iCaptured+=1
-                            #Index:
-                            try:
-                                TownIndex.append(int(tr_BS[i].findAll('small')[0].contents[0]))
-                            except:
-                                if Verbose: print('Cannot parse Town index,setting to nan')    
-                                TownIndex.append(None)
-                            #City Name Alias:
-                            try:
-                                TownAliases.append(str(tr_BS[i].findAll('small')[1].contents[0]))
-                            except:
-                                if Verbose: print('Cannot parse Town index,setting to nan')    
-                                TownAliases.append(None)
-                            #City/town Name Official:
-                            try:
-                                TownNames.append(str(tr_BS[i].findAll('a')[1].getText()))
-                            except:
-                                if Verbose: print('Cannot parse Town index,setting to nan')    
-                                TownNames.append(None)
-                            #Population
-                            try:
-                                TownPopulation.append(int(tr_BS[i].findAll('small')[3].contents[0].split(' ')[-1].replace(',','')))
-                            except:
-                                if Verbose: print('Cannot parse Town Population,setting to nan')    
-                                TownPopulation.append(None)
-                            #Latitude:
-                            try:
-                                TownLat.append(float(float(tr_BS[i].findAll('span')[1].contents[0])))
-                            except:
-                                if Verbose: print('Cannot parse Town Latitude,setting to nan')    
-                                TownLat.append(None)
-                            #Longitude:
-                            try:
-                                TownLon.append(float(tr_BS[i].findAll('span')[2].contents[0]))
-                            except:
-                                if Verbose: print('Cannot parse Town Longitude, setting to nan')    
-                                TownLon.append(None)
-                            #Country:
-                            try:
-                                CountryName.append(str(tr_BS[i].findAll('a')[3].getText()))
-                            except:
-                                if Verbose: print('Cannot parse Country Name, setting to nan')    
-                                CountryName.append(None)
-                            #Address (Province):
-                            try:
-                                ProvinceAddress.append(str(tr_BS[i].findAll('td')[2].get_text(',').split(',')[2]).strip())   #split index was -3, and was giving wrong results for lots of countries
-                            except:
-                                if Verbose: print('Cannot parse Sub address, setting to nan')    
-                                ProvinceAddress.append(None)
-                            #Address (County):
-                            try:
-                                CountyAddress.append(str(tr_BS[i].findAll('td')[2].get_text(',').split(',')[3]).strip().split('>')[-1])
-                            except:
-                                if Verbose: print('Cannot parse Sub address, setting to nan')    
-                                CountyAddress.append(None)
-                              
-                            #Address 2:
-                            try:
-                                 SubAddressName.append(str(tr_BS[i].findAll('small')[2].contents[0]))
-                            except:
-                                if Verbose: print('Cannot parse Sub address, setting to nan')    
-                                SubAddressName.append(None)
-                            #Class
-                            try:
-                                TownClass.append(str(tr_BS[i].findAll('td')[3].contents[0]))
-                            except:
-                                if Verbose: print('Cannot parse Town index,setting to nan')    
-                                TownClass.append(None)
-                            #End of parsing
-        if iCaptured == fullTable: #Check if there is a full page of results, otherwise consider it final page
-            pageNum+=fullTable
-        else:   #last page, break out of parsing loop!
+        countryIDs = pd.Series(list(CountryIDs), index=entries.index, dtype=object)
+    countryIDs = countryIDs.where(countryIDs.map(lambda c: type(c) == str and len(c) == 2), '')
+    known = set(c for c in countryIDs.unique() if c == '' or c in townsDB['TOWNS'])
+    pairs = pd.DataFrame({'city':entries.map(batchKey), 'countryID':countryIDs})
+    codes, uniques = pd.factorize(pd.MultiIndex.from_frame(pairs.fillna({'city':''})))
+    townName = np.empty(len(uniques)+1, dtype=object)
+    cityScore = np.zeros(len(uniques)+1)
+    townIdx = np.empty(len(uniques)+1, dtype=object)
+    cityCountryID = np.empty(len(uniques)+1, dtype=object)
+    #group the distinct pairs by countryID ('' = unknown country):
+    uniquePairs = pd.DataFrame(list(uniques), columns=['city','countryID'])
+    for coCode, group in uniquePairs.groupby('countryID', sort=True):
+        for i, city in zip(group.index, group['city']):
+            if city == '' or coCode not in known:
+                result = [None, 0.0, None, None]
+            else:
+                result = queryCityName(city, townsDB, coCode if coCode != '' else None, threshold, lowestAllowedThreshold, scorer=scorer)
+            townName[i], cityScore[i], townIdx[i], cityCountryID[i] = result[:4]
+    return pd.DataFrame({'townName':townName[codes], 'cityScore':cityScore[codes],
+                         'townIdx':pd.array(townIdx[codes], dtype='Int64'), 'countryID':cityCountryID[codes]}, index=entries.index)
+
+
+
+def queryLocationNames(CountryEntries, CityEntries, townsDB, threshold = 0.95, lowestAllowedThreshold = 0.65, scorer=None):
+    '''queryLocationNames matches aligned columns of country and city entries:
+    countries first (queryCountryNames), then cities within the resolved countries
+    (queryCityNames). If a country can't be resolved but its city can, the
+    city's countryID is used. Returns a pandas DataFrame with columns countryID,
+    countryScore, townName, cityScore and townIdx, aligned with the input.'''
+    countries = queryCountryNames(CountryEntries, townsDB, threshold, lowestAllowedThreshold, scorer)
+    cities = queryCityNames(pd.Series(list(CityEntries), index=countries.index), townsDB, countries['countryID'], threshold, lowestAllowedThreshold, scorer)
+    countryID = countries['countryID'].where(countries['countryID'].notna(), cities['countryID'])
+    return pd.DataFrame({'countryID':countryID, 'countryScore':countries['countryScore'], 'townName':cities['townName'],
+                         'cityScore':cities['cityScore'], 'townIdx':cities['townIdx']}, index=countries.index)
+
+
+
+def parseAddress(Address, townsDB, threshold = 0.95, lowestAllowedThreshold = 0.65, scorer=None):
+    '''parseAddress matches a free-text address line, e.g. "12 Main St, Cork,
+    Co. Cork, Ireland". The address is split into fragments (DelimAliases) and
+    the country is resolved first: the right-most fragment which is an exact
+    country name, code or alias (see buildCountryKeys; a 2-letter code only as
+    the whole last fragment, as state abbreviations look the same), a country 
+    name ending the last fragment ("Cork Ireland"), or else a fuzzy 
+    queryCountryName of the last fragment. Next, the right-most remaining 
+    fragment naming a province of that country is taken as the province, and
+    the city is searched among the remaining fragments (right to left, words 
+    with digits removed) within the country's towns. When that finds no town
+    passing the threshold, or the country itself did not pass it, all 
+    countries are searched too and the better match is kept (its country
+    then replaces the one of the address). Finally, remaining fragments naming
+    the province, county or Address2 of the matched town (e.g. "Co. Cork") are
+    taken as the province too.
+    Returns a DICT with countryID, countryScore, province (as named by the
+    address, None if it names none), townName, cityScore, townIdx,
+    townProvince (the Province of the matched town) and remainder (the
+    unmatched fragments, e.g. the street).'''
+    result = {'countryID':None, 'countryScore':0.0, 'province':None, 'townName':None, 'cityScore':0.0, 'townIdx':None, 'townProvince':None,
+              'remainder':None}
+    if type(Address) is not str or Address.strip() in ['', 'nan']:
+        return result
+    #fragments as [raw text, text without the words containing digits (house numbers, postcodes)]:
+    fragments = []
+    for raw in DelimAliases.split(Address):
+        raw = raw.strip(' .')
+        if raw != '':
+            fragments.append([raw, ' '.join(w for w in raw.split() if not any(ch.isdigit() for ch in w))])
+    if len(fragments) == 0:
+        return result
+    countryKeys = townsDB.get('COUNTRY_KEYS', {})
+    isoCodes = set(normalizeName(c) for c in townsDB['COUNTRIES']['id2c'] if type(c) is str)
+    provinceKeys = getProvinceKeys(townsDB)
+    def lookup(keys, fragment, prefix=None):
+        #Exact lookup of a fragment (as written, then without its digit words) -> (value, key)
+        for text in fragment:
+            key = normalizeName(text) if prefix is None else prefix.sub('', normalizeName(text))
+            if key in keys:
+                return keys[key], key
+        return None, None
+    used = set()  #fragments matched by the country/province/city
+    #1. the country: exact names, codes & aliases first
+    countryIdx = None
+    for i in reversed(range(len(fragments))):
+        countryID, countryKey = lookup(countryKeys, fragments[i])
+        if countryKey in isoCodes and i < len(fragments)-1: #e.g. 'IL' in "Springfield, IL, USA"
+            continue
+        if countryID != None:
+            countryIdx = i
+            result['countryID'], result['countryScore'] = countryID, 1.0
             break
-    return {'TownIndex':TownIndex ,'TownName':TownNames, 'Country':CountryName, 'AliasTownName':TownAliases,'Latitude':TownLat,'Longitude':TownLon,'Province':ProvinceAddress,'County':CountyAddress,'Address2':SubAddressName,'TownClass':TownClass,'Population':TownPopulation}
+    if countryIdx == None:  #a country name at the end of the last fragment, e.g. "Cork Ireland"
+        words = fragments[-1][1].split()
+        for n in range(min(3, len(words)-1), 0, -1):
+            span = ' '.join(words[-n:])
+            if len(span) > 3 and countryKeys.get(normalizeName(span)) != None: #(not the short ISO codes)
+                fragments[-1][1] = ' '.join(words[:-n])
+                fragments.append([span, span])
+                countryIdx = len(fragments)-1
+                countryKey = normalizeName(span)
+                result['countryID'], result['countryScore'] = countryKeys[countryKey], 1.0
+                break
+    if countryIdx == None and len(fragments) > 1:  #a single fragment is more likely a town than a country
+        country = queryCountryName(fragments[-1][1], townsDB, threshold, lowestAllowedThreshold, scorer=scorer)
+        if country[0] != None:
+            countryIdx = len(fragments)-1
+            countryKey = normalizeName(fragments[-1][1])
+            result['countryID'], result['countryScore'] = country
+    countryID = result['countryID']
+    #The country fragment is also a town candidate if it may be one: a fuzzy country
+    #match, or a province/capital key of the country (e.g. "Main St, Cork"):
+    if countryIdx != None:
+        capitals = dict(zip(townsDB['COUNTRIES']['id2c'], townsDB['COUNTRIES']['capital']))
+        if (result['countryScore'] >= threshold and countryID not in provinceKeys.get(countryKey, {})
+                and countryKey != normalizeName(capitals.get(countryID) or '')):
+            used.add(countryIdx)
+    #2. the province: the right-most remaining fragment naming a province of the country
+    provinceIdx = None
+    for i in reversed(range(len(fragments))):
+        if i in used:
+            continue
+        provinces = lookup(provinceKeys, fragments[i], addressProvincePrefix)[0] or {}
+        if (countryID != None and countryID in provinces) or (countryID == None and len(provinces) == 1):
+            provinceIdx = i
+            result['province'] = provinces[countryID] if countryID != None else list(provinces.values())[0]
+            used.add(i)
+            break
+    #3. the city: the remaining fragments, right to left, within the country's towns. The province
+    #fragment comes last, as towns are often named after their province (e.g. "Cork, Ireland")
+    candidates = [i for i in reversed(range(len(fragments))) if i not in used and fragments[i][1] != ''][:addressCitySpans]
+    if provinceIdx != None and fragments[provinceIdx][1] != '':
+        candidates.append(provinceIdx)
+    best, cityIdx = [None, 0.0, None, None], None
+    for i in candidates:
+        if countryID == None or countryID in townsDB['TOWNS']:
+            city = queryCityName(fragments[i][1], townsDB, countryID, threshold, lowestAllowedThreshold, scorer=scorer)
+        else: #a country without a towns table, only the search of all countries below
+            city = [None, 0.0, None, None]
+        if countryID != None and city[1] < threshold:
+            #the country may be wrong (a fuzzy match, or a state abbreviation such as "Springfield, IL"):
+            #search all countries too, and keep the better match
+            anywhere = queryCityName(fragments[i][1], townsDB, None, threshold, lowestAllowedThreshold, scorer=scorer)
+            if anywhere[0] != None and anywhere[1] > city[1]:
+                city = anywhere
+        if city[0] != None and city[1] > best[1]:
+            best, cityIdx = city, i
+        if city[1] >= threshold:
+            break
+    if best[0] != None:
+        result['townName'], result['cityScore'], result['townIdx'] = best[:3]
+        if countryID != None and best[3] != countryID: #the town was found in another country
+            result['countryScore'] = 0.0
+            if countryIdx != None and countryIdx != cityIdx: #the country fragment goes to the remainder
+                used.discard(countryIdx)
+            countryIdx = None
+            if provinceIdx != None:
+                result['province'] = None
+                used.discard(provinceIdx)
+                provinceIdx = None
+        result['countryID'] = best[3]
+        if cityIdx != provinceIdx:
+            used.add(cityIdx)
+        else: #the province fragment named the town (e.g. "Cork, Ireland"), not a province besides it
+            result['province'] = None
+        #the regions of the matched town, and the remaining fragments naming one of them (e.g. "Co. Cork"):
+        Towns = townsDB['TOWNS'][best[3]]
+        regions = {}
+        for column in ['Address2', 'County', 'Province']:
+            value = Towns[column][best[2]] if column in Towns else None
+            if type(value) is str:
+                regions.setdefault(addressProvincePrefix.sub('', normalizeName(value)), value)
+        province = Towns['Province'][best[2]]
+        result['townProvince'] = province if type(province) is str else None
+        for i in reversed(range(len(fragments))):
+            if i not in used and i != countryIdx:
+                value = lookup(regions, fragments[i], addressProvincePrefix)[0]
+                if value != None:
+                    used.add(i)
+                    if result['province'] == None:
+                        result['province'] = value
+    remainder = [fragments[i][0] for i in range(len(fragments)) if i not in used and i != countryIdx]
+    result['remainder'] = ', '.join(remainder) if remainder else None
+    return result
 
 
 
+def parseAddresses(Addresses, townsDB, threshold = 0.95, lowestAllowedThreshold = 0.65, scorer=None):
+    '''parseAddresses evaluates parseAddress over a whole column of address
+    lines (pandas Series, list or array). Each distinct address is parsed only
+    once. Returns a pandas DataFrame with columns countryID, countryScore,
+    province, townName, cityScore, townIdx, townProvince and remainder,
+    aligned with the index of the input.'''
+    entries = pd.Series(Addresses)
+    codes, uniques = pd.factorize(entries.map(batchKey))  #NaN/None entries get code -1
+    columns = ['countryID', 'countryScore', 'province', 'townName', 'cityScore', 'townIdx', 'townProvince', 'remainder']
+    parsed = {c:np.empty(len(uniques)+1, dtype=object) for c in columns}
+    parsed['countryScore'] = np.zeros(len(uniques)+1)
+    parsed['cityScore'] = np.zeros(len(uniques)+1)
+    for i, entry in enumerate(uniques):
+        result = parseAddress(entry, townsDB, threshold, lowestAllowedThreshold, scorer)
+        for c in columns:
+            parsed[c][i] = result[c]
+    out = pd.DataFrame({c:parsed[c][codes] for c in columns}, index=entries.index)
+    out['townIdx'] = pd.array(parsed['townIdx'][codes], dtype='Int64')
+    return out
 
 
 
-def AliasList(Aliases):
-    '''AliasList takes in a N-row, single-column list of comma-separated aliases
-    and concatenates them into one long single column OUTPUT list. Minor filtering
-    on the Alias entries are performed during this routine.
-    Brian Scanlon, April, 2019'''
-    Idx=[]
-    OUTPUT=[]
-    for i in range(len(Aliases)):
+def getProvinceKeys(townsDB):
+    #Returns (building it on first use) the DICT of normalized province names -> {countryID: province}.
+    if townsDB.get('PROVINCE_KEYS') is None:
+        keys = {}
+        for province, countryID in zip(townsDB['PROVINCES']['province'], townsDB['PROVINCES']['countryID']):
+            if type(province) is str:
+                keys.setdefault(normalizeName(province), {}).setdefault(countryID, province)
+        keys.pop('', None)
+        townsDB['PROVINCE_KEYS'] = keys
+    return townsDB['PROVINCE_KEYS']
+
+
+
+def parallelQueryNames(CountryEntries, CityEntries, townsDB=None, workers=None, chunkSize=10000, PATH=dataBaseParentPath, mmap=False, threshold = 0.95, lowestAllowedThreshold = 0.65, scorer=None):
+    '''parallelQueryNames is the multi-core driver of queryLocationNames for large
+    address tables. Distinct (country, city) pairs are found first, sharded into
+    chunks of chunkSize pairs and matched by a pool of workers processes (default:
+    one per core). Results are returned in input order (as queryLocationNames).
+    Where the platform supports fork, the workers inherit townsDB from this process
+    without copying it (load it with mmap=True to keep the towns tables in the shared
+    page cache), with its query indexes built beforehand (see warmIndexes). Otherwise each worker loads the dataset from PATH (memory-mapped if
+    mmap=True).'''
+    global sharedTownsDB
+    countries = pd.Series(CountryEntries)
+    cities = pd.Series(list(CityEntries), index=countries.index)
+    pairs = pd.DataFrame({'country':countries.map(batchKey), 'city':cities.map(batchKey)}).fillna('')
+    codes, uniques = pd.factorize(pd.MultiIndex.from_frame(pairs))
+    uniquePairs = pd.DataFrame(list(uniques), columns=['country','city']).replace('', None)
+    chunks = [uniquePairs.iloc[i:i+chunkSize] for i in range(0, len(uniquePairs), chunkSize)]
+    options = (threshold, lowestAllowedThreshold, scorer)
+    if workers == None:
+        workers = os.cpu_count() or 1
+    if townsDB == None and (workers <= 1 or len(chunks) <= 1 or 'fork' in mp.get_all_start_methods()):
+        townsDB = loadDB(PATH, mmap=mmap)
+    if workers <= 1 or len(chunks) <= 1:
+        results = [queryLocationNames(chunk['country'], chunk['city'], townsDB, *options) for chunk in chunks]
+    else:
+        if 'fork' in mp.get_all_start_methods(): #workers inherit the dataset
+            context = mp.get_context('fork')
+            initializer, initargs = None, ()
+            sharedTownsDB = warmIndexes(townsDB) #(built once here and shared, not rebuilt by every worker)
+        else: #each worker loads its own (ideally memory-mapped) dataset
+            context = mp.get_context('spawn')
+            initializer, initargs = initParallelWorker, (PATH, mmap)
         try:
-            #bufr=Aliases[i].split(',')
-            bufr=DelimAliases.split(Aliases[i].strip('.'))
-            isOK=True
-        except:
-            isOK=False
+            with context.Pool(min(workers, len(chunks)), initializer, initargs) as pool:
+                results = pool.map(matchParallelChunk, [(chunk, options) for chunk in chunks], chunksize=1)
         finally:
-            if isOK:
-                for ii in range(len(bufr)):
-                    Idx.append(i)
-                    OUTPUT.append(bufr[ii])
-    return {'Index':Idx, 'Aliases':OUTPUT}
- 
-    
+            sharedTownsDB = None
+    if len(results) == 0:
+        return queryLocationNames([], [], townsDB if townsDB != None else {}, *options)
+    matches = pd.concat(results, ignore_index=True)
+    matches = matches.iloc[codes].set_axis(countries.index)
+    return matches
 
 
 
+sharedTownsDB = None   #dataset used by parallelQueryNames worker processes
 
 
-#Find a list of countries!
-def getCountries(countryURL='https://www.geonames.org/countries/', Verbose=False):
-    #allocate memory to output var:
-    idA2 = []
-    idA3 = []
-    idNum = []
-    idFips = []
-    country = []
-    capital = []
-    areaKM2 = []
-    population = []
-    continentID = []
-    #
+
+def initParallelWorker(PATH, mmap):
+    #Pool initializer of parallelQueryNames on platforms without fork: load the dataset once per worker.
+    global sharedTownsDB
+    sharedTownsDB = loadDB(PATH, mmap=mmap)
+
+
+
+def matchParallelChunk(args):
+    #Work item of parallelQueryNames: match one chunk of distinct (country, city) pairs.
+    chunk, options = args
+    return queryLocationNames(chunk['country'], chunk['city'], sharedTownsDB, *options)
+
+
+
+def matchItem(item, townsDB, threshold = 0.95, lowestAllowedThreshold = 0.65, scorer=None):
+    '''matchItem matches one request of the matching service (see serveDB): a DICT
+    with an 'address' line (parseAddress), or a 'country' and/or 'city' entry,
+    optionally with the 'countryID' of the city (queryCountryName, then 
+    queryCityName within the resolved country). Returns a DICT of countryID,
+    countryScore and, if a city or address was given, townName, cityScore & 
+    townIdx (plus province, townProvince and remainder for addresses). A 
+    countryID which has no towns table (e.g. 'XX') matches nothing, as in 
+    queryCityNames.'''
+    if item.get('address') != None:
+        result = parseAddress(item['address'], townsDB, threshold, lowestAllowedThreshold, scorer)
+        result['townIdx'] = None if result['townIdx'] is None else int(result['townIdx'])
+        return result
+    result = {'countryID':item.get('countryID'), 'countryScore':1.0 if item.get('countryID') != None else 0.0}
+    if result['countryID'] != None and result['countryID'] not in townsDB['TOWNS']:
+        result = {'countryID':None, 'countryScore':0.0}
+        if item.get('city') != None:
+            result.update({'townName':None, 'cityScore':0.0, 'townIdx':None})
+        return result
+    if item.get('country') != None and item.get('countryID') == None:
+        result['countryID'], result['countryScore'] = queryCountryName(item['country'], townsDB, threshold, lowestAllowedThreshold, scorer=scorer)
+    if item.get('city') != None:
+        city = queryCityName(item['city'], townsDB, result['countryID'], threshold, lowestAllowedThreshold, scorer=scorer)
+        result['townName'], result['cityScore'], result['townIdx'] = city[0], city[1], None if city[2] is None else int(city[2])
+        if result['countryID'] == None:
+            result['countryID'] = city[3]
+    return result
+
+
+
+def matchServiceChunk(args):
+    #Work item of the matching service: match a micro-batch of distinct requests with the shared dataset.
+    items, options = args
+    results = []
+    for item in items:
+        try:
+            results.append(matchItem(item, sharedTownsDB, *options))
+        except Exception as err: #a bad request (e.g. unknown countryID) only fails itself
+            results.append({'error':'{}: {}'.format(type(err).__name__, err)})
+    return results
+
+
+
+class MatchService:
+    '''State of a running matching service (see serveDB): the queue of pending
+    requests, the micro-batcher which drains it, the worker pool and counters.
+    Requests arriving within batchWindow seconds of each other (at most 
+    maxBatch) are matched as one micro-batch: identical requests are matched 
+    once, and the batch is split over the workers.'''
+    def __init__(self, executor, workers, options, batchWindow=0.002, maxBatch=256, countries=0):
+        self.executor = executor
+        self.workers = workers
+        self.countries = countries
+        self.options = options
+        self.batchWindow = batchWindow
+        self.maxBatch = maxBatch
+        self.queue = asyncio.Queue()
+        self.tasks = set()  #running micro-batches (the event loop only keeps weak references to tasks)
+        self.stats = {'requests':0, 'items':0, 'batches':0, 'distinctItems':0, 'errors':0}
+    async def match(self, items):
+        #Queues the items (DICTs, see matchItem) and waits for their results.
+        loop = asyncio.get_running_loop()
+        futures = []
+        for item in items:
+            futures.append(loop.create_future())
+            self.queue.put_nowait((item, futures[-1]))
+        self.stats['items'] += len(items)
+        return await asyncio.gather(*futures)
+    async def batcher(self):
+        #Drains the queue into micro-batches and runs them on the worker pool.
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            deadline = loop.time() + self.batchWindow
+            while len(pending) < self.maxBatch:
+                try:
+                    pending.append(await asyncio.wait_for(self.queue.get(), max(0.0, deadline - loop.time())))
+                except asyncio.TimeoutError:
+                    break
+            task = loop.create_task(self.runBatch(pending))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+    async def runBatch(self, pending):
+        loop = asyncio.get_running_loop()
+        distinct = {}
+        for item, future in pending:
+            distinct.setdefault(json.dumps(item, sort_keys=True), []).append(future)
+        keys = list(distinct)
+        items = [json.loads(k) for k in keys]
+        size = -(-len(items) // max(1, self.workers))  #one chunk per worker
+        chunks = [items[i:i+size] for i in range(0, len(items), size)]
+        self.stats['batches'] += 1
+        self.stats['distinctItems'] += len(items)
+        try:
+            results = await asyncio.gather(*[loop.run_in_executor(self.executor, matchServiceChunk, (chunk, self.options)) for chunk in chunks])
+        except Exception as err:
+            self.stats['errors'] += 1
+            for futures in distinct.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(err)
+            return
+        results = [r for chunk in results for r in chunk]
+        self.stats['errors'] += sum(1 for result in results if 'error' in result) #(items which failed)
+        for key, result in zip(keys, results):
+            for future in distinct[key]:
+                if not future.done():
+                    future.set_result(result)
+
+
+
+def serveDB(PATH=dataBaseParentPath, host='127.0.0.1', port=8765, unixSocket=None, workers=None, batchWindow=0.002, maxBatch=256,
+            mmap=False, cacheSize=100000, townsDB=None, threshold = 0.95, lowestAllowedThreshold = 0.65, scorer=None):
+    '''serveDB loads the dataset once and serves matches over HTTP (host:port, or
+    the Unix socket unixSocket), so that many jobs share one warm dataset, 
+    index and query cache instead of each calling loadDB. Endpoints (JSON):
+        GET  /health                       status, number of countries & workers
+        GET  /stats                        requests, items, micro-batches, errors
+        GET  /match?country=..&city=..     one match (also countryID=.., address=..)
+        POST /match    {"country":.., "city":..}   one match (see matchItem)
+        POST /batch    [{...}, {...}, ...]          a list of matches, in order
+    An item whose matching fails gets {"error": ..} instead (status 500 on
+    /match), and is counted in the errors of /stats. Matching runs on a pool of workers processes (default: one per core; forked,
+    so they share the loaded dataset, each with its own query cache), or on a
+    single thread of the server process with workers=0 (one shared cache).
+    Concurrent requests are micro-batched (see MatchService). Runs until 
+    interrupted (SIGINT/SIGTERM).'''
+    global sharedTownsDB
+    if townsDB == None:
+        townsDB = loadDB(PATH, cacheSize=cacheSize, mmap=mmap)
+    warmIndexes(townsDB) #before forking the workers, so they share the indexes
+    if workers == None:
+        workers = os.cpu_count() or 1
+    sharedTownsDB = townsDB
+    if workers > 0 and 'fork' in mp.get_all_start_methods(): #workers inherit the dataset
+        executor = ProcessPoolExecutor(workers, mp_context=mp.get_context('fork'))
+    elif workers > 0: #each worker loads its own (ideally memory-mapped) dataset
+        executor = ProcessPoolExecutor(workers, mp_context=mp.get_context('spawn'), initializer=initParallelWorker, initargs=(PATH, mmap))
+    else:
+        executor = ThreadPoolExecutor(1)
+    #start the workers now, before the event loop runs (forking a running event loop is unsafe):
+    list(executor.map(int, range(max(1, workers))))
+    service = MatchService(executor, max(1, workers), (threshold, lowestAllowedThreshold, scorer), batchWindow, maxBatch,
+                           len(townsDB['TOWNS']))
+    async def main():
+        if unixSocket != None:
+            server = await asyncio.start_unix_server(lambda r, w: serveConnection(r, w, service), path=unixSocket)
+            print('TownsDataBase service listening on unix:{}'.format(unixSocket))
+        else:
+            server = await asyncio.start_server(lambda r, w: serveConnection(r, w, service), host, port)
+            print('TownsDataBase service listening on http://{}:{}/'.format(host, port))
+        batcher = asyncio.create_task(service.batcher())
+        stop = asyncio.Event()  #set by SIGINT/SIGTERM, for a clean shutdown
+        for sig in [signal.SIGINT, signal.SIGTERM]:
+            try:
+                asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError): #(no signal handlers on this platform/thread)
+                pass
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            batcher.cancel()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown(cancel_futures=True)
+        sharedTownsDB = None
+        if unixSocket != None and os.path.exists(unixSocket):
+            os.remove(unixSocket)
+
+
+
+async def serveConnection(reader, writer, service):
+    #HTTP/1.1 connection handler of serveDB (keep-alive, JSON bodies with Content-Length).
+    try:
+        while True:
+            requestLine = await reader.readline()
+            if not requestLine.strip():
+                break
+            try:
+                method, target, version = requestLine.decode('latin-1').split()
+            except ValueError:
+                await sendResponse(writer, 400, {'error':'malformed request line'}, False)
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            try:
+                length = int(headers.get('content-length', 0) or 0)
+                if length < 0:
+                    raise ValueError(length)
+            except ValueError: #the body can't be framed, so the connection can't be reused
+                await sendResponse(writer, 400, {'error':'malformed Content-Length header'}, False)
+                break
+            body = await reader.readexactly(length)
+            keepAlive = headers.get('connection', '').lower() != 'close' and version != 'HTTP/1.0'
+            service.stats['requests'] += 1
+            status, payload = await serviceRoute(service, method, target, body)
+            await sendResponse(writer, status, payload, keepAlive)
+            if not keepAlive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+
+async def serviceRoute(service, method, target, body):
+    #Dispatches one HTTP request of serveDB -> (status, JSON payload)
+    url = urlparse(target)
+    try:
+        if url.path == '/health' and method == 'GET':
+            return 200, {'status':'ok', 'countries':service.countries, 'workers':service.workers}
+        if url.path == '/stats' and method == 'GET':
+            return 200, dict(service.stats, queued=service.queue.qsize())
+        if url.path == '/match' and method == 'GET':
+            item = {k:v[-1] for k, v in parse_qs(url.query).items() if k in serviceItemFields}
+            result = (await service.match([item]))[0]
+            return 500 if 'error' in result else 200, result
+        if url.path == '/match' and method == 'POST':
+            item = json.loads(body or b'{}')
+            if type(item) is not dict:
+                return 400, {'error':'expected a JSON object'}
+            result = (await service.match([item]))[0]
+            return 500 if 'error' in result else 200, result
+        if url.path == '/batch' and method == 'POST':
+            items = json.loads(body or b'[]')
+            if type(items) is dict:
+                items = items.get('items', [])
+            if type(items) is not list or not all(type(item) is dict for item in items):
+                return 400, {'error':'expected a JSON list of objects'}
+            return 200, await service.match(items)
+        if url.path in ['/health', '/stats', '/match', '/batch']:
+            return 405, {'error':'method {} not allowed on {}'.format(method, url.path)}
+        return 404, {'error':'unknown endpoint {}'.format(url.path)}
+    except json.JSONDecodeError as err:
+        return 400, {'error':'invalid JSON: {}'.format(err)}
+    except Exception as err:
+        return 500, {'error':'{}: {}'.format(type(err).__name__, err)}
+
+
+
+async def sendResponse(writer, status, payload, keepAlive=True):
+    body = json.dumps(payload, default=str).encode('utf-8')
+    head = 'HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+           status, httpReasons.get(status, ''), len(body), 'keep-alive' if keepAlive else 'close')
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+
+
+
+def enrichFile(inPATH, outPATH, townsDB=None, countryColumn='COUNTRY', cityColumn='CITY', addressColumn=None, chunkSize=10000, startRow=0,
+               sheetName=None, workers=1, PATH=dataBaseParentPath, mmap=False, threshold = 0.95, lowestAllowedThreshold = 0.65, scorer=None,
+               Verbose=True):
+    '''enrichFile streams an address table (CSV, Parquet or Excel, by file 
+    extension) through the matcher, chunkSize rows at a time, and writes each
+    enriched chunk to outPATH (CSV, Parquet or Excel) before reading the next,
+    so memory use stays flat however large the file is. Each row gets the
+    queryLocationNames columns (countryID, countryScore, townName, cityScore,
+    townIdx; from countryColumn & cityColumn, or from addressColumn with 
+    parseAddresses, which adds province & remainder) joined with the matched 
+    town's enrichColumns (Population, Latitude, Longitude, Province, TownClass).
+    startRow skips that many data rows of the input: to resume an interrupted
+    run, pass the number of rows already written (printed after every chunk);
+    a CSV output is then appended to, while a Parquet/Excel output is rewritten
+    with its first startRow rows followed by the remaining ones (those formats
+    can't be appended to).
+    workers > 1 matches each chunk with parallelQueryNames.
+    Returns a DICT of rows (enriched by this run), matched (rows with a town)
+    and nextRow (the startRow to continue from).'''
+    if townsDB == None:
+        townsDB = loadDB(PATH, mmap=mmap)
+    writer = EnrichWriter(outPATH, keepRows=startRow)
+    summary = {'rows':0, 'matched':0, 'nextRow':startRow}
+    try:
+        for chunk in readChunks(inPATH, chunkSize, startRow, sheetName):
+            if addressColumn != None:
+                matches = parseAddresses(chunk[addressColumn], townsDB, threshold, lowestAllowedThreshold, scorer)
+                matches = matches.drop(columns='townProvince') #(the town's Province is one of the enrichColumns)
+            elif workers > 1:
+                matches = parallelQueryNames(chunk[countryColumn], chunk[cityColumn], townsDB, workers, max(1, len(chunk)//workers),
+                                             threshold=threshold, lowestAllowedThreshold=lowestAllowedThreshold, scorer=scorer)
+            else:
+                matches = queryLocationNames(chunk[countryColumn], chunk[cityColumn], townsDB, threshold, lowestAllowedThreshold, scorer)
+            enriched = pd.concat([chunk, matches, townColumns(townsDB, matches['countryID'], matches['townIdx'])], axis=1)
+            writer.write(enriched)
+            summary['rows'] += len(chunk)
+            summary['matched'] += int(matches['townIdx'].notna().sum())
+            summary['nextRow'] += len(chunk)
+            if Verbose:
+                print('enrichFile: {} rows written (resume with startRow={})'.format(summary['rows'], summary['nextRow']))
+    finally:
+        writer.close()
+    return summary
+
+
+
+def townColumns(townsDB, countryIDs, townIdx, columns=None):
+    '''townColumns looks up columns (default enrichColumns) of the towns given by
+    aligned countryIDs and townIdx (Series, e.g. the output of queryLocationNames).
+    Returns a pandas DataFrame aligned with countryIDs; rows without a town get
+    missing values. Lookups are grouped by country.'''
+    columns = enrichColumns if columns is None else columns
+    countryIDs = pd.Series(countryIDs)
+    townIdx = pd.Series(pd.array(townIdx, dtype='Int64'), index=countryIDs.index)
+    out = pd.DataFrame({c:np.full(len(countryIDs), None, dtype=object) for c in columns}, index=countryIDs.index)
+    found = townIdx.notna() & countryIDs.map(lambda c: type(c) == str and c in townsDB['TOWNS'])
+    for coCode, rows in countryIDs[found].groupby(countryIDs[found]).groups.items():
+        positions = townIdx[rows].to_numpy(dtype=np.int64)
+        for c in columns:
+            values = townsDB['TOWNS'][coCode].get(c)
+            if values is None:
+                continue
+            if isinstance(values, NumericColumn):
+                out.loc[rows, c] = [values[int(i)] for i in positions]
+            else:
+                out.loc[rows, c] = [values[i] for i in positions]
+    for c in columns: #numeric columns as numbers (None -> NaN)
+        if c in townNumericColumns:
+            out[c] = pd.to_numeric(out[c]).astype(np.float64)
+    return out
+
+
+
+def readChunks(inPATH, chunkSize=10000, startRow=0, sheetName=None):
+    #Yields the data rows of a CSV/Parquet/Excel file as DataFrames of (at most) chunkSize rows, skipping startRow rows.
+    #The index of every chunk is the row number in the file (0 = first data row).
+    extension = os.path.splitext(inPATH.lower().replace('.gz', '').replace('.bz2', ''))[1]
+    if extension in ['.parquet', '.pq']:
+        if pq == None:
+            raise ImportError('reading Parquet files needs the pyarrow package')
+        row = 0
+        for batch in pq.ParquetFile(inPATH).iter_batches(batch_size=chunkSize):
+            if row + batch.num_rows > startRow:
+                chunk = batch.slice(max(0, startRow - row)).to_pandas()
+                chunk.index = pd.RangeIndex(max(row, startRow), max(row, startRow) + len(chunk))
+                yield chunk
+            row += batch.num_rows
+    elif extension in ['.xlsx', '.xlsm']:
+        if openpyxl == None:
+            raise ImportError('reading Excel files needs the openpyxl package')
+        workbook = openpyxl.load_workbook(inPATH, read_only=True, data_only=True)  #streams the sheet XML
+        try:
+            sheet = workbook.worksheets[0] if sheetName == None else workbook[sheetName]
+            rows = sheet.iter_rows(values_only=True)
+            header = [str(h) for h in next(rows, [])]
+            row = 0
+            buffer = []
+            for values in rows:
+                if row >= startRow:
+                    buffer.append(values)
+                row += 1
+                if len(buffer) == chunkSize:
+                    yield pd.DataFrame(buffer, columns=header, index=pd.RangeIndex(row-len(buffer), row))
+                    buffer = []
+            if buffer:
+                yield pd.DataFrame(buffer, columns=header, index=pd.RangeIndex(row-len(buffer), row))
+        finally:
+            workbook.close()
+    else: #CSV (or TSV), possibly compressed
+        sep = '\t' if extension in ['.tsv', '.tab'] else ','
+        row = startRow
+        for chunk in pd.read_csv(inPATH, sep=sep, chunksize=chunkSize, skiprows=range(1, startRow+1), dtype=str, keep_default_na=False,
+                                 na_values=['']):
+            chunk.index = pd.RangeIndex(row, row + len(chunk))
+            row += len(chunk)
+            yield chunk
+
+
+
+class EnrichWriter:
+    '''Incremental writer of enrichFile: CSV (appending chunks), Parquet (one row
+    group per chunk) or Excel (write-only workbook, rows streamed to disk), by
+    the extension of outPATH. keepRows > 0 continues an existing output file
+    after its first keepRows data rows: a CSV file is appended to, while the
+    kept rows of a Parquet/Excel file are streamed into the new file first.
+    Parquet/Excel files are written to a temporary file which replaces outPATH
+    on close.'''
+    def __init__(self, outPATH, keepRows=0):
+        self.outPATH = outPATH
+        self.extension = os.path.splitext(outPATH.lower().replace('.gz', '').replace('.bz2', ''))[1]
+        self.keepRows = keepRows if os.path.isfile(outPATH) else 0
+        self.append = self.keepRows > 0
+        self.kept = not self.append  #True once the kept rows are in the new file
+        self.tempPATH = '{}.tmp{}'.format(outPATH, os.getpid())
+        self.handle = None
+        self.columns = None
+        if self.extension in ['.parquet', '.pq'] and pq == None:
+            raise ImportError('writing Parquet files needs the pyarrow package')
+        if self.extension in ['.xlsx', '.xlsm'] and openpyxl == None:
+            raise ImportError('writing Excel files needs the openpyxl package')
+    def keptRowsError(self, found):
+        return ValueError('cannot resume {} after {} rows: it only has {} rows'.format(self.outPATH, self.keepRows, found))
+    def write(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+        chunk = chunk[self.columns]
+        if self.extension in ['.parquet', '.pq']:
+            if self.handle is None and self.append: #the kept rows (and schema) of the previous run first
+                kept = pq.ParquetFile(self.outPATH)
+                self.handle = pq.ParquetWriter(self.tempPATH, kept.schema_arrow)
+                found = 0
+                for batch in kept.iter_batches(batch_size=65536):
+                    batch = batch.slice(0, self.keepRows - found)
+                    self.handle.write_table(pa.Table.from_batches([batch]))
+                    found += batch.num_rows
+                    if found == self.keepRows:
+                        break
+                if found < self.keepRows:
+                    raise self.keptRowsError(found)
+                self.kept = True
+            if self.handle is None: #schema of the first chunk, all-missing columns as strings
+                schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                schema = pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in schema])
+                self.handle = pq.ParquetWriter(self.tempPATH, schema)
+            self.handle.write_table(pa.Table.from_pandas(chunk, schema=self.handle.schema, preserve_index=False))
+        elif self.extension in ['.xlsx', '.xlsm']:
+            if self.handle is None:
+                self.handle = openpyxl.Workbook(write_only=True)
+                self.sheet = self.handle.create_sheet()
+                if self.append: #the header & kept rows of the previous run first
+                    kept = openpyxl.load_workbook(self.outPATH, read_only=True)
+                    found = -1
+                    for values in kept.worksheets[0].iter_rows(values_only=True):
+                        if found == self.keepRows:
+                            break
+                        self.sheet.append(list(values))
+                        found += 1
+                    kept.close()
+                    if found < self.keepRows:
+                        raise self.keptRowsError(max(0, found))
+                    self.kept = True
+                else:
+                    self.sheet.append(self.columns)
+            for values in chunk.itertuples(index=False):
+                self.sheet.append([None if (v is None or v is pd.NA or (type(v) is float and v != v)) else
+                                   (v.item() if isinstance(v, np.generic) else v) for v in values])
+        else:
+            sep = '\t' if self.extension in ['.tsv', '.tab'] else ','
+            chunk.to_csv(self.outPATH, sep=sep, index=False, mode='a' if self.append else 'w', header=not self.append)
+            self.append = True  #following chunks are appended
+    def close(self):
+        #Also after an error: the chunks written so far are kept, so the run can be resumed.
+        #Only a file whose kept rows could not be copied leaves outPATH as it was.
+        if self.handle is not None:
+            if self.extension in ['.xlsx', '.xlsm']:
+                self.handle.save(self.tempPATH)
+            else:
+                self.handle.close()
+            self.handle = None
+            if self.kept:
+                os.replace(self.tempPATH, self.outPATH)
+            else:
+                os.remove(self.tempPATH)
+
+
+
+def reverseGeocode(Latitude, Longitude, townsDB, k=1, radiusKM=None):
+    '''reverseGeocode returns the k (>= 1) towns nearest to a location 
+    (great-circle distance), optionally restricted to radiusKM. With k=None and
+    a radiusKM, all towns within the radius are returned. Latitude & Longitude are degrees,
+    either scalars, which return a list of [TownName, distanceKM, townIdx,
+    countryID] (nearest first), or arrays, which are searched vectorized and
+    return a pandas DataFrame with columns query, rank, TownName, distanceKM,
+    townIdx and countryID (one row per found town; query is the position of the
+    location in the input arrays).'''
+    if k == None and radiusKM == None:
+        raise ValueError('reverseGeocode needs k and/or radiusKM')
+    if k != None and (isinstance(k, bool) or not isinstance(k, (int, np.integer)) or k < 1):
+        raise ValueError('reverseGeocode needs k >= 1 (or k=None with a radiusKM), got k={!r}'.format(k))
+    index = getSpatialIndex(townsDB)
+    isScalar = np.ndim(Latitude) == 0
+    lat = np.atleast_1d(np.asarray(Latitude, dtype=np.float64))
+    lon = np.atleast_1d(np.asarray(Longitude, dtype=np.float64))
+    queryID, pos, dist, rank = spatialSearch(index, lat, lon, k, radiusKM)
+    countryID = [index['countries'][c] for c in index['country'][pos]]
+    townIdx = index['townIdx'][pos]
+    townName = [townsDB['TOWNS'][c]['TownName'][int(t)] for c, t in zip(countryID, townIdx)]
+    if isScalar:
+        return [[townName[i], float(dist[i]), int(townIdx[i]), countryID[i]] for i in range(len(pos))]
+    return pd.DataFrame({'query':queryID, 'rank':rank, 'TownName':townName, 'distanceKM':dist,
+                         'townIdx':townIdx, 'countryID':countryID})
+
+
+
+def enableQueryCache(townsDB, maxSize=100000, PATH=None):
+    '''enableQueryCache attaches a bounded LRU cache of query results to the
+    dataset (townsDB['CACHE']). Once attached, queryCountryName and queryCityName
+    return previously computed results for the same (entry, countryID, 
+    threshold, lowestAllowedThreshold, scorer, ...; see cacheEntryKey) without
+    re-running the matching cascade. If PATH points to a cache saved with 
+    saveQueryCache from the same dataset (see datasetHash), it is used to 
+    warm-start the cache; a cache saved from another dataset is ignored.'''
+    townsDB['CACHE'] = {'entries':OrderedDict(), 'maxSize':maxSize, 'hits':0, 'misses':0, 'evictions':0}
+    if PATH != None and os.path.isfile(PATH):
+        with open(PATH,'r') as JSONfile:
+            saved = json.loads(JSONfile.read())
+        currentHash = getDatasetHash(townsDB)
+        if currentHash != None and saved.get('dataset') == currentHash:
+            for key, result in saved['entries']: #saved in least -> most recently used order
+                cacheStore(townsDB, cacheEntryKey(key), result)
+    return townsDB['CACHE']
+
+
+
+def queryCacheStats(townsDB):
+    #Returns hit/miss/eviction counters of the query cache (None if no cache is attached).
+    cache = townsDB.get('CACHE')
+    if cache is None:
+        return None
+    lookups = cache['hits'] + cache['misses']
+    return {'hits':cache['hits'], 'misses':cache['misses'], 'evictions':cache['evictions'],
+            'size':len(cache['entries']), 'maxSize':cache['maxSize'],
+            'hitRate':cache['hits']/lookups if lookups else 0.0}
+
+
+
+def saveQueryCache(townsDB, PATH):
+    #Persists the query cache to a JSON file, which enableQueryCache (or loadDB) can warm-start from.
+    cache = townsDB.get('CACHE')
+    if cache is None:
+        return
+    with open(PATH,'w') as file:
+        json.dump({'dataset':getDatasetHash(townsDB), 'entries':[[list(key), result] for key, result in cache['entries'].items()]}, file)
+
+
+
+def cacheEntryKey(key):
+    '''cacheEntryKey builds the query cache key from (function, entry, countryID,
+    threshold, lowestAllowedThreshold, scorer, ...): the entry becomes its
+    normalized name (see normalizeName) when the scorer compares normalized keys,
+    so that "dublin", "DUBLIN" and "Dublín" share one result, and list components
+    (e.g. a countryHint, or any component of a key read back from JSON) become 
+    tuples, so that the key is hashable.'''
+    key = [tuple(cacheEntryKey(c) if isinstance(c, list) else c for c in part) if isinstance(part, list) else part for part in key]
+    if key[5] in normalizedScorers and type(key[1]) is str:
+        key[1] = normalizeName(key[1])
+    return tuple(key)
+
+
+
+def datasetHash(PATH):
+    '''datasetHash returns the sha1 hex digest of the JSON dataset in PATH (the
+    countries, country aliases, provinces and <CC>.json files, in name order),
+    which identifies the dataset a saved query cache belongs to. The compiled
+    dataset keeps the hash of the JSON files it was compiled from.'''
+    fileNames = ['CountriesDB.json', 'CountryAliasDB.json', 'ProvinceDB.json']
+    fileNames += sorted(os.path.basename(name) for name in glob.glob('{}*.json'.format(PATH)) if len(os.path.basename(name)) == 7)
+    digest = hashlib.sha1()
+    for fileName in fileNames:
+        digest.update(fileName.encode('utf-8'))
+        with open('{}{}'.format(PATH, fileName),'rb') as file:
+            for block in iter(lambda: file.read(1<<20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+
+def getDatasetHash(townsDB):
+    #Returns the datasetHash of a loaded dataset (hashed on first use), or None if it wasn't loaded from a PATH.
+    dataset = townsDB.get('DATASET')
+    if dataset is None:
+        return None
+    if dataset['hash'] is None and dataset['PATH'] != None:
+        dataset['hash'] = datasetHash(dataset['PATH'])
+    return dataset['hash']
+
+
+
+def enableMetrics(townsDB, enabled=True):
+    '''enableMetrics attaches per-stage timers and counters of the query cascades
+    to the dataset (townsDB['METRICS']), or detaches them (enabled=False). Once 
+    attached, queryCountryName and queryCityName record, per stage (capFix, 
+    exact, cache, typo, searchSpace, names, TownName, Aliases, country, countryAlias, capital,
+    province, fallback): the time spent, the number of runs and the number of 
+    candidate names scored, and per query its latency and outcome (the stage 
+    which produced the match, fallback, noMatch, cache, exact or empty). When 
+    not attached, the queries only pay a dictionary lookup. The metrics are 
+    kept per process (parallelQueryNames workers record their own).'''
+    townsDB['METRICS'] = None
+    if enabled:
+        townsDB['METRICS'] = {}
+        resetMetrics(townsDB)
+    return townsDB['METRICS']
+
+
+
+def resetMetrics(townsDB):
+    #Zeroes the timers and counters of the attached metrics.
+    metrics = townsDB.get('METRICS')
+    if metrics is None:
+        return
+    for key in ['stageSeconds', 'stageRuns', 'candidates', 'outcomes', 'queries', 'querySeconds', 'budgetHits']:
+        metrics[key] = {}
+
+
+
+def getMetrics(townsDB):
+    '''getMetrics returns the metrics as a DICT per function ('city', 'country'):
+    queries, seconds, budgetHits, fallbackRate and, keyed by stage/outcome, 
+    stageSeconds, stageRuns, candidates and outcomes (None if not enabled).'''
+    metrics = townsDB.get('METRICS')
+    if metrics is None:
+        return None
+    out = {}
+    for function in metrics['queries']:
+        out[function] = {'queries':metrics['queries'][function], 'seconds':metrics['querySeconds'][function],
+                         'budgetHits':metrics['budgetHits'].get(function, 0),
+                         'fallbackRate':metrics['outcomes'].get((function, 'fallback'), 0)/metrics['queries'][function]}
+        for key in ['stageSeconds', 'stageRuns', 'candidates', 'outcomes']:
+            out[function][key] = {stage:value for (f, stage), value in metrics[key].items() if f == function}
+    return out
+
+
+
+def metricsText(townsDB):
+    #Returns the metrics in the Prometheus text exposition format ('' if not enabled).
+    metrics = townsDB.get('METRICS')
+    if metrics is None:
+        return ''
+    lines = []
+    for name, key, label, help in [('townsdb_queries_total', 'queries', None, 'Number of queries'),
+                                   ('townsdb_query_seconds_total', 'querySeconds', None, 'Time spent in queries'),
+                                   ('townsdb_budget_hits_total', 'budgetHits', None, 'Queries cut short by their budget'),
+                                   ('townsdb_query_outcomes_total', 'outcomes', 'outcome', 'Queries by the stage which produced the result'),
+                                   ('townsdb_stage_seconds_total', 'stageSeconds', 'stage', 'Time spent per cascade stage'),
+                                   ('townsdb_stage_runs_total', 'stageRuns', 'stage', 'Number of runs per cascade stage'),
+                                   ('townsdb_candidates_scored_total', 'candidates', 'stage', 'Candidate names searched per cascade stage')]:
+        lines.append('# HELP {} {}'.format(name, help))
+        lines.append('# TYPE {} counter'.format(name))
+        for k, value in sorted(metrics[key].items()):
+            if label is None:
+                lines.append('{}{{function="{}"}} {}'.format(name, k, value))
+            else:
+                lines.append('{}{{function="{}",{}="{}"}} {}'.format(name, k[0], label, k[1], value))
+    return '\n'.join(lines) + '\n'
+
+
+
+def traceStage(trace, stage, candidates=0):
+    #Marks the end of a cascade stage in a query trace (no-op when the metrics are not enabled).
+    if trace is not None:
+        trace.append((stage, candidates, time.perf_counter()))
+
+
+
+def queryOutcome(result, threshold, trace):
+    #The stage which produced a query result: the last stage run if it passed the threshold.
+    if result[0] == None:
+        return 'noMatch'
+    if result[1] >= threshold:
+        return trace[-1][0]
+    return 'fallback'
+
+
+
+def recordQueryMetrics(metrics, function, trace, outcome, queryBudget=None):
+    #Adds a finished query trace [(stage, candidates scored, end time), ...] to the metrics.
+    traceStage(trace, outcome if outcome in ['fallback', 'cache'] else 'end')
+    for (stage, candidates, end), (previous, c, start) in zip(trace[1:], trace[:-1]):
+        if stage == 'end':
+            continue
+        key = (function, stage)
+        metrics['stageSeconds'][key] = metrics['stageSeconds'].get(key, 0.0) + end - start
+        metrics['stageRuns'][key] = metrics['stageRuns'].get(key, 0) + 1
+        metrics['candidates'][key] = metrics['candidates'].get(key, 0) + candidates
+    key = (function, outcome)
+    metrics['outcomes'][key] = metrics['outcomes'].get(key, 0) + 1
+    metrics['queries'][function] = metrics['queries'].get(function, 0) + 1
+    metrics['querySeconds'][function] = metrics['querySeconds'].get(function, 0.0) + trace[-1][2] - trace[0][2]
+    if queryBudget is not None and queryBudget.hit:
+        metrics['budgetHits'][function] = metrics['budgetHits'].get(function, 0) + 1
+
+
+
+def cacheLookup(townsDB, key):
+    #Returns a copy of the cached result for key (marking it most recently used), or None on a miss.
+    cache = townsDB.get('CACHE')
+    if cache is None:
+        return None
+    try:
+        result = cache['entries'][key]
+    except (KeyError, TypeError): #TypeError: unhashable entry
+        cache['misses'] += 1
+        return None
+    cache['entries'].move_to_end(key)
+    cache['hits'] += 1
+    return list(result)
+
+
+
+def cacheStore(townsDB, key, result):
+    #Stores a copy of result under key, evicting the least recently used results beyond maxSize.
+    cache = townsDB.get('CACHE')
+    if cache is None or cache['maxSize'] <= 0:
+        return
+    try:
+        cache['entries'][key] = list(result)
+    except TypeError: #unhashable entry, don't cache it
+        return
+    cache['entries'].move_to_end(key)
+    while len(cache['entries']) > cache['maxSize']:
+        cache['entries'].popitem(last=False)
+        cache['evictions'] += 1
+
+
+
+#==============================================================================
+#  SubFunctions      
+#==============================================================================
+def pickBestQuery(Query, StandardList, gammaParameter = 1.0, Verbose=False, scorer=None, scoreCutoff=0.0, returnIndex=False, prior=None, budget=None,
+                  keys=None, threshold=None):
+    #gammaParameter=1e1 #strength of population weighing, must be >=0, and recommend not going above 10 to minimise power-law error propogation
+    #prior (optional) is an array parallel to StandardList of town priors [0 -- 1] (see getTownPriors);
+    #candidates are ranked by score + gammaParameter*populationWeight*prior, while the returned
+    #score stays the plain matching score. gammaParameter=0 ranks by score only (ties -> first).
+    #threshold (optional): when any candidate's plain score reaches it, only those candidates are
+    #ranked, so the prior never picks a candidate below the threshold over one above it.
+    #scorer selects the scoring engine (see scoreEngines), default: defaultScorer
+    #scoreCutoff [0.0 -- 1.0] lets the engine drop candidates which cannot reach it early
+    #returnIndex=True appends the index of the match in StandardList ([match, score, index]),
+    #so callers don't need a StandardList.index() scan (which also picks the first of duplicates)
+    #budget (QueryBudget) scores StandardList in chunks of budgetChunkSize names, until it is spent.
+    #keys (optional) are the precomputed normalizeName keys of StandardList, which the engine
+    #compares with the normalized Query instead of re-processing every name (see scoreEngines).
+    candidates = scoreCandidates(Query, StandardList, scorer, scoreCutoff, Verbose, budget, keys)
+    if len(candidates) == 0:
+        return [None, 0.0, None] if returnIndex else [None, 0.0]
+    #Find the maximum weighed score and return best matching country:
+    scores = np.array([c[1] for c in candidates], dtype=np.float64)
+    passed = scores >= threshold if threshold is not None else None
+    if prior is not None and gammaParameter:
+        scores += gammaParameter*populationWeight*np.asarray(prior)[[c[2] for c in candidates]]
+    if passed is not None and passed.any():
+        scores[~passed] = -np.inf
+    maxIdx = int(np.argmax(scores))
+    if returnIndex:
+        return [candidates[maxIdx][0], candidates[maxIdx][1], candidates[maxIdx][2]]
+    return [candidates[maxIdx][0], candidates[maxIdx][1]]
+
+
+
+def scoreCandidates(Query, StandardList, scorer=None, scoreCutoff=0.0, Verbose=False, budget=None, keys=None):
+    #Scores Query against StandardList (and its normalized keys) with the scoring engine, returning its
+    #[match, score, index] candidates. A budget (QueryBudget) scores in chunks of budgetChunkSize names
+    #(at most the work left), until it is spent; names left unscored set its hit flag.
+    engine = scoreEngines[scorerName(scorer)]
+    if budget is None:
+        return engine(Query, StandardList, scoreCutoff, Verbose, keys)
+    candidates = []
+    start = 0
+    while start < len(StandardList) and not budget.spent():
+        remaining = budget.remainingWork()
+        end = start + (budgetChunkSize if remaining is None else min(budgetChunkSize, remaining))
+        chunk = StandardList[start:end]
+        chunkKeys = None if keys is None else keys[start:end]
+        candidates.extend([c[0], c[1], c[2]+start] for c in engine(Query, chunk, scoreCutoff, Verbose, chunkKeys))
+        budget.charge(len(chunk))
+        start = end
+    if start < len(StandardList):
+        budget.hit = True
+    return candidates
+
+
+
+def cutoffScore(Possibilities, lowestAllowedThreshold):
+    #scoreCutoff of the next pass of a matching cascade: only candidates which can still
+    #be returned (beating lowestAllowedThreshold and the best of the Possibilities so far)
+    return max([lowestAllowedThreshold] + [row[1] for row in Possibilities])
+
+
+
+class QueryBudget:
+    '''Time and/or work budget of a single query: seconds of wall-clock time 
+    and/or work, the number of candidate names which may be scored. spent() 
+    tells if the budget ran out before the next step, and then sets hit, 
+    which records that the search was cut short. remainingWork() is the
+    number of names which may still be scored (None without a work budget).'''
+    __slots__ = ('deadline', 'work', 'hit')
+    def __init__(self, seconds=None, work=None):
+        self.deadline = time.perf_counter()+seconds if seconds != None else None
+        self.work = work
+        self.hit = False
+    def charge(self, n):
+        if self.work != None:
+            self.work -= n
+    def remainingWork(self):
+        return max(0, self.work) if self.work != None else None
+    def spent(self):
+        if (self.work != None and self.work <= 0) or (self.deadline != None and time.perf_counter() >= self.deadline):
+            self.hit = True
+        return self.hit
+
+
+
+def budgetResult(result, queryBudget):
+    #Return shape of a query: the result, or [result, budgetHit] when a budget was given.
+    if queryBudget is None:
+        return result
+    return [result, queryBudget.hit]
+
+
+
+def scorerName(scorer=None):
+    #Resolves a scorer argument (None = module default) into the name of a registered scoring engine.
+    if scorer == None:
+        return defaultScorer
+    if scorer not in scoreEngines:
+        raise ValueError('unknown scorer "{}", choose one of {}'.format(scorer, list(scoreEngines)))
+    return scorer
+
+
+
+def scoreFuzzywuzzy(Query, StandardList, scoreCutoff=0.0, Verbose=False, keys=None):
+    '''The v1.0 scoring engine: fuzzywuzzy (WRatio) picks the 10 best candidates,
+    which are then rescored with difflib (StrMatcher); score = WRatio*ratio.
+    The normalized keys are not used, so that scores stay those of v1.0.
+    Returns a list of [candidate, score, index into StandardList].'''
+    try:
+        candidates=process.extractBests(Query,dict(enumerate(StandardList)),limit=10,score_cutoff=int(100*scoreCutoff))
+    except:
+        return []
+    score=[]
+    for c in candidates:
+        if Verbose:
+            print('{} with {} probability'.format(c[0],c[1]))
+            print('{} with {} probability (weighed) & diflib'.format(c[0],c[1]*StrMatcher(Query,c[0])))
+        score.append([c[0], c[1]*(StrMatcher(Query,c[0])/100), c[2]])
+    return [s for s in score if s[1] >= scoreCutoff]
+
+
+
+def scoreRapidfuzz(Query, StandardList, scoreCutoff=0.0, Verbose=False, keys=None):
+    '''The fast scoring engine (needs the rapidfuzz package): a single vectorized
+    C pass computes WRatio over the whole StandardList, and the normalized InDel
+    ratio of the surviving candidates; score = WRatio*ratio as in scoreFuzzywuzzy.
+    As score <= WRatio, candidates with WRatio below scoreCutoff are dropped
+    without computing their ratio. With keys (the normalizeName keys of 
+    StandardList, precomputed at load time), both ratios compare the normalized
+    Query with the keys, so no name is re-processed per query. Returns a list
+    of [candidate, score, index].'''
+    if type(Query) is not str:
+        return []
+    if keys is None:
+        choices = [c if type(c) is str else '' for c in StandardList]
+        processor = rfUtils.default_process
+    else:
+        choices = keys if type(keys) is list else list(keys)
+        Query = normalizeName(Query)
+        processor = None
+    if len(choices) == 0:
+        return []
+    wRatio = rfProcess.cdist([Query], choices, scorer=rfFuzz.WRatio, processor=processor,
+                             score_cutoff=max(1e-3, 100*scoreCutoff))[0]
+    survivors = np.flatnonzero(wRatio)
+    if len(survivors) == 0:
+        return []
+    ratio = rfProcess.cdist([Query], [choices[i] for i in survivors], scorer=rfFuzz.ratio)[0]
+    score = wRatio[survivors].astype(np.float64) * ratio / 1e4
+    keep = np.flatnonzero(score >= scoreCutoff)
+    if Verbose:
+        for i in keep[np.argsort(-score[keep])][:10]:
+            print('{} with {} probability (weighed)'.format(StandardList[survivors[i]], score[i]))
+    return [[StandardList[survivors[i]], float(score[i]), int(survivors[i])] for i in keep]
+
+
+
+#Registered scoring engines of pickBestQuery (name -> engine). The fast engine is the 
+#default when rapidfuzz is installed. Compared with the v1.0 'fuzzywuzzy' engine, 
+#'rapidfuzz' scores every candidate (not only WRatio's top 10), and it replaces 
+#difflib's Ratcliff/Obershelp ratio with the InDel (longest common subsequence) ratio.
+#The InDel ratio is never lower than difflib's, and WRatio is not rounded to an integer.
+#Exact matches score 1.0 with both. 'rapidfuzz' compares normalized keys (see normalizeName),
+#so case, accents and punctuation no longer lower a score. For names the two scores typically agree to within
+#+-0.01 (e.g. 'Frnce'->'France' 0.827 vs 0.826, 'Britin'->'Britain' 0.849 vs 0.852),
+#so the default thresholds (0.95 / 0.65) accept practically the same matches.
+scoreEngines = {'fuzzywuzzy':scoreFuzzywuzzy}
+normalizedScorers = set() #engines whose scores depend on the normalized query only (see cacheEntryKey)
+if rfProcess != None:
+    scoreEngines['rapidfuzz'] = scoreRapidfuzz
+    normalizedScorers.add('rapidfuzz')
+    defaultScorer = 'rapidfuzz'
+else:
+    defaultScorer = 'fuzzywuzzy'
+                
+
+
+def batchKey(entry):
+    '''batchKey maps a raw query entry onto the key used to de-duplicate batch
+    queries (capFix applied, surrounding white-space removed). Missing entries
+    (None, nan, 'nan', non-strings) map to None.'''
+    if type(entry) is not str or entry == 'nan' or entry.strip() == '':
+        return None
+    return capFix(entry.strip())
+
+
+
+def nGrams(strs, n=ngramSize):
+    '''nGrams returns the set of lower-case character n-grams of a string. The
+    string is padded with a space either side, so that word starts and ends
+    carry their own n-grams.'''
+    strs = ' {} '.format(strs.lower())
+    return set(strs[i:i+n] for i in range(len(strs)-n+1))
+
+
+
+def buildNameTable(TOWNS):
+    '''buildNameTable takes the country-specific DICT of town listings (townsDB['TOWNS'])
+    and compiles the global name table of queryCityName: every TownName and Alias
+    of every country is an entry. The entry tables are parallel lists (name, key,
+    countryID, field, position) where key is the normalized name (see
+    normalizeName) and position is the index of the name in
+    townsDB['TOWNS'][countryID][field], and townIdx (array) is the index of the
+    town the name belongs to. 'countryRange' maps a countryID to the (start, end)
+    range of its entries.'''
+    names = []
+    keys = []
+    countryID = []
+    field = []
+    position = []
+    townIdx = []
+    countryRange = {}
+    for coCode in TOWNS:
+        start = len(names)
+        for fieldName in ['TownName', 'Aliases']:
+            aliasIndex = TOWNS[coCode]['AliasIndex']
+            fieldKeys = TOWNS[coCode].get(nameKeyColumns[fieldName])
+            if fieldKeys is None:
+                fieldKeys = normalizeNames(TOWNS[coCode][fieldName])
+            for i, name in enumerate(TOWNS[coCode][fieldName]):
+                if type(name) is not str: #skip missing names (None/nan)
+                    continue
+                names.append(name)
+                keys.append(fieldKeys[i])
+                countryID.append(coCode)
+                field.append(fieldName)
+                position.append(i)
+                townIdx.append(i if fieldName == 'TownName' else aliasIndex[i])
+        countryRange[coCode] = (start, len(names))
+    return {'name':names, 'key':keys, 'countryID':countryID, 'field':field, 'position':position,
+            'townIdx':np.array(townIdx, dtype=np.int32), 'countryRange':countryRange}
+
+
+
+def buildNgramIndex(TOWNS, n=ngramSize):
+    '''buildNgramIndex takes the country-specific DICT of town listings (townsDB['TOWNS'])
+    and compiles an inverted n-gram index over the global name table (see
+    buildNameTable), which it extends. 'postings' maps an n-gram of the normalized
+    names to an array of the entries containing it.'''
+    nameTable = buildNameTable(TOWNS)
+    gramCount = []
+    postings = {}
+    for entry, key in enumerate(nameTable['key']):
+        grams = nGrams(key, n)
+        gramCount.append(len(grams))
+        for g in grams:
+            postings.setdefault(g, []).append(entry)
+    for g in postings:
+        postings[g] = np.array(postings[g], dtype=np.int32)
+    nameTable.update({'n':n, 'gramCount':np.array(gramCount, dtype=np.int32), 'postings':postings})
+    return nameTable
+
+
+
+def getNgramIndex(townsDB):
+    #Returns the n-gram index of the dataset (built on first use), or None if loadDB was called with ngramIndex=False.
+    if townsDB.get('NGRAM') is None and townsDB.get('OPTIONS',{}).get('ngramIndex'):
+        townsDB['NGRAM'] = buildNgramIndex(townsDB['TOWNS'])
+    return townsDB.get('NGRAM')
+
+
+
+def getNameTable(townsDB):
+    #Returns the global name table: the n-gram index if there is one, otherwise the
+    #plain name table (built on first use).
+    ngramIndex = getNgramIndex(townsDB)
+    if ngramIndex is not None:
+        return ngramIndex
+    if townsDB.get('NAMES') is None:
+        townsDB['NAMES'] = buildNameTable(townsDB['TOWNS'])
+    return townsDB['NAMES']
+
+
+
+def getNamePriors(townsDB):
+    #Returns the priors of the entries of the global name table (the prior of the town each name belongs to).
+    nameTable = getNameTable(townsDB)
+    if 'prior' not in nameTable:
+        prior = np.zeros(len(nameTable['name']), dtype=np.float32)
+        for coCode, (start, end) in nameTable['countryRange'].items():
+            prior[start:end] = getTownPriors(townsDB, coCode)[nameTable['townIdx'][start:end]]
+        nameTable['prior'] = prior
+    return nameTable['prior']
+
+
+
+def nameTableResult(townsDB, entry, score):
+    #The queryCityName result of a matched entry of the global name table: [TownName, score, townIdx, countryID],
+    #with the matched alias appended for an Alias match.
+    nameTable = getNameTable(townsDB)
+    coCode = nameTable['countryID'][entry]
+    townIdx = int(nameTable['townIdx'][entry])
+    result = [townsDB['TOWNS'][coCode]['TownName'][townIdx], score, townIdx, coCode]
+    if nameTable['field'][entry] == 'Aliases':
+        result.append(nameTable['name'][entry])
+    return result
+
+
+
+def ngramCandidates(Query, ngramIndex, limit=ngramCandidateLimit, returnSimilarity=False):
+    '''ngramCandidates returns the entries of the n-gram index which share the
+    most n-grams with the Query (ranked by Jaccard similarity of n-gram sets),
+    at most limit of them, in ascending entry order. returnSimilarity=True also
+    returns their Jaccard similarities: (entries, jaccard).'''
+    grams = nGrams(normalizeName(Query), ngramIndex['n'])
+    hits = [ngramIndex['postings'][g] for g in grams if g in ngramIndex['postings']]
+    if len(hits) == 0:
+        entries = np.array([], dtype=np.int32)
+        return (entries, np.zeros(0)) if returnSimilarity else entries
+    entries, shared = np.unique(np.concatenate(hits), return_counts=True)
+    jaccard = shared / (len(grams) + ngramIndex['gramCount'][entries] - shared)
+    if len(entries) > limit:
+        best = np.sort(np.argpartition(-jaccard, limit-1)[:limit])
+        entries, jaccard = entries[best], jaccard[best]
+    return (entries, jaccard) if returnSimilarity else entries
+
+
+
+def citySearchSpace(CityEntry, townsDB, limit=ngramCandidateLimit, gammaParameter=1.0, countryHint=None, budget=None):
+    '''citySearchSpace returns the entries of the global name table (see getNameTable)
+    the single pass of queryCityName scores, in the order it scores them. If the
+    n-gram index is loaded, only its candidates (and the typo candidates, see
+    typoCandidates) are returned, ordered by n-gram similarity plus the town prior
+    (when gammaParameter > 0), so that the most likely towns are scored first if
+    a budget runs out. Otherwise every entry is returned, in countryPriority 
+    order, or None (the whole table, in its own order) when there is neither a
+    budget nor a countryHint to order by. Either way, the countries of countryHint (countryID or list of them) come first.'''
+    hint = [countryHint] if type(countryHint) == str else list(countryHint or [])
+    ngramIndex = getNgramIndex(townsDB)
+    if ngramIndex is None:
+        if budget is None and not hint:
+            return None
+        nameTable = getNameTable(townsDB)
+        return np.concatenate([np.arange(*nameTable['countryRange'][coCode]) for coCode in countryPriority(townsDB, hint)] +
+                              [np.array([], dtype=np.int64)])
+    entries, jaccard = ngramCandidates(CityEntry, ngramIndex, limit, returnSimilarity=True)
+    typoIndex = getTypoIndex(townsDB, 'TOWNS')
+    if typoIndex is not None: #names within the edit distance or sounding alike, whatever their n-grams
+        typos = np.setdiff1d(typoCandidates(CityEntry, typoIndex)[0], entries)
+        entries, jaccard = np.concatenate([entries, typos]), np.concatenate([jaccard, np.ones(len(typos))])
+    if gammaParameter:
+        jaccard = jaccard + gammaParameter*populationWeight*getNamePriors(townsDB)[entries]
+    hinted = np.array([hint.index(ngramIndex['countryID'][e]) if ngramIndex['countryID'][e] in hint else len(hint) for e in entries],
+                      dtype=np.int64)
+    return entries[np.lexsort((-jaccard, hinted))]
+
+
+
+def deleteVariants(key, distance=1, prefixLength=None):
+    '''deleteVariants returns the set of strings obtained by deleting up to
+    distance characters from key (the key itself included), as in SymSpell. Two
+    keys within edit distance distance of each other share at least one 
+    variant. With prefixLength, only the first prefixLength characters are 
+    used, which bounds the number of variants of long names.'''
+    if prefixLength != None:
+        key = key[:prefixLength]
+    variants = {key}
+    frontier = {key}
+    for d in range(distance):
+        frontier = {v[:i] + v[i+1:] for v in frontier for i in range(len(v))}
+        variants |= frontier
+    return variants
+
+
+
+def soundex(key):
+    '''soundex returns the American Soundex code (letter + 3 digits) of a
+    normalized name (see normalizeName), spaces and non-letters ignored, e.g.
+    'britain' -> 'B635'. Returns '' if the name has no letter a-z.'''
+    letters = [c for c in key if 'a' <= c <= 'z']
+    if len(letters) == 0:
+        return ''
+    code = letters[0].upper()
+    previous = soundexDigits.get(letters[0], '')
+    for c in letters[1:]:
+        digit = soundexDigits.get(c, '')
+        if digit != '' and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if c not in 'hw': #h & w don't separate letters with the same code
+            previous = digit
+    return (code + '000')[:4]
+
+
+
+def osaDistance(a, b, maxDistance):
+    #Optimal string alignment distance (Levenshtein + adjacent transpositions) of a and b,
+    #or maxDistance+1 as soon as it is known to exceed maxDistance.
+    if abs(len(a) - len(b)) > maxDistance:
+        return maxDistance + 1
+    previous2 = None
+    previous = list(range(len(b)+1))
+    for i in range(1, len(a)+1):
+        current = [i] + [0]*len(b)
+        for j in range(1, len(b)+1):
+            current[j] = min(previous[j]+1, current[j-1]+1, previous[j-1] + (a[i-1] != b[j-1]))
+            if i > 1 and j > 1 and a[i-1] == b[j-2] and a[i-2] == b[j-1]:
+                current[j] = min(current[j], previous2[j-2]+1)
+        if min(current) > maxDistance:
+            return maxDistance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+
+def typoDistance(key, maxDistance):
+    #Edit distance allowed for a typo of key: none up to 3 characters, 1 up to 6, then 2 (at most maxDistance)
+    return min(maxDistance, max(0, (len(key)-1)//3))
+
+
+
+def groupMembers(groups, members):
+    #Groups members by their group code (0..n-1): returns (starts, grouped), the members of
+    #group g being grouped[starts[g]:starts[g+1]] (in their original order).
+    groups = np.asarray(groups, dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(np.bincount(groups))]) if len(groups) else np.zeros(1, dtype=np.int64)
+    return starts, np.asarray(members, dtype=np.int32)[np.argsort(groups, kind='stable')]
+
+
+
+def buildTypoIndex(keys, distance=1, prefixLength=None):
+    '''buildTypoIndex compiles the typo-tolerant blocking indexes of a list of
+    normalized names (keys). The distinct keys ('keys', their positions grouped
+    in 'positions' by keyStarts) are indexed by their delete variants (see
+    deleteVariants; 'deletes' maps a variant to its group of key ids in 
+    'deleteKeys') and by their Soundex code ('soundex' -> 'soundexKeys').'''
+    keyCodes, uniqueKeys = pd.factorize(pd.Series(list(keys), dtype=object))
+    uniqueKeys = list(uniqueKeys)
+    keyStarts, positions = groupMembers(keyCodes, np.arange(len(keyCodes)))
+    variants, variantKeys, codes = [], [], []
+    for keyID, key in enumerate(uniqueKeys):
+        if key == '':
+            continue
+        keyVariants = deleteVariants(key, distance, prefixLength)
+        variants.extend(keyVariants)
+        variantKeys.extend([keyID]*len(keyVariants))
+        codes.append(soundex(key))
+    variantCodes, uniqueVariants = pd.factorize(pd.Series(variants, dtype=object))
+    soundexCodes, uniqueSoundex = pd.factorize(pd.Series(codes, dtype=object))
+    return {'distance':distance, 'prefixLength':prefixLength, 'keys':uniqueKeys, 'keyLengths':np.array([len(k) for k in uniqueKeys]),
+            'keyStarts':keyStarts, 'positions':positions,
+            'deletes':dict(zip(uniqueVariants, range(len(uniqueVariants)))), 'deleteKeys':groupMembers(variantCodes, variantKeys),
+            'soundex':dict(zip(uniqueSoundex, range(len(uniqueSoundex)))),
+            'soundexKeys':groupMembers(soundexCodes, [k for k in range(len(uniqueKeys)) if uniqueKeys[k] != ''])}
+
+
+
+def getTypoIndex(townsDB, kind):
+    '''getTypoIndex returns (building it on first use) the typo index of the
+    towns (kind='TOWNS': the entries of the global name table, see 
+    getNameTable, with edit distance townTypoDistance) or of the country names
+    and country aliases (kind='COUNTRIES', countryTypoDistance), or None if
+    loadDB was called with typoIndex=False.'''
+    if not townsDB.get('OPTIONS', {}).get('typoIndex'):
+        return None
+    typoIndexes = townsDB.setdefault('TYPO', {})
+    if kind not in typoIndexes:
+        if kind == 'TOWNS':
+            typoIndexes[kind] = buildTypoIndex(getNameTable(townsDB)['key'], townTypoDistance, typoPrefixLength)
+        else:
+            index = buildTypoIndex(townsDB['COUNTRIES']['countryKey'] + townsDB['COUNTRY_ALIAS']['countryAliasKey'], countryTypoDistance)
+            index['name'] = townsDB['COUNTRIES']['country'] + townsDB['COUNTRY_ALIAS']['countryAlias']
+            index['nameKey'] = townsDB['COUNTRIES']['countryKey'] + townsDB['COUNTRY_ALIAS']['countryAliasKey']
+            index['countryID'] = townsDB['COUNTRIES']['id2c'] + townsDB['COUNTRY_ALIAS']['countryID']
+            typoIndexes[kind] = index
+    return typoIndexes[kind]
+
+
+
+def typoCandidates(Query, typoIndex):
+    '''typoCandidates returns the positions of the names of a typo index within
+    the allowed edit distance of the Query (see typoDistance; verified, so 
+    prefix-only hits are dropped), and those sharing its Soundex code if there
+    are at most typoCandidateLimit of them: (positions, withinDistance) arrays,
+    positions ascending.'''
+    queryKey = normalizeName(Query)
+    distance = typoDistance(queryKey, typoIndex['distance'])
+    starts, keyIDs = typoIndex['deleteKeys']
+    codes = [typoIndex['deletes'].get(variant) for variant in deleteVariants(queryKey, distance, typoIndex['prefixLength'])]
+    hits = [keyIDs[starts[code]:starts[code+1]] for code in codes if code != None]
+    hits = np.unique(np.concatenate(hits)) if hits else np.array([], dtype=np.int32)
+    #with a prefixLength, names only sharing a prefix with the query (e.g. 'saint ...') are hits too:
+    hits = hits[np.abs(typoIndex['keyLengths'][hits] - len(queryKey)) <= distance]
+    if rfOSA != None and len(hits) > 0:
+        distances = rfProcess.cdist([queryKey], [typoIndex['keys'][k] for k in hits.tolist()], scorer=rfOSA.distance,
+                                    score_cutoff=distance)[0]
+        hits = hits[distances <= distance]
+    else:
+        hits = [k for k in hits.tolist() if osaDistance(queryKey, typoIndex['keys'][k], distance) <= distance]
+    found = {keyID:True for keyID in np.asarray(hits).tolist()}
+    code = typoIndex['soundex'].get(soundex(queryKey))
+    if code != None:
+        starts, keyIDs = typoIndex['soundexKeys']
+        keyIDs = keyIDs[starts[code]:starts[code+1]]
+        keyStarts = typoIndex['keyStarts']
+        if 0 < (keyStarts[keyIDs+1] - keyStarts[keyIDs]).sum() <= typoCandidateLimit:
+            for keyID in keyIDs.tolist():
+                found.setdefault(keyID, False)
+    keyStarts, positions = typoIndex['keyStarts'], typoIndex['positions']
+    groups = [positions[keyStarts[keyID]:keyStarts[keyID+1]] for keyID in found]
+    if len(groups) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=bool)
+    within = np.concatenate([np.full(len(group), found[keyID]) for keyID, group in zip(found, groups)])
+    positions = np.concatenate(groups).astype(np.int64)
+    order = np.argsort(positions)
+    return positions[order], within[order]
+
+
+
+def typoCountryMatch(CountryEntry, townsDB, scorer=None, Verbose=False, budget=None):
+    #The typo stage of queryCountryName: the best scored of the country names & aliases within the
+    #allowed edit distance or sounding alike (see typoCandidates) -> ([countryID, score], withinDistance,
+    #number of candidates), or (None, False, 0) if there is none.
+    typoIndex = getTypoIndex(townsDB, 'COUNTRIES')
+    if typoIndex is None:
+        return None, False, 0
+    positions, within = typoCandidates(CountryEntry, typoIndex)
+    if len(positions) == 0:
+        return None, False, 0
+    candidates = scoreCandidates(CountryEntry, [typoIndex['name'][p] for p in positions], scorer, 0.0, Verbose, budget,
+                                 [typoIndex['nameKey'][p] for p in positions])
+    if len(candidates) == 0:
+        return None, False, len(positions)
+    best = max(candidates, key=lambda c: (c[1], -c[2]))
+    return [typoIndex['countryID'][positions[best[2]]], best[1]], bool(within[best[2]]), len(positions)
+
+
+
+def typoCityMatch(CityEntry, townsDB, countryID=None, threshold = 0.95, lowestAllowedThreshold = 0.65, gammaParameter=1.0, scorer=None,
+                  Verbose=False, budget=None):
+    #The typo stage of queryCityName: the names of the global name table (of countryID only, if given) 
+    #within the allowed edit distance of CityEntry or sounding alike (see typoCandidates) are scored,
+    #and picked as the full pass would (TownName, then Alias passing the threshold, by score + prior);
+    #failing that, the best name within the edit distance if it beats lowestAllowedThreshold. 
+    #Returns (result or None, number of candidates); None lets the full search run.
+    if countryID != None and isinstance(townsDB['TOWNS'], LazyTowns) and 'TOWNS' not in townsDB.get('TYPO', {}):
+        return None, 0 #don't load every country to search a single one
+    typoIndex = getTypoIndex(townsDB, 'TOWNS')
+    if typoIndex is None:
+        return None, 0
+    nameTable = getNameTable(townsDB)
+    positions, within = typoCandidates(CityEntry, typoIndex)
+    if countryID != None and len(positions) > 0:
+        start, end = nameTable['countryRange'].get(countryID, (0, 0))
+        keep = (positions >= start) & (positions < end)
+        positions, within = positions[keep], within[keep]
+    if len(positions) == 0:
+        return None, 0
+    candidates = scoreCandidates(CityEntry, [nameTable['name'][p] for p in positions], scorer, lowestAllowedThreshold, Verbose, budget,
+                                 [nameTable['key'][p] for p in positions])
+    if len(candidates) == 0:
+        return None, len(positions)
+    matched = positions[[c[2] for c in candidates]]
+    scores = np.array([c[1] for c in candidates], dtype=np.float64)
+    weighed = scores + gammaParameter*populationWeight*getNamePriors(townsDB)[matched]
+    isAlias = np.array([nameTable['field'][e] == 'Aliases' for e in matched])
+    isWithin = within[[c[2] for c in candidates]]
+    for select in [~isAlias & (scores >= threshold), isAlias & (scores >= threshold), isWithin & (scores > lowestAllowedThreshold)]:
+        if select.any():
+            best = int(np.argmax(np.where(select, weighed, -np.inf)))
+            return nameTableResult(townsDB, int(matched[best]), float(scores[best])), len(positions)
+    return None, len(positions)
+
+
+
+def countryPriority(townsDB, countryHint=None):
+    '''countryPriority returns the countryIDs of townsDB['TOWNS'] in the order a 
+    full scan searches them: the countries of countryHint (countryID or list of
+    them) first, then by how often queryCityName matched a town in the country
+    so far (townsDB['MATCH_COUNTS']), then by the country's population.'''
+    hint = [countryHint] if type(countryHint) == str else list(countryHint or [])
+    matchCounts = townsDB.get('MATCH_COUNTS', {})
+    population = dict(zip(townsDB['COUNTRIES']['id2c'], townsDB['COUNTRIES']['population']))
+    def priority(coCode):
+        return (hint.index(coCode) if coCode in hint else len(hint), -matchCounts.get(coCode, 0), -(population.get(coCode) or 0))
+    return sorted(townsDB['TOWNS'], key=priority)
+
+
+
+def buildTownPriors(Towns):
+    '''buildTownPriors returns the prior [0 -- 1] of every town of one country (an
+    array parallel to TownName): the mean of the log-population (10 million
+    inhabitants -> 1) and the TownClass prior (see townClassPriors). Towns
+    without a Population or TownClass get 0 for that part.'''
+    population = Towns['Population']
+    population = np.asarray(population.values if isinstance(population, NumericColumn) else population, dtype=np.float64)
+    population = np.where(np.isfinite(population) & (population > 0), population, 0)
+    classPrior = np.array([townClassPriors.get(c, 0.0) for c in Towns['TownClass']], dtype=np.float64)
+    return ((np.minimum(np.log10(1+population)/7, 1) + classPrior)/2).astype(np.float32)
+
+
+
+def getTownPriors(townsDB, coCode, positions=None):
+    #Returns the town priors of a country (built on first use), or only those at positions.
+    if coCode not in townsDB.setdefault('PRIORS', {}):
+        townsDB['PRIORS'][coCode] = buildTownPriors(townsDB['TOWNS'][coCode])
+    if positions is None:
+        return townsDB['PRIORS'][coCode]
+    return townsDB['PRIORS'][coCode][np.asarray(positions, dtype=np.int64)]
+
+
+
+def getTownKeys(townsDB, coCode, column):
+    #Returns the normalized name keys of a country ('TownKey' or 'AliasKey') as a list, decoded
+    #on first use (a memory-mapped StringColumn would otherwise be decoded by every query),
+    #or None if the table has no key column.
+    cached = townsDB.setdefault('KEYS', {})
+    if (coCode, column) not in cached:
+        keys = townsDB['TOWNS'][coCode].get(column)
+        cached[(coCode, column)] = keys if keys is None or type(keys) is list else list(keys)
+    return cached[(coCode, column)]
+
+
+
+def getAliasPriors(townsDB, coCode, positions=None):
+    #Returns the priors of a country's Aliases (the prior of the town each alias belongs to).
+    aliasIndex = townsDB['TOWNS'][coCode]['AliasIndex']
+    if isinstance(aliasIndex, NumericColumn):
+        townIdx = aliasIndex.values if positions is None else aliasIndex.values[np.asarray(positions, dtype=np.int64)]
+    else:
+        townIdx = aliasIndex if positions is None else [aliasIndex[p] for p in positions]
+    return getTownPriors(townsDB, coCode)[np.asarray(townIdx, dtype=np.int64)]
+
+
+
+earthRadiusKM = 6371.0088    #mean Earth radius
+spatialCellDeg = 0.5         #size of the spatial grid cells (degrees)
+spatialBatchSize = 4096      #number of locations searched at once by spatialSearch
+
+
+
+def buildSpatialIndex(TOWNS, cellDeg=spatialCellDeg):
+    '''buildSpatialIndex builds a latitude/longitude grid index over the towns of
+    all countries (towns without coordinates are left out). The towns are sorted
+    by grid cell, and cellStart[c] is the position of the first town of cell c
+    (cells are numbered latRow*nLon + lonColumn), so every grid row segment is a
+    contiguous slice of the sorted arrays.'''
+    lat, lon, country, townIdx = [], [], [], []
+    countries = list(TOWNS)
+    for c, coCode in enumerate(countries):
+        latitude = TOWNS[coCode]['Latitude']
+        longitude = TOWNS[coCode]['Longitude']
+        latitude = np.asarray(latitude.values if isinstance(latitude, NumericColumn) else latitude, dtype=np.float64)
+        longitude = np.asarray(longitude.values if isinstance(longitude, NumericColumn) else longitude, dtype=np.float64)
+        valid = np.flatnonzero(np.isfinite(latitude) & np.isfinite(longitude))
+        lat.append(latitude[valid])
+        lon.append(longitude[valid])
+        country.append(np.full(len(valid), c, dtype=np.int32))
+        townIdx.append(valid.astype(np.int64))
+    lat = np.concatenate(lat) if lat else np.zeros(0)
+    lon = np.concatenate(lon) if lon else np.zeros(0)
+    nLat = int(np.ceil(180/cellDeg))
+    nLon = int(np.ceil(360/cellDeg))
+    cell = spatialRow(lat, cellDeg, nLat)*nLon + spatialColumn(lon, cellDeg, nLon)
+    order = np.argsort(cell, kind='stable')
+    return {'cellDeg':cellDeg, 'nLat':nLat, 'nLon':nLon, 'countries':countries,
+            'lat':np.radians(lat[order]), 'lon':np.radians(lon[order]),
+            'country':np.concatenate(country)[order] if country else np.zeros(0, dtype=np.int32),
+            'townIdx':np.concatenate(townIdx)[order] if townIdx else np.zeros(0, dtype=np.int64),
+            'cellStart':np.searchsorted(cell[order], np.arange(nLat*nLon+1))}
+
+
+
+def spatialRow(lat, cellDeg, nLat):
+    return np.clip(np.floor((lat+90)/cellDeg).astype(np.int64), 0, nLat-1)
+
+
+
+def spatialColumn(lon, cellDeg, nLon):
+    return np.floor(((lon+180) % 360)/cellDeg).astype(np.int64) % nLon
+
+
+
+def getSpatialIndex(townsDB):
+    #Returns the spatial index of the dataset (built on the first reverseGeocode call).
+    if townsDB.get('SPATIAL') is None:
+        townsDB['SPATIAL'] = buildSpatialIndex(townsDB['TOWNS'])
+    return townsDB['SPATIAL']
+
+
+
+def haversineKM(lat1, lon1, lat2, lon2):
+    #Great-circle distance (km) between points given in radians (NumPy arrays)
+    a = np.sin((lat2-lat1)/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin((lon2-lon1)/2)**2
+    return 2*earthRadiusKM*np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+
+def spatialSearch(index, lat, lon, k=1, radiusKM=None):
+    '''spatialSearch is the vectorized search of reverseGeocode. lat/lon are arrays
+    of locations (degrees). Each location first searches the 3x3 grid cells around
+    it; the searched block of cells keeps growing for the locations where a closer
+    town could still lie outside the block (the distance to the block's edges is a
+    lower bound for any town outside it). Returns arrays (query, position in the
+    index, distanceKM, rank), sorted by query and distance.'''
+    out = ([], [], [], [])
+    for b in range(0, len(lat), spatialBatchSize):
+        batch = spatialSearchBatch(index, lat[b:b+spatialBatchSize], lon[b:b+spatialBatchSize], k, radiusKM)
+        out[0].append(batch[0]+b)
+        for i in range(1, 4):
+            out[i].append(batch[i])
+    if len(out[0]) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64)
+    return tuple(np.concatenate(o) for o in out)
+
+
+
+def spatialSearchBatch(index, lat, lon, k, radiusKM):
+    #spatialSearch of one batch of locations
+    cellDeg, nLat, nLon = index['cellDeg'], index['nLat'], index['nLon']
+    valid = np.isfinite(lat) & np.isfinite(lon)
+    latQ = np.where(valid, lat, 0.0)
+    lonQ = np.where(valid, lon, 0.0)
+    row = spatialRow(latQ, cellDeg, nLat)
+    col = spatialColumn(lonQ, cellDeg, nLon)
+    latRad, lonRad = np.radians(latQ), np.radians(lonQ)
+    results = []
+    pending = np.flatnonzero(valid)
+    r = 1 #half-width (in grid rows) of the searched block
+    while len(pending):
+        #block of rows [row-r, row+r] and, per location, columns [col-R, col+R] (R wider towards the poles)
+        rowLo = np.maximum(row[pending]-r, 0)
+        rowHi = np.minimum(row[pending]+r, nLat-1)
+        maxLat = np.maximum(np.abs(rowLo*cellDeg-90), np.abs((rowHi+1)*cellDeg-90))
+        R = np.ceil(r/np.maximum(np.cos(np.radians(np.minimum(maxLat, 90))), 1e-3)).astype(np.int64)
+        fullRow = 2*R+1 >= nLon
+        #lower bound of the distance to any town outside the block:
+        south = np.where(rowLo > 0, latQ[pending] - (rowLo*cellDeg-90), np.inf)
+        north = np.where(rowHi < nLat-1, ((rowHi+1)*cellDeg-90) - latQ[pending], np.inf)
+        lonQdeg = (lonQ[pending]+180) % 360
+        dLon = np.minimum(lonQdeg - (col[pending]-R)*cellDeg, (col[pending]+R+1)*cellDeg - lonQdeg)
+        east = earthRadiusKM*np.arcsin(np.clip(np.cos(latRad[pending])*np.sin(np.radians(np.minimum(dLon, 90))), 0, 1))
+        guaranteed = np.minimum(earthRadiusKM*np.radians(np.minimum(south, north)), np.where(fullRow, np.inf, east))
+        #contiguous slices [start, end) of the sorted towns, per location and block row:
+        nRows = rowHi - rowLo + 1
+        q = np.repeat(np.arange(len(pending)), nRows)
+        rows = rowLo[q] + (np.arange(len(q)) - np.repeat(np.cumsum(nRows)-nRows, nRows))
+        lo = np.where(fullRow[q], 0, col[pending][q] - R[q])
+        hi = np.where(fullRow[q], nLon-1, col[pending][q] + R[q])
+        slices = []
+        for sliceLo, sliceHi in [(np.maximum(lo, 0), np.minimum(hi, nLon-1)),          #main segment
+                                 (np.where(lo < 0, lo+nLon, 0), np.where(lo < 0, nLon-1, -1)),   #wrapped west
+                                 (np.zeros_like(hi), np.where(hi >= nLon, hi-nLon, -1))]:               #wrapped east
+            keep = sliceHi >= sliceLo
+            slices.append((q[keep], index['cellStart'][rows[keep]*nLon+sliceLo[keep]], index['cellStart'][rows[keep]*nLon+sliceHi[keep]+1]))
+        sq = np.concatenate([s[0] for s in slices])
+        starts = np.concatenate([s[1] for s in slices])
+        lengths = np.concatenate([s[2] for s in slices]) - starts
+        cq = np.repeat(sq, lengths)
+        cpos = np.repeat(starts - (np.cumsum(lengths)-lengths), lengths) + np.arange(lengths.sum())
+        dist = haversineKM(latRad[pending][cq], lonRad[pending][cq], index['lat'][cpos], index['lon'][cpos])
+        if radiusKM != None:
+            inside = dist <= radiusKM
+            cq, cpos, dist = cq[inside], cpos[inside], dist[inside]
+        order = np.lexsort((dist, cq))
+        cq, cpos, dist = cq[order], cpos[order], dist[order]
+        first = np.searchsorted(cq, np.arange(len(pending)))
+        count = np.diff(np.append(first, len(cq)))
+        rank = np.arange(len(cq)) - first[cq]
+        #a location is done when no town outside the block can be closer than its answer:
+        if k != None:
+            kth = np.full(len(pending), np.inf)
+            kth[count >= k] = dist[first[count >= k]+k-1]
+            done = kth <= guaranteed
+        else:
+            done = np.zeros(len(pending), dtype=bool)
+        if radiusKM != None:
+            done |= guaranteed >= radiusKM
+        done |= np.isinf(guaranteed)
+        keep = done[cq] & ((rank < k) if k != None else True)
+        results.append((pending[cq[keep]], cpos[keep], dist[keep], rank[keep]))
+        pending = pending[~done]
+        r = 2*r+1
+    if len(results) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64)
+    queryID, pos, dist, rank = (np.concatenate(x) for x in zip(*results))
+    order = np.lexsort((dist, queryID))
+    return queryID[order], pos[order], dist[order], rank[order]
+
+
+
+def StrMatcher(str1, str2):
+    if type(str1) is list and type(str2) is list:
+        isList = True
+        if len(str1) != len(str2):
+            return -1 #input lists are not the same length
+    elif type(str1) is str and type(str2) is str:
+        #this is also fine
+        isList= False
+    else:
+        # argV have different types, so let's grow the string into a list of same length:
+        if type(str2) is str: #make str1 the small one, if it isn't, then perform swap:
+            temp=str2
+            str2=str1
+            str1=temp
+        temp=[]
+        for i in range(len(str2)):
+            temp.append(str1)
+        str1=temp #doing a soft copy here, as hard copy should not be needed
+        isList = True
+        #perform operations:
+    if isList:
+        OUTPUT=[]
+        for ii in range(len(str1)):
+            print('Length of str1 is {}'.format(len(str1)))
+            print('Length of str2 is {}'.format(len(str2)))
+            OUTPUT.append( difflib.SequenceMatcher(None, str1[ii],str2[ii]).ratio() )
+    else:
+        OUTPUT = difflib.SequenceMatcher(None, str1,str2).ratio()
+    return OUTPUT    
+    
+    
+    
+    
+    
+    
+    
+def CountryInfo(CountryCode, Verbose=False, session=None):
+    fullTable = 50 #the expected number of rows for a full table (50 rows per page)
+    #Allocate memory for the data lists:
+    Towns = {'TownIndex':[] ,'TownName':[], 'Country':[], 'AliasTownName':[],'Latitude':[],'Longitude':[],'Province':[],'County':[],'Address2':[],'TownClass':[],'Population':[]}
+    #
+    if session == None:
+        session = getScrapeSession()
+    pageNum = 0
+    while True:
+        if Verbose: print('page {}, i={}'.format(pageNum//fullTable+1,pageNum))
+        url='{}search.html?q=&country={}&startRow={}'.format(session.geonamesURL,CountryCode,pageNum)
+        website_url = session.get(url)
+        #parse the data; exit loop if     
+        page = parseTownsPage(website_url, Verbose)
+        for key in Towns:
+            Towns[key].extend(page[key])
+        iCaptured = len(page['TownIndex']) # number of rows captured
+        if iCaptured == fullTable: #Check if there is a full page of results, otherwise consider it final page
+            pageNum+=fullTable
+        else:   #last page, break out of parsing loop!
+            break
+    return Towns
+
+
+
+def parseTownsPage(website_url, Verbose=False):
+    '''parseTownsPage extracts the rows of the 'restable' results table of one
+    GeoNames search page (50 towns per page) in a single streaming pass (see
+    iterTableRows). Returns a DICT of lists, keyed as the output of CountryInfo.'''
+    numTabCols = 6
+    TownIndex = []
+    TownAliases = []
+    TownNames = []
+    TownPopulation = []
+    ProvinceAddress = []
+    CountyAddress = []
+    TownClass = []
+    TownLat = []
+    TownLon = []
+    CountryName = []
+    SubAddressName = []
+    parser = TableRowParser('restable')
+    for row in parser.rows(website_url):
+        if (row.nChildren == numTabCols): #ensure that there are the right number of Cols
+            #we will test that the zeroth column is a table row index (int)
+            try:
+                rowIdx=int(row.smalls[0])
+                if Verbose: print('table row {}:\n'.format(rowIdx))
+                goodRow = True
+            except:
+                if Verbose: print('header table entry, skipping...')
+                goodRow = False
+            if goodRow:
+                #Index:
+                TownIndex.append(rowIdx)
+                #City Name Alias:
+                try:
+                    TownAliases.append(str(row.smalls[1]) if row.smalls[1] != None else None)
+                except:
+                    if Verbose: print('Cannot parse Town index,setting to nan')    
+                    TownAliases.append(None)
+                #City/town Name Official:
+                try:
+                    TownNames.append(row.links[1].text)
+                except:
+                    if Verbose: print('Cannot parse Town index,setting to nan')    
+                    TownNames.append(None)
+                #Population
+                try:
+                    TownPopulation.append(int(row.smalls[3].split(' ')[-1].replace(',','')))
+                except:
+                    if Verbose: print('Cannot parse Town Population,setting to nan')    
+                    TownPopulation.append(None)
+                #Latitude:
+                try:
+                    TownLat.append(float(row.spans[1]))
+                except:
+                    if Verbose: print('Cannot parse Town Latitude,setting to nan')    
+                    TownLat.append(None)
+                #Longitude:
+                try:
+                    TownLon.append(float(row.spans[2]))
+                except:
+                    if Verbose: print('Cannot parse Town Longitude, setting to nan')    
+                    TownLon.append(None)
+                #Country:
+                try:
+                    CountryName.append(row.links[3].text)
+                except:
+                    if Verbose: print('Cannot parse Country Name, setting to nan')    
+                    CountryName.append(None)
+                #Address (Province):
+                try:
+                    ProvinceAddress.append(row.cells[2].getText(',').split(',')[2].strip())   #split index was -3, and was giving wrong results for lots of countries
+                except:
+                    if Verbose: print('Cannot parse Sub address, setting to nan')    
+                    ProvinceAddress.append(None)
+                #Address (County):
+                try:
+                    CountyAddress.append(row.cells[2].getText(',').split(',')[3].strip().split('>')[-1])
+                except:
+                    if Verbose: print('Cannot parse Sub address, setting to nan')    
+                    CountyAddress.append(None)
+                #Address 2:
+                try:
+                    SubAddressName.append(str(row.smalls[2]) if row.smalls[2] != None else None)
+                except:
+                    if Verbose: print('Cannot parse Sub address, setting to nan')    
+                    SubAddressName.append(None)
+                #Class
+                try:
+                    TownClass.append(str(row.cells[3].first) if row.cells[3].first != None else None)
+                except:
+                    if Verbose: print('Cannot parse Town index,setting to nan')    
+                    TownClass.append(None)
+                #End of parsing
+    if not parser.tableFound and Verbose: print('Table not found on page, skipping...')
+    return {'TownIndex':TownIndex ,'TownName':TownNames, 'Country':CountryName, 'AliasTownName':TownAliases,'Latitude':TownLat,'Longitude':TownLon,'Province':ProvinceAddress,'County':CountyAddress,'Address2':SubAddressName,'TownClass':TownClass,'Population':TownPopulation}
+
+
+
+TableCell = namedtuple('TableCell', ['texts', 'first', 'bolds'])
+TableCell.__doc__ = '''One <td> of a TableRow: texts are all text nodes inside the cell (in
+document order), first is its first child if that is a text node (else None),
+and bolds are the inner texts of the <b> elements inside it.'''
+TableCell.getText = lambda self, separator='': separator.join(self.texts)
+
+TableRow = namedtuple('TableRow', ['nChildren', 'cells', 'smalls', 'links', 'spans'])
+TableRow.__doc__ = '''One <tr> of a table, as yielded by TableRowParser.rows: nChildren is its
+number of direct child nodes (elements and text nodes), cells its <td> cells
+(TableCell), smalls/spans the first text child of each <small>/<span> in the
+row (None if the element doesn't start with text), and links its <a> elements
+(TableLink).'''
+
+TableLink = namedtuple('TableLink', ['text', 'title'])
+
+
+
+class TableRowParser(HTMLParser):
+    '''TableRowParser is a single-pass, streaming (SAX-style) extractor of the rows
+    of the first <table> whose class contains tableClass. No document tree is
+    built: rows() feeds the page in chunks and yields each TableRow as soon as
+    its </tr> is seen, and stops at the end of the table.'''
+    voidTags = ('br', 'img', 'hr', 'input', 'meta', 'link', 'wbr', 'col', 'source')
+    def __init__(self, tableClass):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.tableClass = tableClass
+        self.tableFound = False
+        self.tableDone = False
+        self.tableDepth = 0  #depth of nested tables inside the target table
+        self.completed = deque()
+        self.row = None
+        self.pending = []    #text chunks of the current text node
+    def inTable(self):
+        return self.tableFound and not self.tableDone and self.tableDepth == 0
+    def handle_starttag(self, tag, attrs):
+        self.flushText()
+        if tag == 'table':
+            if self.tableFound:
+                self.tableDepth += 1
+            elif self.tableClass in (dict(attrs).get('class') or '').split():
+                self.tableFound = True
+            return
+        if not self.inTable():
+            return
+        if tag == 'tr':
+            self.row = {'nChildren':0, 'cells':[], 'smalls':[], 'links':[], 'spans':[], 'open':[]}
+            return
+        if self.row == None:
+            return
+        row = self.row
+        if len(row['open']) == 0:
+            row['nChildren'] += 1
+        for parent in row['open']:   #an element starts the content of its parents
+            parent['firstSeen'] = True
+        if tag in self.voidTags:
+            return
+        element = {'tag':tag, 'texts':[], 'firstSeen':False, 'first':None, 'bolds':[], 'title':dict(attrs).get('title')}
+        row['open'].append(element)
+        for name, items in (('small','smalls'), ('span','spans'), ('a','links')):
+            if tag == name:
+                element['slot'] = len(row[items])
+                row[items].append(None)
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in self.voidTags:
+            self.handle_endtag(tag)
+    def handle_endtag(self, tag):
+        self.flushText()
+        if not self.tableFound or self.tableDone:
+            return
+        if tag == 'table':
+            if self.tableDepth > 0:
+                self.tableDepth -= 1
+            else:
+                self.tableDone = True
+                self.row = None
+            return
+        if self.tableDepth > 0 or self.row == None:
+            return
+        row = self.row
+        if tag == 'tr':
+            while row['open']:
+                self.closeElement(row['open'].pop())
+            self.completed.append(TableRow(row['nChildren'], row['cells'], row['smalls'], row['links'], row['spans']))
+            self.row = None
+            return
+        #close the innermost open element of this tag (and anything left open inside it)
+        for i in range(len(row['open'])-1, -1, -1):
+            if row['open'][i]['tag'] == tag:
+                while len(row['open']) > i:
+                    self.closeElement(row['open'].pop())
+                return
+    def closeElement(self, element):
+        row = self.row
+        tag = element['tag']
+        if tag == 'td':
+            row['cells'].append(TableCell(element['texts'], element['first'], element['bolds']))
+        elif tag == 'small':
+            row['smalls'][element['slot']] = element['first']
+        elif tag == 'span':
+            row['spans'][element['slot']] = element['first']
+        elif tag == 'a':
+            row['links'][element['slot']] = TableLink(''.join(element['texts']), element['title'])
+        elif tag == 'b':
+            for parent in row['open']:
+                if parent['tag'] == 'td':
+                    parent['bolds'].append(''.join(element['texts']))
+    def handle_data(self, data):
+        if self.row != None and self.inTable():
+            self.pending.append(data)
+    def flushText(self):
+        #a complete text node of the current row
+        if len(self.pending) == 0:
+            return
+        data = ''.join(self.pending)
+        self.pending = []
+        row = self.row
+        if row == None:
+            return
+        if len(row['open']) == 0:
+            row['nChildren'] += 1
+        for element in row['open']:
+            element['texts'].append(data)
+            if not element['firstSeen']:
+                element['firstSeen'] = True
+                element['first'] = data
+    def rows(self, html, chunkSize=65536):
+        #Feeds html to the parser in chunks and yields the TableRows of the table as they complete
+        for i in range(0, len(html), chunkSize):
+            self.feed(html[i:i+chunkSize])
+            while self.completed:
+                yield self.completed.popleft()
+            if self.tableDone:
+                return
+        self.close()
+        self.flushText()
+        while self.completed:
+            yield self.completed.popleft()
+
+
+
+def scrapeCountryTowns(CountryCode, PATH=dataBaseParentPath, session=None):
+    #Scrapes the towns table of one country (CountryInfo + AliasList), saves it as <CC>.json 
+    #and returns its scrape manifest entry (see countryManifestEntry)
+    Towns=CountryInfo(CountryCode, session=session)
+    #Compile Alias list & the normalized name keys (precomputed once, instead of at every load):
+    print('writing JSON file {}...'.format(CountryCode+'.json'))
+    return compileCountryFile(Towns, CountryCode, PATH)
+
+
+
+def countryManifestEntry(Towns, timestamp, sha1=None):
+    #Scrape manifest entry of a country: timestamp, sha1 of <CC>.json, number of towns and unique provinces.
+    #Towns is the towns DICT, or the file name of a <CC>.json file (read here)
+    if type(Towns) is str:
+        with open(Towns,'rb') as jsonHandle:
+            data = jsonHandle.read()
+        sha1 = hashlib.sha1(data).hexdigest()
+        Towns = json.loads(data.decode('utf-8'))
+    return {'timestamp':timestamp, 'sha1':sha1, 'rows':len(Towns['TownName']),
+            'provinces':list(pd.Series(Towns['Address2'], dtype=object).unique())}
+
+
+
+def compileCountryFile(Towns, CountryCode, PATH=dataBaseParentPath):
+    #Per-country transform of the compile stage (run in a worker process): completes a towns
+    #table (alias list of a raw GeoNames table, normalized name keys), saves it atomically as
+    #<CC>.json and returns its scrape manifest entry (see countryManifestEntry).
+    #Towns is the towns DICT, or a (zip file name, member name) pair to read it from.
+    if type(Towns) is tuple:
+        with zipfile.ZipFile(Towns[0],'r') as zip_ref:
+            with zip_ref.open(Towns[1]) as jsonHandle:
+                Towns = json.load(jsonHandle)
+    if 'AliasTownName' in Towns:
+        Aliases=AliasList(Towns['AliasTownName'])
+        Towns['Aliases'] = Aliases['Aliases']
+        Towns['AliasIndex'] = Aliases['Index']
+        del Towns['AliasTownName']
+    addNameKeys(Towns)
+    sha1 = writeJSON(Towns, '{}{}.json'.format(PATH,CountryCode))
+    return countryManifestEntry(Towns, time.time(), sha1)
+
+
+
+def compilePool(workers=8):
+    #Executor of the per-country compile jobs: at most one worker process per core, or a 
+    #single thread when that leaves one process (starting it would only add its start-up time).
+    #The workers are forked where the platform supports it (as parallelQueryNames), so scripts
+    #calling recompileDB need no __main__ guard. Elsewhere, spawned workers would re-run such a
+    #script, so the countries are compiled by a thread pool instead (the unpacking is mostly I/O).
+    workers = min(workers, os.cpu_count() or 1)
+    if workers <= 1:
+        return ThreadPoolExecutor(1)
+    if 'fork' in mp.get_all_start_methods():
+        return ProcessPoolExecutor(workers, mp_context=mp.get_context('fork'))
+    return ThreadPoolExecutor(workers)
+
+
+
+def extractArchiveMember(zip_ref, member, fileName):
+    #Streams one member of an open zip archive into fileName, atomically (temporary file + rename).
+    tempName = '{}.tmp{}'.format(fileName, os.getpid())
+    with zip_ref.open(member) as source, open(tempName,'wb') as file:
+        shutil.copyfileobj(source, file, 1<<20)
+    os.replace(tempName, fileName)
+
+
+
+def unpackArchive(zipName, PATH=dataBaseParentPath, workers=8):
+    '''unpackArchive compiles the dataset archive (zip) into PATH as a pipeline:
+    the towns table of every country (<CC>.json member) is read straight from
+    the zip, completed (see compileCountryFile) and saved by a pool of worker
+    processes, while the other members are streamed to disk. Every file is
+    written atomically. ProvinceDB.json & CountryAliasDB.json are not unpacked,
+    as recompileDB derives them. Returns the unique provinces of each country
+    {CC:[province,...]}, gathered as each country finishes, and the scraped
+    country aliases (None if the archive has none).'''
+    provinces = {}
+    CountryAliases = None
+    with zipfile.ZipFile(zipName,'r') as zip_ref, compilePool(workers) as executor:
+        jobs = {}
+        otherMembers = []
+        for member in zip_ref.namelist():
+            fileName = member.split('/')[-1]
+            if fileName == '' or not fileName.endswith('.json') or fileName in ['ProvinceDB.json', 'CountryAliasDB.json']:
+                continue
+            if len(fileName) == 7: #<CC>.json
+                jobs[executor.submit(compileCountryFile, (zipName, member), fileName[:2], PATH)] = fileName[:2]
+            else:
+                otherMembers.append(member)
+        #while the workers compile the countries:
+        for member in otherMembers:
+            fileName = member.split('/')[-1]
+            if fileName == 'CountryAliasDB_scraped.json': #small, keep it for step ::5:: of recompileDB
+                with zip_ref.open(member) as jsonHandle:
+                    CountryAliases = json.load(jsonHandle)
+                writeJSON(CountryAliases, '{}{}'.format(PATH,fileName))
+            else:
+                extractArchiveMember(zip_ref, member, '{}{}'.format(PATH,fileName))
+        for i, job in enumerate(as_completed(jobs)):
+            entry = job.result() #re-raise compile errors
+            provinces[jobs[job]] = entry['provinces']
+            print('{}/{} {}.json compiled: {} towns, {} unique provinces'.format(i+1, len(jobs), jobs[job], entry['rows'],
+                                                                                  len(entry['provinces'])))
+    return provinces, CountryAliases
+
+
+
+def writeProvinceDB(provinces, PATH=dataBaseParentPath):
+    #Saves ProvinceDB.json from the unique provinces of each country {CC:[province,...]} (countries in code order).
+    province = []
+    countryID = []
+    for CountryCode in sorted(provinces):
+        province += provinces[CountryCode]
+        countryID += [CountryCode]*len(provinces[CountryCode])
+    writeJSON({'province':province, 'countryID':countryID}, '{}ProvinceDB.json'.format(PATH))
+
+
+
+scrapeManifestName = 'ScrapeManifest.json'
+
+
+
+def loadScrapeManifest(PATH=dataBaseParentPath):
+    #Loads the scrape manifest of PATH (empty manifest if there is none yet).
+    if not os.path.isfile('{}{}'.format(PATH,scrapeManifestName)):
+        return {'countries':{}, 'files':{}}
+    with open('{}{}'.format(PATH,scrapeManifestName),'r') as JSONfile:
+        return json.loads(JSONfile.read())
+
+
+
+def saveScrapeManifest(manifest, PATH=dataBaseParentPath):
+    writeJSON(manifest, '{}{}'.format(PATH,scrapeManifestName))
+
+
+
+def isFreshEntry(entry, maxAge=None):
+    #True if a manifest entry exists and is younger than maxAge seconds (maxAge None: never stale)
+    return entry != None and (maxAge == None or time.time() - entry['timestamp'] <= maxAge)
+
+
+
+def writeJSON(obj, fileName):
+    '''writeJSON saves obj as JSON into fileName, atomically: the data is written
+    to a temporary file in the same directory, which then replaces fileName, so
+    readers (or a resumed scrape) never see a half-written file. Returns the sha1
+    hex digest of the written data.'''
+    data = json.dumps(obj).encode('utf-8')
+    tempName = '{}.tmp{}'.format(fileName, os.getpid())
+    with open(tempName,'wb') as file:
+        file.write(data)
+    os.replace(tempName, fileName)
+    return hashlib.sha1(data).hexdigest()
+
+
+
+def scrapeCountryAliases(COUNTRIES, session=None, workers=4):
+    #Scrapes alternative country names (other languages) from WikiPedia, returns DICT of countryAlias & countryID lists
+    if session == None:
+        session = getScrapeSession()
+    countryAliasList = []
+    countryID =[]
+    #
+    urlList = ["{}List_of_country_names_in_various_languages_(A%E2%80%93C)".format(session.wikipediaURL),
+        "{}List_of_country_names_in_various_languages_(D%E2%80%93I)".format(session.wikipediaURL),
+        "{}List_of_country_names_in_various_languages_(J%E2%80%93P)".format(session.wikipediaURL),
+        "{}List_of_country_names_in_various_languages_(Q%E2%80%93Z)".format(session.wikipediaURL)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pages = list(executor.map(session.get, urlList))
+    for website_url in pages:
+        #single-pass extraction of the rows of the 'wikitable' table:
+        parser = TableRowParser('wikitable')
+        tr_BS = list(parser.rows(website_url))
+        isTable = parser.tableFound
+        #
+        #parse the data; exit loop if     
+        if isTable:
+            #Print out the table contents (row, column, 'information')
+            for i in range(len(tr_BS)):
+                try:
+                    nation=str(tr_BS[i].links[0].title)
+                    iC = COUNTRIES['country'].index(nation)
+                    coCode = COUNTRIES['id2c'][iC]
+                    goodRow=True
+                except:
+                    goodRow=False
+                if goodRow:
+                    if len(tr_BS[i].cells[1].bolds): #if aliases present
+                        for ii in range(len(tr_BS[i].cells[1].bolds)):
+                            try:
+                                countryAliasList.append(tr_BS[i].cells[1].bolds[ii])
+                                #countryID.append(tr_BS[i].links[0].title) #name of country:         
+                                countryID.append(coCode)
+                            except:
+                                print('Error appending, skipping!')
+    return {'countryAlias':countryAliasList, 'countryID':countryID}
+
+
+
+class ScrapeSession(object):
+    '''ScrapeSession is the shared HTTP client of the scrapers (getCountries,
+    CountryInfo and the WikiPedia step of recompileDB). It pools connections in
+    one requests.Session, and it is safe to share between threads. Per host, at
+    most maxPerHost requests are in flight, and consecutive requests start at
+    least minInterval seconds apart. Failed requests (connection errors, HTTP
+    429 and 5xx) are retried up to retries times, with exponential backoff
+    (backoff, 2*backoff, 4*backoff ... seconds). geonamesURL & wikipediaURL are
+    the base URLs of the scraped sites, e.g. a local stand-in server in tests.'''
+    retryStatus = (429, 500, 502, 503, 504)
+    def __init__(self, maxPerHost=4, minInterval=0.2, retries=4, backoff=1.0, timeout=60,
+                 geonamesURL='http://www.geonames.org/', wikipediaURL='https://en.wikipedia.org/wiki/'):
+        self.maxPerHost = maxPerHost
+        self.minInterval = minInterval
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.geonamesURL = geonamesURL
+        self.wikipediaURL = wikipediaURL
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=max(16, maxPerHost))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.lock = threading.Lock()
+        self.hostSlots = {}     #host -> semaphore of in-flight requests
+        self.hostNextStart = {} #host -> earliest start time of the next request
+    def waitForHost(self, host):
+        #sleeps until the rate limit of host allows the next request to start
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.hostNextStart.get(host, now))
+            self.hostNextStart[host] = start + self.minInterval
+        if start > now:
+            time.sleep(start - now)
+    def get(self, url):
+        #GETs url and returns the text of the response
+        host = urlparse(url).netloc
+        with self.lock:
+            slots = self.hostSlots.setdefault(host, threading.BoundedSemaphore(self.maxPerHost))
+        with slots:
+            for attempt in range(self.retries+1):
+                self.waitForHost(host)
+                try:
+                    response = self.session.get(url, timeout=self.timeout)
+                    if response.status_code not in self.retryStatus:
+                        return response.text
+                    error = requests.HTTPError('HTTP {} for {}'.format(response.status_code, url), response=response)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+                if attempt < self.retries:
+                    time.sleep(self.backoff * 2**attempt)
+            raise error
+
+
+
+scrapeSession = None   #default ScrapeSession, see getScrapeSession
+
+
+
+def getScrapeSession():
+    #Returns the module's default ScrapeSession (created on first use).
+    global scrapeSession
+    if scrapeSession == None:
+        scrapeSession = ScrapeSession()
+    return scrapeSession
+
+
+
+def AliasList(Aliases):
+    '''AliasList takes in a N-row, single-column list of comma-separated aliases
+    and concatenates them into one long single column OUTPUT list. Minor filtering
+    on the Alias entries are performed during this routine.
+    Brian Scanlon, April, 2019'''
+    Idx=[]
+    OUTPUT=[]
+    for i in range(len(Aliases)):
+        try:
+            #bufr=Aliases[i].split(',')
+            bufr=DelimAliases.split(Aliases[i].strip('.'))
+            isOK=True
+        except:
+            isOK=False
+        finally:
+            if isOK:
+                for ii in range(len(bufr)):
+                    Idx.append(i)
+                    OUTPUT.append(bufr[ii])
+    return {'Index':Idx, 'Aliases':OUTPUT}
+ 
+    
+
+
+
+
+
+#Find a list of countries!
+def getCountries(countryURL='https://www.geonames.org/countries/', Verbose=False, session=None):
+    #allocate memory to output var:
+    idA2 = []
+    idA3 = []
+    idNum = []
+    idFips = []
+    country = []
+    capital = []
+    areaKM2 = []
+    population = []
+    continentID = []
+    #
     numTabCols=9 #manually determined from inspecing the URL / tabled data.
     #
     #Download contents from the URL!
-    website_url = requests.get(countryURL).text
-    soup = BeautifulSoup(website_url,coding)
-    #
-    if Verbose: print('Original encoding found: {}'.format(soup.original_encoding))
-    #print(soup.prettify())
-    My_table = soup.find('table',{'class':'restable'})    
-    try:
-        tr_BS=My_table.findAll('tr')
-        isTable = True
-    except:
+    if session == None:
+        session = getScrapeSession()
+    website_url = session.get(countryURL)
+    #single-pass extraction of the rows of the 'restable' table:
+    parser = TableRowParser('restable')
+    tr_BS = list(parser.rows(website_url))
+    isTable = parser.tableFound
+    if not isTable:
         print('Table not found!')
-        isTable = False
     #parse the data; exit loop if     
     iCaptured = 0 # number of rows captured
     if isTable:
@@ -692,10 +3622,10 @@ def getCountries(countryURL='https://www.geonames.org/countries/', Verbose=False
         for i in range(len(tr_BS)):
             #print('i = {}, columns = {}'.format(i,len(tr_BS[i])))
             #print('\r\n\r\n i = {}  \r\n'.format(i) + tr_BS[i].getText())
-            if (len(tr_BS[i]) == numTabCols): #ensure that there are the right number of Cols
+            if (tr_BS[i].nChildren == numTabCols): #ensure that there are the right number of Cols
                 #we will test that the zeroth column is a table row index (int)
                 try:
-                    CountryID=tr_BS[i].findAll('td')[0].getText()
+                    CountryID=tr_BS[i].cells[0].getText()
                     if Verbose: print('table row {}, Country ID = {}:\n'.format(iCaptured,CountryID))
                     goodRow = True
                 except:
@@ -706,56 +3636,56 @@ def getCountries(countryURL='https://www.geonames.org/countries/', Verbose=False
                         iCaptured+=1
                         #ISO-3166 alpha2 country (2-char) Identifier:
                         try:
-                            #idA2.append(tr_BS[i].findAll('td')[0].getText())
+                            #idA2.append(tr_BS[i].cells[0].getText())
                             idA2.append(CountryID)
                         except:
                             if Verbose: print('Cannot parse 2-char Country ID, setting to nan')    
                             idA2.append(None)
                         #ISO-3166 alpha3 country (2-char) Identifier:
                         try:
-                            idA3.append(tr_BS[i].findAll('td')[1].getText())
+                            idA3.append(tr_BS[i].cells[1].getText())
                         except:
                             if Verbose: print('Cannot parse 3-char Country ID, setting to nan')    
                             idA3.append(None)
                         #ISO-3166 numeric country (2-char) Identifier:
                         try:
-                            idNum.append(tr_BS[i].findAll('td')[2].getText())
+                            idNum.append(tr_BS[i].cells[2].getText())
                         except:
                             if Verbose: print('Cannot parse 3-char Country ID, setting to nan')    
                             idNum.append(None)
                         #fips country (2-char) Identifier:
                         try:
-                            idFips.append(tr_BS[i].findAll('td')[3].getText())
+                            idFips.append(tr_BS[i].cells[3].getText())
                         except:
                             if Verbose: print('Cannot parse 2-char fips Country ID,setting to nan')    
                             idFips.append(None)
                         #Country Name:
                         try:
-                            country.append(tr_BS[i].findAll('td')[4].getText())
+                            country.append(tr_BS[i].cells[4].getText())
                         except:
                             if Verbose: print('Cannot parse Country Name, setting to nan')    
                             country.append(None)
                         #City/town capital of country:
                         try:
-                            capital.append(tr_BS[i].findAll('td')[5].getText())
+                            capital.append(tr_BS[i].cells[5].getText())
                         except:
                             if Verbose: print('Cannot parse Name of Capital, setting to nan')    
                             capital.append(None)
                         #Area of Country in km^2:
                         try:
-                            areaKM2.append(float(tr_BS[i].findAll('td')[6].getText()))
+                            areaKM2.append(float(tr_BS[i].cells[6].getText()))
                         except:
                             if Verbose: print('Cannot parse country area, setting to nan')    
                             areaKM2.append(None)
                         #Population:
                         try:
-                            population.append(int(tr_BS[i].findAll('td')[7].getText().replace(',','')))
+                            population.append(int(tr_BS[i].cells[7].getText().replace(',','')))
                         except:
                             if Verbose: print('Cannot parse country population, setting to nan')    
                             population.append(None)
                         #Continent ID:
                         try:
-                            continentID.append(tr_BS[i].findAll('td')[8].getText())
+                            continentID.append(tr_BS[i].cells[8].getText())
                         except:
                             if Verbose: print('Cannot parse 2-char continent ID, setting to nan')    
                             continentID.append(None)
@@ -823,3 +3753,42 @@ def save_response_content(response, destination):
             if chunk: # filter out keep-alive new chunks
                 f.write(chunk)
 
+
+
+#==============================================================================
+#  Command line
+#==============================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='TownsDataBase: match country & town names against the local dataset')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help='serve matches over HTTP from one warm dataset (see serveDB)')
+    serve.add_argument('--path', default=dataBaseParentPath, help='where the local dataset is saved')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--unix', help='listen on this Unix socket instead of host:port')
+    serve.add_argument('--workers', type=int, help='matching processes (default: one per core, 0: in-process)')
+    serve.add_argument('--batch-window', type=float, default=0.002, help='seconds to collect concurrent requests into a micro-batch')
+    serve.add_argument('--max-batch', type=int, default=256, help='largest micro-batch')
+    serve.add_argument('--mmap', action='store_true', help='memory-map the compiled dataset (see compileBinaryDB)')
+    serve.add_argument('--cache-size', type=int, default=100000, help='query cache size per worker')
+    serve.add_argument('--scorer', help='scoring engine (default: {})'.format(defaultScorer))
+    enrich = commands.add_parser('enrich', help='stream an address table through the matcher (see enrichFile)')
+    enrich.add_argument('input', help='CSV, Parquet or Excel file')
+    enrich.add_argument('output', help='CSV, Parquet or Excel file')
+    enrich.add_argument('--path', default=dataBaseParentPath, help='where the local dataset is saved')
+    enrich.add_argument('--country-column', default='COUNTRY')
+    enrich.add_argument('--city-column', default='CITY')
+    enrich.add_argument('--address-column', help='match free-text addresses of this column instead (see parseAddress)')
+    enrich.add_argument('--chunk-size', type=int, default=10000)
+    enrich.add_argument('--start-row', type=int, default=0, help='resume: number of rows already written')
+    enrich.add_argument('--sheet', help='Excel sheet name (default: the first)')
+    enrich.add_argument('--workers', type=int, default=1, help='matching processes per chunk')
+    enrich.add_argument('--mmap', action='store_true', help='memory-map the compiled dataset (see compileBinaryDB)')
+    enrich.add_argument('--scorer', help='scoring engine (default: {})'.format(defaultScorer))
+    args = parser.parse_args()
+    if args.command == 'enrich':
+        enrichFile(args.input, args.output, None, args.country_column, args.city_column, args.address_column, args.chunk_size,
+                   args.start_row, args.sheet, args.workers, os.path.join(args.path, ''), args.mmap, scorer=args.scorer)
+    if args.command == 'serve':
+        serveDB(os.path.join(args.path, ''), args.host, args.port, args.unix, args.workers, args.batch_window, args.max_batch,
+                args.mmap, args.cache_size, scorer=args.scorer)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the GeoNames results-page parsers
+----------------------------------------------
+Compares TownsDataBase.parseTownsPage (single-pass, streaming TableRowParser)
+with the v1.0 parser (a full BeautifulSoup lxml tree, queried with findAll per
+row) on saved GeoNames search pages. Both parsers must extract identical rows;
+parse CPU time and peak memory (tracemalloc) per page are reported.
+
+Usage:
+    python benchmarks/BenchHtmlParsing.py PAGE_DIR [repeats]
+
+PAGE_DIR holds saved pages of http://www.geonames.org/search.html?q=&country=<CC>&startRow=<N>
+(BeautifulSoup and lxml are only needed for this benchmark).
+"""
+
+import sys, os, time, tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TownsDataBase
+from bs4 import BeautifulSoup
+
+
+
+def parseTownsPageBS4(website_url):
+    #The v1.0 parser of CountryInfo (BeautifulSoup tree + findAll per row), for reference.
+    numTabCols = 6
+    Towns = {'TownIndex':[] ,'TownName':[], 'Country':[], 'AliasTownName':[],'Latitude':[],'Longitude':[],'Province':[],'County':[],'Address2':[],'TownClass':[],'Population':[]}
+    soup = BeautifulSoup(website_url,'lxml')
+    My_table = soup.find('table',{'class':'restable'})
+    try:
+        tr_BS=My_table.findAll('tr')
+    except:
+        return Towns
+    fields = [('TownIndex', lambda tr: int(tr.findAll('small')[0].contents[0])),
+              ('AliasTownName', lambda tr: str(tr.findAll('small')[1].contents[0])),
+              ('TownName', lambda tr: str(tr.findAll('a')[1].getText())),
+              ('Population', lambda tr: int(tr.findAll('small')[3].contents[0].split(' ')[-1].replace(',',''))),
+              ('Latitude', lambda tr: float(tr.findAll('span')[1].contents[0])),
+              ('Longitude', lambda tr: float(tr.findAll('span')[2].contents[0])),
+              ('Country', lambda tr: str(tr.findAll('a')[3].getText())),
+              ('Province', lambda tr: str(tr.findAll('td')[2].get_text(',').split(',')[2]).strip()),
+              ('County', lambda tr: str(tr.findAll('td')[2].get_text(',').split(',')[3]).strip().split('>')[-1]),
+              ('Address2', lambda tr: str(tr.findAll('small')[2].contents[0])),
+              ('TownClass', lambda tr: str(tr.findAll('td')[3].contents[0]))]
+    for tr in tr_BS:
+        if len(tr) == numTabCols:
+            try:
+                int(tr.findAll('small')[0].contents[0])
+            except:
+                continue #header table entry
+            for key, parse in fields:
+                try:
+                    Towns[key].append(parse(tr))
+                except:
+                    Towns[key].append(None)
+    return Towns
+
+
+
+def measure(parser, pages, repeats):
+    #Returns (seconds per page, peak traced memory in bytes, parsed output of the last run)
+    tracemalloc.start()
+    for page in pages:  #peak memory of one pass
+        output = parser(page)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    t0 = time.perf_counter()
+    for r in range(repeats):
+        outputs = [parser(page) for page in pages]
+    elapsed = (time.perf_counter() - t0) / (repeats * len(pages))
+    return elapsed, peak, outputs
+
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    pageDir = sys.argv[1]
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    pages = []
+    for fileName in sorted(os.listdir(pageDir)):
+        with open(os.path.join(pageDir, fileName), 'r', encoding='utf-8') as htmlFile:
+            pages.append(htmlFile.read())
+    print('{} pages, {:.1f} kB on average'.format(len(pages), sum(len(p) for p in pages)/len(pages)/1e3))
+    results = {}
+    for name, parser in [('BeautifulSoup (v1.0)', parseTownsPageBS4), ('TableRowParser', TownsDataBase.parseTownsPage)]:
+        results[name] = measure(parser, pages, repeats)
+        print('{:22s} {:8.2f} ms/page   peak memory {:8.1f} kB'.format(name, 1e3*results[name][0], results[name][1]/1e3))
+    reference, streamed = [results[name][2] for name in results]
+    mismatches = [i for i in range(len(pages)) if reference[i] != streamed[i]]
+    print('outputs identical' if not mismatches else 'outputs differ on {} pages: {}'.format(len(mismatches), mismatches[:10]))
+    print('speed-up x{:.1f}'.format(results['BeautifulSoup (v1.0)'][0] / results['TableRowParser'][0]))
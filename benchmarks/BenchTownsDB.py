@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the TownsDataBase loading and matching hot paths
+-------------------------------------------------------------
+Times loadDB, queryCountryName, queryCityName (with and without countryID),
+pickBestQuery and StrMatcher over a reproducible corpus of noisy queries
+(typos, casing, accents, aliases, ISO codes, missing country) drawn from the
+dataset itself. Each scenario reports throughput, latency percentiles, peak
+traced memory (tracemalloc) and, for the queries, the share of queries that
+resolved to the town/country they were drawn from.
+
+Without --db, a synthetic dataset is generated first (see SyntheticTownsDB.py).
+Results can be saved with --json and compared with an earlier run (--compare)
+to catch regressions, and --scorers runs the matching scenarios once per
+scoring engine to compare engines.
+
+Usage:
+    python benchmarks/BenchTownsDB.py [--db PATH] [--countries N] [--towns N]
+                                      [--queries N] [--scorers rapidfuzz,fuzzywuzzy]
+                                      [--scenarios load,country,city,cityAll,pick,strmatcher]
+                                      [--json OUT.json] [--compare OLD.json]
+"""
+
+import sys, os, time, json, random, tempfile, shutil, argparse, tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import numpy as np
+import TownsDataBase
+from SyntheticTownsDB import generateTownsDB
+
+
+
+def typo(rng, word):
+    #One random edit: swap, delete, insert or substitute a character
+    if len(word) < 3:
+        return word
+    i = rng.randrange(1, len(word)-1)
+    edit = rng.randrange(4)
+    if edit == 0:
+        return word[:i] + word[i+1] + word[i] + word[i+2:]
+    if edit == 1:
+        return word[:i] + word[i+1:]
+    if edit == 2:
+        return word[:i] + rng.choice('aeiourstnl') + word[i:]
+    return word[:i] + rng.choice('aeiourstnl') + word[i+1:]
+
+
+
+def queryCorpus(townsDB, nQueries, seed=0):
+    '''queryCorpus draws nQueries (country, city) queries from the dataset and
+    distorts them. Returns a list of dicts with the entries (country, city), the
+    truth (countryID, townIdx) and the kind of city noise applied.'''
+    rng = random.Random(seed)
+    COUNTRIES = townsDB['COUNTRIES']
+    aliasOf = {}
+    for alias, countryID in zip(townsDB['COUNTRY_ALIAS']['countryAlias'], townsDB['COUNTRY_ALIAS']['countryID']):
+        aliasOf.setdefault(countryID, []).append(alias)
+    countries = [c for c in COUNTRIES['id2c'] if c in townsDB['TOWNS']]
+    corpus = []
+    for q in range(nQueries):
+        countryID = rng.choice(countries)
+        towns = townsDB['TOWNS'][countryID]
+        townIdx = rng.randrange(len(towns['TownName']))
+        city = towns['TownName'][townIdx]
+        noise = rng.choice(['exact', 'typo', 'lower', 'upper', 'accents', 'alias'])
+        if noise == 'typo':
+            city = typo(rng, city)
+        elif noise == 'lower':
+            city = city.lower()
+        elif noise == 'upper':
+            city = city.upper()
+        elif noise == 'accents':
+            city = TownsDataBase.normalizeName(city).title()
+        elif noise == 'alias':
+            aliases = [i for i, t in enumerate(towns['AliasIndex']) if t == townIdx]
+            if aliases:
+                city = towns['Aliases'][rng.choice(aliases)].strip()
+            else:
+                noise = 'exact'
+        iCountry = COUNTRIES['id2c'].index(countryID)
+        country = rng.choice([COUNTRIES['country'][iCountry], COUNTRIES['country'][iCountry].lower(),
+                              typo(rng, COUNTRIES['country'][iCountry]), countryID, COUNTRIES['id3c'][iCountry],
+                              rng.choice(aliasOf.get(countryID, [countryID])), None])
+        corpus.append({'country':country, 'city':city, 'countryID':countryID, 'townIdx':townIdx, 'noise':noise})
+    return corpus
+
+
+
+def percentiles(latencies):
+    latencies = np.asarray(latencies)*1e3
+    return {'p50':float(np.percentile(latencies, 50)), 'p90':float(np.percentile(latencies, 90)),
+            'p99':float(np.percentile(latencies, 99)), 'max':float(latencies.max())}
+
+
+
+def peakMemory(call, items):
+    #Peak traced memory (bytes) of running call over items (separate pass, as tracing slows calls down)
+    tracemalloc.start()
+    for item in items:
+        call(item)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+
+def runScenario(name, call, items, check=None, memoryItems=100):
+    '''Times call(item) for every item. check(item, result) -> bool counts the
+    correct results. Returns the report (dict) of the scenario.'''
+    latencies = []
+    correct = 0
+    t0 = time.perf_counter()
+    for item in items:
+        t = time.perf_counter()
+        result = call(item)
+        latencies.append(time.perf_counter() - t)
+        if check is not None:
+            correct += bool(check(item, result))
+    elapsed = time.perf_counter() - t0
+    report = {'scenario':name, 'n':len(items), 'seconds':elapsed, 'throughput':len(items)/elapsed}
+    report.update(percentiles(latencies))
+    report['peakMemory'] = peakMemory(call, items[:memoryItems])
+    if check is not None:
+        report['accuracy'] = correct/len(items)
+    return report
+
+
+
+def benchLoad(PATH, repeats=3):
+    reports = [runScenario('loadDB', lambda i: TownsDataBase.loadDB(PATH), list(range(repeats)), memoryItems=1)]
+    if os.path.isdir(os.path.join(PATH, TownsDataBase.compiledDirName)):
+        reports.append(runScenario('loadDB(mmap=True)', lambda i: TownsDataBase.loadDB(PATH, mmap=True), list(range(repeats)), memoryItems=1))
+    return reports
+
+
+
+def benchQueries(townsDB, corpus, scorer, scenarios):
+    reports = []
+    tag = ' [{}]'.format(scorer)
+    if 'country' in scenarios:
+        items = [q for q in corpus if q['country'] is not None]
+        reports.append(runScenario('queryCountryName'+tag,
+                                   lambda q: TownsDataBase.queryCountryName(q['country'], townsDB, scorer=scorer), items,
+                                   lambda q, r: r[0] == q['countryID']))
+    if 'city' in scenarios:
+        reports.append(runScenario('queryCityName(countryID)'+tag,
+                                   lambda q: TownsDataBase.queryCityName(q['city'], townsDB, q['countryID'], scorer=scorer), corpus,
+                                   lambda q, r: r[2] == q['townIdx']))
+    if 'cityAll' in scenarios:
+        reports.append(runScenario('queryCityName(no countryID)'+tag,
+                                   lambda q: TownsDataBase.queryCityName(q['city'], townsDB, scorer=scorer), corpus,
+                                   lambda q, r: r[3] == q['countryID'] and r[2] == q['townIdx']))
+    if 'pick' in scenarios:
+        reports.append(runScenario('pickBestQuery(TownName)'+tag,
+                                   lambda q: TownsDataBase.pickBestQuery(q['city'], townsDB['TOWNS'][q['countryID']]['TownName'],
+                                                                         scorer=scorer, returnIndex=True), corpus,
+                                   lambda q, r: r[2] == q['townIdx']))
+    return reports
+
+
+
+def benchStrMatcher(townsDB, corpus):
+    pairs = [(q['city'], townsDB['TOWNS'][q['countryID']]['TownName'][q['townIdx']]) for q in corpus]
+    return [runScenario('StrMatcher', lambda p: TownsDataBase.StrMatcher(p[0], p[1]), pairs*10)]
+
+
+
+def printReports(reports, baseline=None):
+    print('{:40s} {:>7s} {:>10s} {:>9s} {:>9s} {:>9s} {:>9s} {:>10s} {:>8s}'.format(
+          'scenario', 'n', 'ops/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'peak kB', 'correct'))
+    old = {r['scenario']:r for r in (baseline or [])}
+    for r in reports:
+        line = '{:40s} {:7d} {:10.1f} {:9.3f} {:9.3f} {:9.3f} {:9.3f} {:10.1f} {:>8s}'.format(
+               r['scenario'], r['n'], r['throughput'], r['p50'], r['p90'], r['p99'], r['max'], r['peakMemory']/1e3,
+               '{:.1%}'.format(r['accuracy']) if 'accuracy' in r else '')
+        if r['scenario'] in old:
+            line += '   throughput {:+.0%} p99 {:+.0%}'.format(r['throughput']/old[r['scenario']]['throughput']-1,
+                                                               r['p99']/old[r['scenario']]['p99']-1)
+        print(line)
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the TownsDataBase loading and matching hot paths')
+    parser.add_argument('--db', help='dataset directory (default: generate a synthetic dataset)')
+    parser.add_argument('--countries', type=int, default=20, help='synthetic dataset: number of countries')
+    parser.add_argument('--towns', type=int, default=5000, help='synthetic dataset: towns per country')
+    parser.add_argument('--queries', type=int, default=500, help='size of the noisy query corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scorers', default=TownsDataBase.defaultScorer, help='comma-separated scoring engines')
+    parser.add_argument('--scenarios', default='load,country,city,cityAll,pick,strmatcher')
+    parser.add_argument('--json', help='save the reports to this JSON file')
+    parser.add_argument('--compare', help='JSON reports of an earlier run to compare with')
+    args = parser.parse_args()
+    scenarios = args.scenarios.split(',')
+    if args.db:
+        PATH = os.path.join(args.db, '')
+    else:
+        PATH = os.path.join(tempfile.mkdtemp(prefix='SyntheticTownsDB'), '')
+        t0 = time.perf_counter()
+        generateTownsDB(PATH, args.countries, args.towns, args.seed)
+        TownsDataBase.compileBinaryDB(PATH)
+        print('generated synthetic dataset ({} countries x ~{} towns) in {} [{:.1f} s]'.format(
+              args.countries, args.towns, PATH, time.perf_counter()-t0))
+    reports = []
+    if 'load' in scenarios:
+        reports += benchLoad(PATH)
+    townsDB = TownsDataBase.loadDB(PATH)
+    corpus = queryCorpus(townsDB, args.queries, args.seed)
+    for scorer in args.scorers.split(','):
+        reports += benchQueries(townsDB, corpus, scorer, scenarios)
+    if 'strmatcher' in scenarios:
+        reports += benchStrMatcher(townsDB, corpus)
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as JSONfile:
+            baseline = json.load(JSONfile)
+    printReports(reports, baseline)
+    if args.json:
+        with open(args.json, 'w') as JSONfile:
+            json.dump(reports, JSONfile, indent=1)
+    if not args.db:
+        shutil.rmtree(PATH)
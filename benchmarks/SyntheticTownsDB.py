@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetic towns dataset generator
+---------------------------------
+Writes a reproducible, randomly generated dataset in the same JSON schema that
+TownsDataBase.recompileDB produces and TownsDataBase.loadDB reads
+(CountriesDB.json, CountryAliasDB.json, ProvinceDB.json and one <CC>.json towns
+table per country), so that benchmarks run without scraping GeoNames.
+
+The data mimics the shape of the real dataset: syllable-built names (some with
+accents, some multi-word), town names shared between countries (Dublin,
+Springfield, ...), comma-separated alias lists compiled with
+TownsDataBase.AliasList, heavy-tailed populations, GeoNames TownClass values
+and clustered coordinates per country.
+
+Usage:
+    python benchmarks/SyntheticTownsDB.py OUT_DIR [nCountries] [nTowns] [seed]
+"""
+
+import sys, os, random
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TownsDataBase
+
+syllables = ['ba', 'lin', 'dub', 'cor', 'ka', 'ter', 'mon', 'vil', 'ton', 'ham', 'burg', 'ford', 'ly', 'ro',
+             'sa', 'ne', 'gal', 'way', 'bre', 'stad', 'dor', 'ak', 'ri', 'ven', 'os', 'tul', 'mar', 'ek']
+accented = {'a':'á', 'e':'é', 'o':'ö', 'u':'ü', 'i':'í', 'n':'ñ'}
+prefixes = ['Saint', 'New', 'Port', 'Upper', 'Lower', 'North', 'East']
+sharedNames = ['Dublin', 'Springfield', 'Cork', 'Galway', 'London', 'Paris', 'Victoria', 'Richmond',
+               'Salem', 'Georgetown', 'Newport', 'Windsor', 'Clinton', 'Franklin', 'Kingston']
+townClasses = [('populated place', 0.80),
+               ('seat of a fourth-order administrative division', 0.06),
+               ('seat of a third-order administrative division', 0.05),
+               ('seat of a second-order administrative division', 0.05),
+               ('seat of a first-order administrative division', 0.04)]
+
+
+
+def randomWord(rng, minSyl=2, maxSyl=4):
+    #Random capitalised name built from syllables, with an occasional accent
+    word = ''.join(rng.choice(syllables) for _ in range(rng.randint(minSyl, maxSyl)))
+    if rng.random() < 0.1:
+        i = rng.randrange(len(word))
+        word = word[:i] + accented.get(word[i], word[i]) + word[i+1:]
+    return word.capitalize()
+
+
+
+def randomTownName(rng):
+    name = randomWord(rng)
+    if rng.random() < 0.08:
+        name = '{} {}'.format(rng.choice(prefixes), name)
+    elif rng.random() < 0.03:
+        name = '{} on {}'.format(name, randomWord(rng, 2, 3))
+    return name
+
+
+
+def townAliases(rng, name):
+    #Comma-separated alias list of a town (GeoNames' AliasTownName column), often empty
+    aliases = []
+    if rng.random() < 0.3:
+        aliases.append(TownsDataBase.normalizeName(name).title())   #accent-free spelling
+    if rng.random() < 0.2:
+        aliases.append(name + rng.choice(['ia', 'en', 'o', 'as']))   #foreign-language form
+    if rng.random() < 0.05:
+        aliases.append(randomWord(rng))                              #historic name
+    aliases = [a for a in aliases if a != name]
+    return ', '.join(aliases) if aliases else None
+
+
+
+def generateTownsDB(PATH, nCountries=20, nTowns=5000, seed=0):
+    '''generateTownsDB writes a synthetic dataset of nCountries countries, each
+    with about nTowns towns (+-50%), into PATH. The same seed always writes the
+    same dataset.'''
+    rng = random.Random(seed)
+    os.makedirs(PATH, exist_ok=True)
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    codes = rng.sample([a+b for a in letters for b in letters], nCountries)
+    COUNTRIES = {'id2c':[], 'id3c':[], 'id3n':[], 'idFips':[], 'country':[], 'capital':[], 'area':[], 'population':[], 'id_continent':[]}
+    ALIASES = {'countryAlias':[], 'countryID':[]}
+    PROVINCES = {'province':[], 'countryID':[]}
+    countryNames = set()
+    for n, coCode in enumerate(codes):
+        countryName = randomWord(rng, 2, 3)
+        while countryName in countryNames:
+            countryName = randomWord(rng, 2, 3)
+        countryNames.add(countryName)
+        nCountry = max(10, int(nTowns*rng.uniform(0.5, 1.5)))
+        provinces = sorted(set(randomWord(rng, 2, 3) for _ in range(rng.randint(5, 30))))
+        centre = (rng.uniform(-50, 60), rng.uniform(-170, 170))
+        Towns = {'TownIndex':[], 'TownName':[], 'Country':[], 'AliasTownName':[], 'Latitude':[], 'Longitude':[],
+                 'Province':[], 'County':[], 'Address2':[], 'TownClass':[], 'Population':[]}
+        for i in range(nCountry):
+            name = rng.choice(sharedNames) if rng.random() < 0.01 else randomTownName(rng)
+            province = rng.choice(provinces)
+            townClass = rng.choices([c for c, p in townClasses], [p for c, p in townClasses])[0]
+            population = int(rng.paretovariate(1.1)*200) if rng.random() < 0.7 else None
+            Towns['TownIndex'].append(i+1)
+            Towns['TownName'].append(name)
+            Towns['Country'].append(countryName)
+            Towns['AliasTownName'].append(townAliases(rng, name))
+            Towns['Latitude'].append(round(max(-89.9, min(89.9, rng.gauss(centre[0], 3))), 5))
+            Towns['Longitude'].append(round(max(-179.9, min(179.9, rng.gauss(centre[1], 4))), 5))
+            Towns['Province'].append(province)
+            Towns['County'].append(randomWord(rng, 2, 3) if rng.random() < 0.5 else None)
+            Towns['Address2'].append(None)
+            Towns['TownClass'].append(townClass)
+            Towns['Population'].append(population)
+        #the most populous town is the capital:
+        capital = max(range(nCountry), key=lambda i: Towns['Population'][i] or 0)
+        Towns['TownClass'][capital] = 'capital of a political entity'
+        Aliases = TownsDataBase.AliasList(Towns['AliasTownName'])
+        Towns['Aliases'] = Aliases['Aliases']
+        Towns['AliasIndex'] = Aliases['Index']
+        del Towns['AliasTownName']
+        TownsDataBase.writeJSON(Towns, '{}{}.json'.format(PATH, coCode))
+        COUNTRIES['id2c'].append(coCode)
+        COUNTRIES['id3c'].append(coCode + rng.choice(letters))
+        COUNTRIES['id3n'].append(str(n))
+        COUNTRIES['idFips'].append(coCode)
+        COUNTRIES['country'].append(countryName)
+        COUNTRIES['capital'].append(Towns['TownName'][capital])
+        COUNTRIES['area'].append(round(rng.uniform(1e3, 1e6), 1))
+        COUNTRIES['population'].append(sum(p or 0 for p in Towns['Population']))
+        COUNTRIES['id_continent'].append(rng.choice(['EU', 'AS', 'AF', 'NA', 'SA', 'OC']))
+        for alias in ['Republic of {}'.format(countryName), countryName.upper()[:4], countryName + 'ia']:
+            ALIASES['countryAlias'].append(alias)
+            ALIASES['countryID'].append(coCode)
+        PROVINCES['province'] += provinces
+        PROVINCES['countryID'] += [coCode]*len(provinces)
+    TownsDataBase.writeJSON(COUNTRIES, '{}CountriesDB.json'.format(PATH))
+    TownsDataBase.writeJSON(ALIASES, '{}CountryAliasDB.json'.format(PATH))
+    TownsDataBase.writeJSON(PROVINCES, '{}ProvinceDB.json'.format(PATH))
+
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    OUT = os.path.join(sys.argv[1], '')
+    nCountries = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    nTowns = int(sys.argv[3]) if len(sys.argv) > 3 else 5000
+    seed = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+    generateTownsDB(OUT, nCountries, nTowns, seed)
+    print('wrote {} countries x ~{} towns to {}'.format(nCountries, nTowns, OUT))
@@ -0,0 +1,210 @@
+'''Shared fixtures of the TownsDataBase tests.
+
+StandinServer is a small local stand-in for the GeoNames & WikiPedia sites: a
+threaded http.server serving the saved pages of tests/fixtures, so the
+scrapers run without network access. Every request is logged (arrival time,
+path, status), and responses can be delayed or made to fail (HTTP 503), to
+exercise the rate limits and retries of ScrapeSession.
+
+writeDataset writes a small dataset (towns of 10 countries, a few hundred
+synthetic ones among them) with the compile functions of TownsDataBase; the
+session fixture datasetPATH holds it, compiled for mmap=True as well.'''
+import os
+import sys
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import TownsDataBase as tdb
+
+fixturesPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+
+def fixturePage(url):
+    #Saved page of a request path (None if there is none):
+    #  /countries/                                 -> geonames/countries.html
+    #  /search.html?country=<CC>&startRow=<row>    -> geonames/search_<CC>_<row>.html
+    #  /wiki/List_of_country_names_..._(<A>–<C>)   -> wikipedia/<A>-<C>.html
+    url = urlparse(url)
+    if url.path == '/countries/':
+        return os.path.join(fixturesPATH, 'geonames', 'countries.html')
+    if url.path == '/search.html':
+        query = parse_qs(url.query)
+        return os.path.join(fixturesPATH, 'geonames', 'search_{}_{}.html'.format(query['country'][0], query['startRow'][0]))
+    if url.path.startswith('/wiki/'):
+        title = unquote(url.path[len('/wiki/'):])
+        return os.path.join(fixturesPATH, 'wikipedia', '{}.html'.format(title.split('(')[-1].rstrip(')').replace('–', '-')))
+    return None
+
+
+
+class StandinServer(object):
+    '''Serves the fixture pages on 127.0.0.1 (a free port) until stop().
+    delay(path) returns the seconds to wait before answering a request, and
+    failures[path] is the number of 503 responses to give before serving path.
+    log is a list of (arrival time, path, status); maxInFlight is the highest
+    number of requests handled at once.'''
+    def __init__(self):
+        self.log = []
+        self.failures = {}
+        self.delay = lambda path: 0.0
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.lock = threading.Lock()
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            def do_GET(self):
+                server.serve(self)
+            def log_message(self, *args):
+                pass
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}/'.format(self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+    def serve(self, request):
+        arrival = time.monotonic()
+        with self.lock:
+            self.inFlight += 1
+            self.maxInFlight = max(self.maxInFlight, self.inFlight)
+            if self.failures.get(request.path, 0) > 0:
+                self.failures[request.path] -= 1
+                status = 503
+            else:
+                status = 200
+        try:
+            time.sleep(self.delay(request.path))
+            page = fixturePage(request.path)
+            if status == 200 and (page == None or not os.path.isfile(page)):
+                status = 404
+            body = b'' if status != 200 else open(page, 'rb').read()
+            with self.lock:
+                self.log.append((arrival, request.path, status))
+            request.send_response(status)
+            request.send_header('Content-Type', 'text/html; charset=utf-8')
+            request.send_header('Content-Length', str(len(body)))
+            request.end_headers()
+            request.wfile.write(body)
+        finally:
+            with self.lock:
+                self.inFlight -= 1
+    def requests(self, path=None):
+        #logged (arrival time, path, status) of all requests, or of the requests of path, by arrival
+        return sorted(entry for entry in self.log if path == None or entry[1] == path)
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+
+@pytest.fixture
+def standin():
+    server = StandinServer()
+    yield server
+    server.stop()
+
+
+
+#id2c, id3c, country, capital, towns as (TownName, Province, Address2, TownClass, Population, Latitude, Longitude, aliases)
+datasetCountries = [
+    ('IE', 'IRL', 'Ireland', 'Dublin', [
+        ('Dublin', 'Leinster', 'Dublin City', 'capital of a political entity', 1024027, 53.33306, -6.24889, 'Baile Átha Cliath,Dublino'),
+        ('Cork', 'Munster', 'County Cork', 'seat of a second-order administrative division', 190384, 51.89797, -8.47061, 'Corcaigh'),
+        ('Galway', 'Connacht', 'County Galway', 'seat of a second-order administrative division', 79934, 53.27194, -9.04889, 'Gaillimh'),
+        ('Limerick', 'Munster', 'County Limerick', 'seat of a second-order administrative division', 94192, 52.66472, -8.62306, 'Luimneach'),
+        ('Springfield', 'Leinster', 'South Dublin', 'populated place', 7000, 53.29070, -6.39250, '')]),
+    ('GB', 'GBR', 'United Kingdom', 'London', [
+        ('London', 'England', 'Greater London', 'capital of a political entity', 8961989, 51.50853, -0.12574, 'Londres,Londra'),
+        ('Birmingham', 'England', 'West Midlands', 'seat of a second-order administrative division', 984333, 52.48142, -1.89983, 'Brum'),
+        ('Manchester', 'England', 'Greater Manchester', 'seat of a second-order administrative division', 395515, 53.48095, -2.23743, 'Mancunium'),
+        ('Edinburgh', 'Scotland', 'City of Edinburgh', 'seat of a first-order administrative division', 464990, 55.95206, -3.19648, 'Dùn Èideann'),
+        ('Cardiff', 'Wales', 'Cardiff', 'seat of a first-order administrative division', 447287, 51.48000, -3.18000, 'Caerdydd'),
+        ('Belfast', 'Northern Ireland', 'Belfast', 'seat of a first-order administrative division', 274770, 54.59682, -5.92541, 'Béal Feirste')]),
+    ('US', 'USA', 'United States', 'Washington', [
+        ('Washington', 'District of Columbia', 'District of Columbia', 'capital of a political entity', 689545, 38.89511, -77.03637, 'Washington D.C.'),
+        ('Springfield', 'Illinois', 'Sangamon County', 'seat of a first-order administrative division', 114394, 39.80172, -89.64371, ''),
+        ('Springfield', 'Missouri', 'Greene County', 'seat of a second-order administrative division', 169176, 37.21533, -93.29824, ''),
+        ('New York City', 'New York', 'New York County', 'populated place', 8804190, 40.71427, -74.00597, 'New York,NYC'),
+        ('Chicago', 'Illinois', 'Cook County', 'seat of a second-order administrative division', 2746388, 41.85003, -87.65005, ''),
+        ('Dover', 'Delaware', 'Kent County', 'seat of a first-order administrative division', 39403, 39.15817, -75.52437, '')]),
+    ('DE', 'DEU', 'Germany', 'Berlin', [
+        ('Berlin', 'Berlin', 'Berlin', 'capital of a political entity', 3426354, 52.52437, 13.41053, 'Berlino'),
+        ('Hamburg', 'Hamburg', 'Hamburg', 'seat of a first-order administrative division', 1845229, 53.57532, 10.01534, 'Hambourg'),
+        ('München', 'Bavaria', 'Upper Bavaria', 'seat of a first-order administrative division', 1260391, 48.13743, 11.57549, 'Munich,Monaco di Baviera'),
+        ('Köln', 'North Rhine-Westphalia', 'Cologne District', 'seat of a second-order administrative division', 963395, 50.93333, 6.95000, 'Cologne')]),
+    ('FR', 'FRA', 'France', 'Paris', [
+        ('Paris', 'Île-de-France', 'Paris', 'capital of a political entity', 2138551, 48.85341, 2.34880, 'Lutetia'),
+        ('Marseille', "Provence-Alpes-Côte d'Azur", 'Bouches-du-Rhône', 'seat of a first-order administrative division', 870731, 43.29695, 5.38107, 'Marseilles'),
+        ('Lyon', 'Auvergne-Rhône-Alpes', 'Rhône', 'seat of a first-order administrative division', 522969, 45.74846, 4.84671, 'Lyons'),
+        ('Besançon', 'Bourgogne-Franche-Comté', 'Doubs', 'seat of a second-order administrative division', 117912, 47.24878, 6.01815, 'Besancon')]),
+    ('IL', 'ISR', 'Israel', 'Jerusalem', [
+        ('Jerusalem', 'Jerusalem', 'Jerusalem', 'capital of a political entity', 801000, 31.76904, 35.21633, 'Yerushalayim'),
+        ('Tel Aviv', 'Tel Aviv', 'Tel Aviv', 'seat of a first-order administrative division', 432892, 32.08088, 34.78057, 'Tel Aviv-Yafo')]),
+    ('CI', 'CIV', "Côte d'Ivoire", 'Yamoussoukro', [
+        ('Abidjan', 'Abidjan', 'Abidjan', 'seat of a first-order administrative division', 3677115, 5.30966, -4.01266, ''),
+        ('Yamoussoukro', 'Yamoussoukro', 'Yamoussoukro', 'capital of a political entity', 194530, 6.82055, -5.27674, '')]),
+    ('FJ', 'FJI', 'Fiji', 'Suva', [  #(on both sides of the antimeridian)
+        ('Suva', 'Central', 'Rewa Province', 'capital of a political entity', 77366, -18.14161, 178.44149, ''),
+        ('Labasa', 'Northern', 'Macuata Province', 'seat of a first-order administrative division', 27949, -16.41667, 179.38333, ''),
+        ('Lomaloma', 'Eastern', 'Lau Province', 'populated place', 600, -17.28333, -178.98333, ''),
+        ('Waiyevo', 'Northern', 'Cakaudrove Province', 'populated place', 800, -16.78333, -179.98333, '')]),
+    ('SJ', 'SJM', 'Svalbard and Jan Mayen', 'Longyearbyen', [
+        ('Longyearbyen', 'Svalbard', 'Svalbard', 'capital of a political entity', 2060, 78.22334, 15.64689, ''),
+        ('Ny-Ålesund', 'Svalbard', 'Svalbard', 'populated place', 35, 78.92350, 11.90920, 'Ny-Alesund')]),
+    ('AQ', 'ATA', 'Antarctica', '', [
+        ('Amundsen-Scott South Pole Station', '', '', 'populated place', 150, -89.99750, 139.27306, 'South Pole'),
+        ('McMurdo Station', '', '', 'populated place', 1000, -77.84600, 166.67600, '')])]
+datasetAliases = [('Eire', 'IE'), ('UK', 'GB'), ('Britain', 'GB'), ('Great Britain', 'GB'), ('USA', 'US'), ('Deutschland', 'DE')]
+syllables = ['ash', 'bury', 'ton', 'ham', 'ford', 'ley', 'wick', 'by', 'chester', 'mouth', 'worth', 'field', 'bridge', 'brook', 'wood']
+
+
+
+def writeDataset(PATH, fillerTowns=400, seed=3):
+    #Writes the dataset into PATH (also compiled for mmap=True). fillerTowns synthetic towns (without
+    #aliases) are added to GB, so that its towns outnumber its aliases by far.
+    generator = random.Random(seed)
+    COUNTRIES = {key:[] for key in ['id2c', 'id3c', 'id3n', 'idFips', 'country', 'capital', 'area', 'population', 'id_continent']}
+    provinces = {}
+    for n, (id2c, id3c, country, capital, towns) in enumerate(datasetCountries):
+        for key, value in zip(COUNTRIES, [id2c, id3c, str(n), id2c, country, capital, 1000.0, 1000000, 'EU']):
+            COUNTRIES[key].append(value)
+        towns = list(towns)
+        if id2c == 'GB':
+            for i in range(fillerTowns):
+                name = ''.join(generator.choice(syllables) for _ in range(generator.randint(2, 3))).capitalize()
+                towns.append((name, 'England', generator.choice(['Kent', 'Essex', 'Devon', 'Norfolk']), 'populated place',
+                              generator.randint(100, 50000), generator.uniform(50, 58), generator.uniform(-7, 2), ''))
+        Towns = {'TownIndex':list(range(1, len(towns)+1)), 'Country':[country]*len(towns)}
+        columns = ['TownName', 'Province', 'Address2', 'TownClass', 'Population', 'Latitude', 'Longitude', 'AliasTownName']
+        for column, values in zip(columns, zip(*towns)):
+            Towns[column] = [value if value != '' else None for value in values]
+        Towns['County'] = list(Towns['Address2'])
+        provinces[id2c] = tdb.compileCountryFile(Towns, id2c, PATH)['provinces']
+    tdb.writeJSON(COUNTRIES, '{}CountriesDB.json'.format(PATH))
+    tdb.writeJSON({'countryAlias':[alias for alias, countryID in datasetAliases],
+                   'countryID':[countryID for alias, countryID in datasetAliases]}, '{}CountryAliasDB.json'.format(PATH))
+    tdb.writeProvinceDB(provinces, PATH)
+    tdb.compileBinaryDB(PATH)
+
+
+
+@pytest.fixture(scope='session')
+def datasetPATH(tmp_path_factory):
+    PATH = '{}/'.format(tmp_path_factory.mktemp('dataset'))
+    writeDataset(PATH)
+    return PATH
+
+
+
+@pytest.fixture(scope='session')
+def townsDB(datasetPATH):
+    #the JSON dataset, shared by the tests which don't change it
+    return tdb.loadDB(datasetPATH)
@@ -0,0 +1,48 @@
+'''Tests of parseAddress and parseAddresses on the dataset of conftest.py.'''
+import pytest
+import pandas as pd
+
+import TownsDataBase as tdb
+
+
+
+@pytest.mark.parametrize('address, expected', [
+    #the examples of the docstrings:
+    ("12 Main St, Cork, Co. Cork, Ireland", {'countryID':'IE', 'townName':'Cork', 'province':'County Cork', 'townProvince':'Munster',
+                                             'remainder':'12 Main St'}),
+    ("Cork Ireland", {'countryID':'IE', 'townName':'Cork', 'province':None, 'townProvince':'Munster', 'remainder':None}),
+    ("Main St, Cork", {'countryID':'IE', 'townName':'Cork', 'province':None, 'townProvince':'Munster', 'remainder':'Main St'}),
+    ("Paris, France", {'countryID':'FR', 'townName':'Paris', 'province':None, 'townProvince':'Île-de-France', 'remainder':None}),
+    #2-letter state abbreviations look like country codes:
+    ("Washington, DE", {'countryID':'US', 'townName':'Washington', 'province':None, 'townProvince':'District of Columbia',
+                        'remainder':'DE'}),
+    ("Springfield, IL, USA", {'countryID':'US', 'townName':'Springfield', 'province':None, 'townProvince':'Illinois',
+                              'remainder':'IL'}),
+    #a province or county named besides the town:
+    ("Springfield, Illinois", {'countryID':'US', 'townName':'Springfield', 'province':'Illinois', 'townProvince':'Illinois',
+                               'remainder':None}),
+    ("Main St, Springfield, Sangamon County, USA", {'countryID':'US', 'townName':'Springfield', 'province':'Sangamon County',
+                                                    'townProvince':'Illinois', 'remainder':'Main St'}),
+])
+def test_parseAddress(townsDB, address, expected):
+    result = tdb.parseAddress(address, townsDB)
+    assert {key:result[key] for key in expected} == expected
+    assert result['cityScore'] == 1.0
+
+
+
+def test_parseAddressOfNothing(townsDB):
+    for address in ['', '  ', None, float('nan')]:
+        result = tdb.parseAddress(address, townsDB)
+        assert result['townName'] is None and result['province'] is None and result['remainder'] is None
+
+
+
+def test_parseAddressesAlignsWithTheInput(townsDB):
+    addresses = pd.Series(["Springfield, IL, USA", "12 Main St, Cork, Co. Cork, Ireland", None, "Springfield, IL, USA"], index=[7, 3, 5, 1])
+    parsed = tdb.parseAddresses(addresses, townsDB)
+    assert list(parsed.index) == [7, 3, 5, 1]
+    assert list(parsed.columns) == ['countryID', 'countryScore', 'province', 'townName', 'cityScore', 'townIdx', 'townProvince', 'remainder']
+    assert parsed.loc[[7, 3, 1], 'townProvince'].tolist() == ['Illinois', 'Munster', 'Illinois']
+    assert parsed.loc[[7, 3, 1], 'remainder'].tolist() == ['IL', '12 Main St', 'IL']
+    assert parsed.loc[5, ['townName', 'townProvince', 'remainder']].isna().all()
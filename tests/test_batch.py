@@ -0,0 +1,39 @@
+'''Tests of the batch queries (queryCountryNames, queryCityNames, queryLocationNames).'''
+import numpy as np
+import pandas as pd
+
+import TownsDataBase as tdb
+
+
+
+def test_queryCityNamesAlignsWithTheInput(townsDB):
+    cities = pd.Series(['Dublin', 'Lodnon', 'Paris', None, 'Dublin', 'Springfield', 'Dublin'], index=[10, 4, 7, 2, 8, 1, 3])
+    countryIDs = ['IE', 'GB', 'XX', 'FR', 'IE', 'US', None]
+    matched = tdb.queryCityNames(cities, townsDB, countryIDs)
+    assert list(matched.index) == [10, 4, 7, 2, 8, 1, 3]
+    assert list(matched.columns) == ['townName', 'cityScore', 'townIdx', 'countryID']
+    for i, city, countryID in zip(cities.index, cities, countryIDs):
+        row = matched.loc[i]
+        if pd.isna(city) or countryID == 'XX': #no entry, or a countryID without a towns table: no match
+            assert pd.isna(row['townName']) and pd.isna(row['townIdx']) and row['cityScore'] == 0.0
+            continue
+        expected = tdb.queryCityName(city, townsDB, countryID)
+        assert [row['townName'], row['cityScore'], row['townIdx'], row['countryID']] == expected
+
+
+
+def test_queryCountryNamesAlignsWithTheInput(townsDB):
+    countries = np.array(['Ireland', 'U.S.A.', 'nan', 'Frnce', 'Ireland', 'Atlantis'], dtype=object)
+    matched = tdb.queryCountryNames(countries, townsDB)
+    assert list(matched.index) == list(range(6))
+    assert list(matched['countryID'][:2]) == ['IE', 'US'] and matched['countryID'][4] == 'IE'
+    assert matched['countryID'][3] == tdb.queryCountryName('Frnce', townsDB)[0] == 'FR'
+    assert pd.isna(matched['countryID'][2]) and pd.isna(matched['countryID'][5])
+    assert matched['countryScore'][2] == matched['countryScore'][5] == 0.0
+
+
+
+def test_queryLocationNamesFallsBackOnTheCityCountry(townsDB):
+    matched = tdb.queryLocationNames(['Ireland', None, 'Atlantis'], ['Cork', 'Besançon', 'Lyon'], townsDB)
+    assert list(matched['countryID']) == ['IE', 'FR', 'FR']
+    assert list(matched['townName']) == ['Cork', 'Besançon', 'Lyon']
@@ -0,0 +1,53 @@
+'''Tests of the time/work budgets of the query cascades.'''
+import pytest
+
+import TownsDataBase as tdb
+
+
+
+@pytest.fixture
+def scored(monkeypatch):
+    #list of the number of names of each call of the default scoring engine
+    calls = []
+    engine = tdb.scoreEngines[tdb.defaultScorer]
+    def countingEngine(Query, StandardList, scoreCutoff, Verbose, keys):
+        calls.append(len(StandardList))
+        return engine(Query, StandardList, scoreCutoff, Verbose, keys)
+    monkeypatch.setitem(tdb.scoreEngines, tdb.defaultScorer, countingEngine)
+    return calls
+
+
+
+@pytest.mark.parametrize('work, hit', [(1, True), (10, True), (299, True), (300, False), (5000, False)])
+def test_scoreCandidatesStopsAtTheWorkBudget(scored, work, hit):
+    names = ['town{}'.format(i) for i in range(300)]
+    budget = tdb.QueryBudget(work=work)
+    candidates = tdb.scoreCandidates('town7', names, budget=budget)
+    assert sum(scored) == min(work, 300)
+    assert budget.hit == hit
+    assert (['town7', 1.0, 7] in candidates) == (work > 7)
+
+
+
+@pytest.mark.parametrize('countryID', [None, 'GB'])
+@pytest.mark.parametrize('workBudget', [1, 10, 50])
+def test_queryCityNameWorkBudget(townsDB, scored, countryID, workBudget):
+    #(misspelt beyond the typo index, so the full search runs)
+    result, budgetHit = tdb.queryCityName('Brmnghamm', townsDB, countryID, workBudget=workBudget)
+    assert sum(scored) <= workBudget
+    assert budgetHit
+
+
+
+@pytest.mark.parametrize('countryID', [None, 'GB'])
+def test_queryCityNameWithinBudget(townsDB, scored, countryID):
+    result, budgetHit = tdb.queryCityName('Brmnghamm', townsDB, countryID, workBudget=10**6, budget=60.0)
+    assert result[0] == 'Birmingham' and not budgetHit
+    assert sum(scored) < 10**6
+
+
+
+def test_spentTimeBudget(townsDB, scored):
+    assert tdb.queryCityName('Brmnghamm', townsDB, budget=0.0) == [[None, 0.0, None, None], True]
+    assert tdb.queryCountryName('Germny', townsDB, budget=0.0) == [[None, 0.0], True]
+    assert sum(scored) == 0
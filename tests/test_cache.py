@@ -0,0 +1,76 @@
+'''Tests of the query cache (enableQueryCache, queryCacheStats, saveQueryCache).'''
+import json
+import shutil
+
+import pytest
+
+import TownsDataBase as tdb
+
+
+
+@pytest.fixture
+def cachedDB(datasetPATH):
+    return tdb.loadDB(datasetPATH, cacheSize=3)
+
+
+
+def test_hitsMissesAndEvictions(cachedDB):
+    first = tdb.queryCityName('Lodnon', cachedDB, 'GB')
+    assert tdb.queryCacheStats(cachedDB)['misses'] == 1
+    assert tdb.queryCityName('Lodnon', cachedDB, 'GB') == first
+    stats = tdb.queryCacheStats(cachedDB)
+    assert (stats['hits'], stats['misses'], stats['size']) == (1, 1, 1)
+    for entry in ['Mancheste', 'Birminghm', 'Glasgw']:
+        tdb.queryCityName(entry, cachedDB, 'GB')
+    stats = tdb.queryCacheStats(cachedDB)
+    assert (stats['size'], stats['evictions']) == (3, 1)
+    #'Lodnon' was the least recently used result:
+    tdb.queryCityName('Lodnon', cachedDB, 'GB')
+    assert tdb.queryCacheStats(cachedDB)['misses'] == 5
+
+
+
+@pytest.mark.skipif('rapidfuzz' not in tdb.scoreEngines, reason='rapidfuzz is not installed')
+def test_spellingsOfOneNameShareAnEntry(cachedDB):
+    results = [tdb.queryCityName(entry, cachedDB, 'IE', scorer='rapidfuzz') for entry in ['dublinn', 'DUBLINN', 'Dublínn']]
+    assert results[0][0] == 'Dublin' and results[1:] == results[:2]
+    stats = tdb.queryCacheStats(cachedDB)
+    assert (stats['hits'], stats['misses'], stats['size']) == (2, 1, 1)
+
+
+
+def test_countryHintListsAreCached(cachedDB):
+    first = tdb.queryCityName('Lodnon', cachedDB, countryHint=['GB', 'IE'])
+    assert tdb.queryCityName('Lodnon', cachedDB, countryHint=['GB', 'IE']) == first
+    assert tdb.queryCacheStats(cachedDB)['hits'] == 1
+
+
+
+def test_saveAndLoadRoundTrip(cachedDB, datasetPATH, tmp_path):
+    cacheFile = str(tmp_path / 'cache.json')
+    expected = {entry:tdb.queryCityName(entry, cachedDB, countryHint=['GB']) for entry in ['Lodnon', 'Mancheste']}
+    expected['Frnce'] = tdb.queryCountryName('Frnce', cachedDB)
+    tdb.saveQueryCache(cachedDB, cacheFile)
+    for loaded in [tdb.loadDB(datasetPATH, cacheSize=3, cachePATH=cacheFile),
+                   tdb.loadDB(datasetPATH, cacheSize=3, cachePATH=cacheFile, mmap=True)]:
+        assert tdb.queryCacheStats(loaded)['size'] == 3
+        assert tdb.queryCityName('Lodnon', loaded, countryHint=['GB']) == expected['Lodnon']
+        assert tdb.queryCityName('Mancheste', loaded, countryHint=['GB']) == expected['Mancheste']
+        assert tdb.queryCountryName('Frnce', loaded) == expected['Frnce']
+        stats = tdb.queryCacheStats(loaded)
+        assert (stats['hits'], stats['misses']) == (3, 0)
+
+
+
+def test_cacheOfAnotherDatasetIsIgnored(cachedDB, datasetPATH, tmp_path):
+    cacheFile = str(tmp_path / 'cache.json')
+    tdb.queryCityName('Lodnon', cachedDB, 'GB')
+    tdb.saveQueryCache(cachedDB, cacheFile)
+    otherPATH = '{}/other/'.format(tmp_path)
+    shutil.copytree(datasetPATH, otherPATH)
+    with open('{}GB.json'.format(otherPATH), 'r') as file:
+        Towns = json.load(file)
+    Towns['Population'][0] += 1
+    tdb.writeJSON(Towns, '{}GB.json'.format(otherPATH))
+    assert tdb.queryCacheStats(tdb.loadDB(otherPATH, cacheSize=3, cachePATH=cacheFile))['size'] == 0
+    assert tdb.queryCacheStats(tdb.loadDB(datasetPATH, cacheSize=3, cachePATH=cacheFile))['size'] == 1
@@ -0,0 +1,113 @@
+'''Tests of enrichFile: chunked enrichment of CSV, Parquet and Excel files, and resuming it.'''
+import pandas as pd
+import pytest
+
+import TownsDataBase as tdb
+
+rows = [('Ireland', 'Dublin'), ('UK', 'Lodnon'), ('Frnce', 'Besancon'), (None, 'Cork'), ('USA', 'Springfield'),
+        ('Deutschland', 'Munich'), ('Atlantis', 'Nowhere'), ('Ireland', None), ('Fiji', 'Suva'), ('Norway', 'Longyearbyen'),
+        ('Israel', 'Tel Aviv'), ("Cote d'Ivoire", 'Abidjan'), ('UK', 'Belfast')]
+inputTable = pd.DataFrame({'ID':range(len(rows)), 'COUNTRY':[row[0] for row in rows], 'CITY':[row[1] for row in rows]})
+formats = ['csv', pytest.param('parquet', marks=pytest.mark.skipif(tdb.pq is None, reason='pyarrow is not installed')),
+           pytest.param('xlsx', marks=pytest.mark.skipif(tdb.openpyxl is None, reason='openpyxl is not installed'))]
+
+
+
+def writeTable(table, fileName):
+    if fileName.endswith('.parquet'):
+        table.to_parquet(fileName, index=False)
+    elif fileName.endswith('.xlsx'):
+        table.to_excel(fileName, index=False)
+    else:
+        table.to_csv(fileName, index=False)
+
+
+
+def readTable(fileName):
+    if fileName.endswith('.parquet'):
+        return pd.read_parquet(fileName)
+    if fileName.endswith('.xlsx'):
+        return pd.read_excel(fileName)
+    return pd.read_csv(fileName)
+
+
+
+@pytest.fixture(params=formats)
+def files(request, tmp_path):
+    inPATH = str(tmp_path / 'addresses.{}'.format(request.param))
+    writeTable(inputTable, inPATH)
+    return inPATH, str(tmp_path / 'enriched.{}'.format(request.param)), str(tmp_path / 'reference.{}'.format(request.param))
+
+
+
+def test_enrichedRowsMatchTheQueries(townsDB, files):
+    inPATH, outPATH = files[:2]
+    summary = tdb.enrichFile(inPATH, outPATH, townsDB, chunkSize=4, Verbose=False)
+    matches = tdb.queryLocationNames(inputTable['COUNTRY'], inputTable['CITY'], townsDB)
+    assert summary == {'rows':len(rows), 'matched':int(matches['townIdx'].notna().sum()), 'nextRow':len(rows)}
+    enriched = readTable(outPATH)
+    assert list(enriched.columns) == ['ID', 'COUNTRY', 'CITY', 'countryID', 'countryScore', 'townName', 'cityScore', 'townIdx'] + tdb.enrichColumns
+    assert list(enriched['ID']) == list(range(len(rows)))
+    assert enriched['townName'].fillna('').tolist() == matches['townName'].fillna('').tolist()
+    assert enriched.loc[0, 'Population'] == townsDB['TOWNS']['IE']['Population'][0]
+
+
+
+def test_resumeAfterAnInterruption(townsDB, files, monkeypatch):
+    inPATH, outPATH, referencePATH = files
+    tdb.enrichFile(inPATH, referencePATH, townsDB, chunkSize=4, Verbose=False)
+    queryLocationNames = tdb.queryLocationNames
+    calls = []
+    def interrupted(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        return queryLocationNames(*args, **kwargs)
+    monkeypatch.setattr(tdb, 'queryLocationNames', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        tdb.enrichFile(inPATH, outPATH, townsDB, chunkSize=4, Verbose=False)
+    assert len(readTable(outPATH)) == 8 #the chunks written before the interruption are kept
+    monkeypatch.setattr(tdb, 'queryLocationNames', queryLocationNames)
+    summary = tdb.enrichFile(inPATH, outPATH, townsDB, chunkSize=4, startRow=8, Verbose=False)
+    assert (summary['rows'], summary['nextRow']) == (len(rows)-8, len(rows))
+    pd.testing.assert_frame_equal(readTable(outPATH), readTable(referencePATH), check_dtype=False)
+
+
+
+def test_resumeRewritesTheRowsOfAPartialOutput(townsDB, files):
+    #a resumed run keeps only the first startRow rows of the output, e.g. after a crash mid-chunk
+    inPATH, outPATH, referencePATH = files
+    tdb.enrichFile(inPATH, referencePATH, townsDB, chunkSize=4, Verbose=False)
+    #(a CSV output is appended to, so it must hold exactly startRow rows)
+    writeTable(readTable(referencePATH)[:5 if outPATH.endswith('.csv') else 7], outPATH)
+    tdb.enrichFile(inPATH, outPATH, townsDB, chunkSize=4, startRow=5, Verbose=False)
+    pd.testing.assert_frame_equal(readTable(outPATH), readTable(referencePATH), check_dtype=False)
+
+
+
+def test_addressColumn(townsDB, tmp_path):
+    inPATH, outPATH = str(tmp_path / 'addresses.csv'), str(tmp_path / 'enriched.csv')
+    addresses = ['12 Main St, Cork, Co. Cork, Ireland', 'Springfield, IL, USA', None, 'Paris, France']
+    writeTable(pd.DataFrame({'ADDRESS':addresses}), inPATH)
+    tdb.enrichFile(inPATH, outPATH, townsDB, addressColumn='ADDRESS', chunkSize=3, Verbose=False)
+    enriched = readTable(outPATH)
+    assert list(enriched.columns) == (['ADDRESS', 'countryID', 'countryScore', 'province', 'townName', 'cityScore', 'townIdx', 'remainder']
+                                      + tdb.enrichColumns)
+    assert enriched['townName'].fillna('').tolist() == ['Cork', 'Springfield', '', 'Paris']
+    assert enriched['Province'].fillna('').tolist() == ['Munster', 'Illinois', '', 'Île-de-France']
+    assert enriched['remainder'].fillna('').tolist() == ['12 Main St', 'IL', '', '']
+
+
+
+@pytest.mark.parametrize('extension', ['parquet', 'xlsx'])
+def test_resumeBeyondTheOutputRaises(townsDB, tmp_path, extension):
+    if (tdb.pq if extension == 'parquet' else tdb.openpyxl) is None:
+        pytest.skip('{} support is not installed'.format(extension))
+    inPATH = str(tmp_path / 'addresses.{}'.format(extension))
+    outPATH = str(tmp_path / 'enriched.{}'.format(extension))
+    writeTable(inputTable, inPATH)
+    tdb.enrichFile(inPATH, outPATH, townsDB, chunkSize=4, Verbose=False)
+    writeTable(readTable(outPATH)[:6], outPATH)
+    with pytest.raises(ValueError):
+        tdb.enrichFile(inPATH, outPATH, townsDB, chunkSize=4, startRow=8, Verbose=False)
+    assert len(readTable(outPATH)) == 6 #left as it was
@@ -0,0 +1,39 @@
+'''Tests of the exact-key fast path of queryCountryName (see buildCountryKeys).'''
+import pytest
+
+import TownsDataBase as tdb
+
+
+
+@pytest.fixture
+def meteredDB(datasetPATH):
+    townsDB = tdb.loadDB(datasetPATH)
+    tdb.enableMetrics(townsDB)
+    return townsDB
+
+
+
+@pytest.mark.parametrize('entry, countryID', [
+    ('IE', 'IE'), ('ie', 'IE'), ('IRL', 'IE'), ('Ireland', 'IE'), ('  ireland ', 'IE'), ('Eire', 'IE'),
+    ('U.S.A.', 'US'), ('usa', 'US'), ('United States', 'US'), ('UK', 'GB'), ('Great Britain', 'GB'),
+    ("Côte d'Ivoire", 'CI'), ("Cote d'Ivoire", 'CI'), ("COTE D'IVOIRE", 'CI'), ('Deutschland', 'DE'),
+    ('Svalbard & Jan Mayen', 'SJ'), ('Svalbard and Jan Mayen', 'SJ'),
+])
+def test_exactKeysSkipTheFuzzySearch(meteredDB, entry, countryID):
+    assert tdb.queryCountryName(entry, meteredDB) == [countryID, 1.0]
+    metrics = tdb.getMetrics(meteredDB)['country']
+    assert metrics['outcomes'] == {'exact':1}
+    assert sum(metrics['candidates'].values()) == 0 #(no names scored)
+
+
+
+def test_capitalsAndProvincesAreKeys(meteredDB):
+    assert tdb.queryCountryName('Yamoussoukro', meteredDB) == ['CI', 1.0]
+    assert tdb.queryCountryName('County Cork', meteredDB) == ['IE', 1.0]
+    assert tdb.getMetrics(meteredDB)['country']['outcomes'] == {'exact':2}
+
+
+
+def test_misspellingsStillRunTheCascade(meteredDB):
+    assert tdb.queryCountryName('Irelnd', meteredDB)[0] == 'IE'
+    assert 'exact' not in tdb.getMetrics(meteredDB)['country']['outcomes']
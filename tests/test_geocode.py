@@ -0,0 +1,62 @@
+'''Tests of reverseGeocode against a brute-force haversine scan of all towns.'''
+import math
+import random
+
+import numpy as np
+import pytest
+
+import TownsDataBase as tdb
+
+#locations either side of the antimeridian (Fiji), near both poles, and a few ordinary ones:
+locations = [(-17.0, 179.99), (-16.8, -179.9), (-17.2, 180.0), (-16.5, -180.0), (89.99, 0.0), (88.0, -120.0),
+             (-89.99, 45.0), (-77.0, 166.0), (78.2, 15.6), (53.3, -6.2), (51.5, -0.1), (0.0, 0.0)]
+rng = random.Random(5)
+locations += [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for i in range(20)]
+
+
+
+def bruteForce(townsDB, lat, lon):
+    #[distanceKM, TownName, townIdx, countryID] of every town with a location, nearest first
+    towns = []
+    for countryID, Towns in townsDB['TOWNS'].items():
+        for townIdx, (townLat, townLon) in enumerate(zip(Towns['Latitude'], Towns['Longitude'])):
+            if townLat is None or townLon is None:
+                continue
+            a = (math.sin(math.radians(townLat-lat)/2)**2
+                 + math.cos(math.radians(lat))*math.cos(math.radians(townLat))*math.sin(math.radians(townLon-lon)/2)**2)
+            towns.append([2*tdb.earthRadiusKM*math.asin(min(1.0, math.sqrt(a))), Towns['TownName'][townIdx], townIdx, countryID])
+    return sorted(towns)
+
+
+
+@pytest.mark.parametrize('lat, lon', locations)
+def test_nearestTownsMatchBruteForce(townsDB, lat, lon):
+    expected = bruteForce(townsDB, lat, lon)
+    for k in [1, 3]:
+        found = tdb.reverseGeocode(lat, lon, townsDB, k=k)
+        assert [town[2:] for town in found] == [town[2:] for town in expected[:k]]
+        assert [town[1] for town in found] == pytest.approx([town[0] for town in expected[:k]], rel=1e-9, abs=1e-6)
+    radiusKM = expected[4][0] + 1.0
+    found = tdb.reverseGeocode(lat, lon, townsDB, k=None, radiusKM=radiusKM)
+    assert [town[2:] for town in found] == [town[2:] for town in expected if town[0] <= radiusKM]
+
+
+
+def test_arraysMatchScalars(townsDB):
+    lat = np.array([location[0] for location in locations])
+    lon = np.array([location[1] for location in locations])
+    found = tdb.reverseGeocode(lat, lon, townsDB, k=2)
+    assert list(found['query']) == [i for i in range(len(locations)) for rank in range(2)]
+    for i, (latitude, longitude) in enumerate(locations):
+        rows = found[found['query'] == i]
+        expected = tdb.reverseGeocode(latitude, longitude, townsDB, k=2)
+        assert list(zip(rows['TownName'], rows['townIdx'], rows['countryID'])) == [(t[0], t[2], t[3]) for t in expected]
+
+
+
+@pytest.mark.parametrize('k', [0, -1, 1.5, True])
+def test_invalidK(townsDB, k):
+    with pytest.raises(ValueError):
+        tdb.reverseGeocode(53.3, -6.2, townsDB, k=k)
+    with pytest.raises(ValueError):
+        tdb.reverseGeocode(np.array([53.3]), np.array([-6.2]), townsDB, k=k, radiusKM=100)
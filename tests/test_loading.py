@@ -0,0 +1,61 @@
+'''Tests that the load modes of loadDB answer queries alike.'''
+import numpy as np
+import pytest
+
+import TownsDataBase as tdb
+
+cityQueries = [('Dublin', 'IE'), ('Lodnon', 'GB'), ('Munich', 'DE'), ('Besancon', 'FR'), ('Springfeld', None),
+               ('Ny-Alesund', None), ('South Pole', 'AQ'), ('Cork', None), ('Abidjan', 'CI'), ('Nowhere', None)]
+countryQueries = ['Ireland', 'U.S.A.', 'Frnce', 'Britin', 'Deutschland', "Cote d'Ivoire", 'Atlantis']
+
+
+
+def answers(townsDB):
+    #query results, reverse geocodes and a few town records of a loaded dataset
+    cities = [tdb.queryCityName(city, townsDB, countryID) for city, countryID in cityQueries]
+    countries = [tdb.queryCountryName(country, townsDB) for country in countryQueries]
+    geocodes = tdb.reverseGeocode(np.array([53.3, -17.0, 89.9]), np.array([-6.2, 179.99, 0.0]), townsDB, k=3).values.tolist()
+    records = [tdb.townRecord(townsDB, city[3], city[2]).asDict() for city in cities if city[0] != None]
+    for record in records: #missing values read back as None or nan depending on the column store
+        for name, value in record.items():
+            if isinstance(value, float) and np.isnan(value):
+                record[name] = None
+    return cities, countries, geocodes, records
+
+
+
+@pytest.fixture(scope='module')
+def expected(townsDB):
+    return answers(townsDB)
+
+
+
+def test_mmapAnswersLikeJSON(datasetPATH, expected):
+    townsDB = tdb.loadDB(datasetPATH, mmap=True)
+    assert answers(townsDB) == expected
+
+
+
+def test_columnarAnswersLikeJSON(datasetPATH, expected):
+    assert answers(tdb.loadDB(datasetPATH, columnar=True)) == expected
+
+
+
+def test_lazyAnswersLikeJSON(datasetPATH, expected):
+    townsDB = tdb.loadDB(datasetPATH, lazy=True)
+    assert townsDB['TOWNS'].loaded() == []
+    assert answers(townsDB) == expected
+
+
+
+def test_lazyLoadsOnlyTheQueriedCountries(datasetPATH, expected):
+    townsDB = tdb.loadDB(datasetPATH, lazy=True, preload=['FR'])
+    assert townsDB['TOWNS'].loaded() == ['FR']
+    assert tdb.queryCityName('Dublin', townsDB, 'IE') == expected[0][0]
+    assert sorted(townsDB['TOWNS'].loaded()) == ['FR', 'IE']
+    tdb.unloadCountry(townsDB, 'IE')
+    assert townsDB['TOWNS'].loaded() == ['FR']
+    #an unloaded country is read again on its next query:
+    assert tdb.queryCityName('Cork', townsDB, 'IE') == expected[0][7]
+    tdb.unloadCountry(townsDB)
+    assert townsDB['TOWNS'].loaded() == []
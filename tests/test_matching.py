@@ -0,0 +1,19 @@
+'''Tests of the candidate selection of pickBestQuery.'''
+import numpy as np
+
+import TownsDataBase as tdb
+
+
+
+def test_priorDoesNotCrossTheThreshold(monkeypatch):
+    #two candidates 0.004 apart, the one below the threshold with the larger prior:
+    monkeypatch.setitem(tdb.scoreEngines, 'fixed', lambda Query, StandardList, scoreCutoff, Verbose, keys:
+                        [['Above', 0.952, 0], ['Below', 0.948, 1]])
+    prior = np.array([0.0, 1.0])
+    pick = lambda threshold: tdb.pickBestQuery('x', ['Above', 'Below'], 1.0, scorer='fixed', returnIndex=True,
+                                               prior=prior, threshold=threshold)
+    assert pick(None) == ['Below', 0.948, 1]
+    assert pick(0.95) == ['Above', 0.952, 0]
+    #on the same side of the threshold, the prior still re-ranks:
+    assert pick(0.96) == ['Below', 0.948, 1]
+    assert pick(0.90) == ['Below', 0.948, 1]
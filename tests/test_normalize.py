@@ -0,0 +1,43 @@
+'''Tests of normalizeName and of the precomputed name key columns.'''
+import numpy as np
+import pandas as pd
+import pytest
+
+import TownsDataBase as tdb
+
+
+
+@pytest.mark.parametrize('name, key', [
+    ('Dublin', 'dublin'), ('DUBLIN', 'dublin'), ('Dublín', 'dublin'), ('München', 'munchen'), ('Besançon', 'besancon'),
+    ('Straße', 'strasse'), ('Łódź', 'lodz'), ('Æbeltoft', 'aebeltoft'), ('Søborg', 'soborg'), ('Œuf', 'oeuf'),
+    ('Đakovo', 'dakovo'), ('Þingvellir', 'thingvellir'), ('Reykjavík', 'reykjavik'), ('Diyarbakır', 'diyarbakir'),
+    ('Ny-Ålesund', 'ny alesund'), ('U.S.A.', 'usa'), ('St. Helier', 'st helier'), (" Côte d'Ivoire ", 'cote d ivoire'),
+    ('Trinidad & Tobago', 'trinidad and tobago'), ('Bosnia&Herzegovina', 'bosnia and herzegovina'),
+    ('Isle Of Man', 'isle of man'), ('Saint-Pierre_et--Miquelon', 'saint pierre et miquelon'), ('', ''),
+])
+def test_normalizeName(name, key):
+    assert tdb.normalizeName(name) == key
+
+
+
+@pytest.mark.parametrize('name', [None, np.nan, 12, ['Dublin']])
+def test_nonStringsMapOntoEmptyKeys(name):
+    assert tdb.normalizeName(name) == ''
+
+
+
+def test_normalizeNamesMatchesNormalizeName():
+    names = ['Dublín', None, 'Straße', 'Dublín', np.nan, 'U.S.A.']
+    expected = [tdb.normalizeName(name) for name in names]
+    assert tdb.normalizeNames(names) == expected
+    assert tdb.normalizeNames(pd.Series(names)) == expected
+
+
+
+@pytest.mark.parametrize('options', [{}, {'columnar':True}, {'mmap':True}])
+def test_keyColumnsAreLoaded(datasetPATH, options):
+    townsDB = tdb.loadDB(datasetPATH, **options)
+    for countryID in townsDB['TOWNS']:
+        Towns = townsDB['TOWNS'][countryID]
+        for field, keyField in tdb.nameKeyColumns.items():
+            assert list(Towns[keyField]) == [tdb.normalizeName(name) for name in Towns[field]]
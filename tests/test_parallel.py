@@ -0,0 +1,34 @@
+'''Tests of the multi-core matcher parallelQueryNames.'''
+import multiprocessing as mp
+
+import pandas as pd
+import pytest
+
+import TownsDataBase as tdb
+
+matchParallelChunk = tdb.matchParallelChunk
+
+
+
+def matchWarmChunk(args):
+    #matchParallelChunk, which first checks that the forked worker inherited built indexes
+    townsDB = tdb.sharedTownsDB
+    assert townsDB.get('NGRAM') is not None
+    assert set(townsDB.get('TYPO', {})) == {'TOWNS', 'COUNTRIES'}
+    assert set(townsDB['PRIORS']) == set(townsDB['TOWNS'])
+    return matchParallelChunk(args)
+
+
+
+@pytest.mark.skipif('fork' not in mp.get_all_start_methods(), reason='workers only inherit the dataset when forked')
+def test_workersInheritWarmIndexes(datasetPATH, monkeypatch):
+    monkeypatch.setattr(tdb, 'matchParallelChunk', matchWarmChunk)
+    townsDB = tdb.loadDB(datasetPATH)
+    assert townsDB.get('NGRAM') is None and 'TOWNS' not in townsDB.get('TYPO', {})
+    countries = pd.Series(['Ireland', 'Germany', 'Frnce', None, 'XX', 'Ireland'], index=[10, 11, 12, 13, 14, 15])
+    cities = ['Cork', 'Munich', 'Lyons', 'Chicago', 'Dublin', 'Cork']
+    matches = tdb.parallelQueryNames(countries, cities, townsDB, workers=2, chunkSize=2)
+    assert townsDB.get('NGRAM') is not None and set(townsDB['TYPO']) == {'TOWNS', 'COUNTRIES'}
+    pd.testing.assert_frame_equal(matches, tdb.queryLocationNames(countries, cities, tdb.loadDB(datasetPATH)),
+                                  check_dtype=False)
+    assert list(matches['townName']) == ['Cork', 'München', 'Lyon', 'Chicago', 'Dublin', 'Cork']
@@ -0,0 +1,20 @@
+'''Tests of the TownRecord views of towns.'''
+import pytest
+
+import TownsDataBase as tdb
+
+
+
+@pytest.mark.parametrize('options', [{}, {'columnar':True}, {'mmap':True}])
+def test_aliasColumnsFollowAliasIndex(datasetPATH, options):
+    townsDB = tdb.loadDB(datasetPATH, **options)
+    london = tdb.townRecord(townsDB, 'GB', 0)
+    assert london.Aliases == ['Londres', 'Londra']
+    assert london.asDict()['AliasKey'] == ['londres', 'londra']
+    #a town past the end of the (few) aliases of GB:
+    townIdx = len(townsDB['TOWNS']['GB']['TownName']) - 1
+    assert townIdx >= len(townsDB['TOWNS']['GB']['Aliases'])
+    record = tdb.townRecord(townsDB, 'GB', townIdx)
+    assert record.asDict()['Aliases'] == [] and record.asDict()['AliasKey'] == []
+    assert record.asDict()['TownName'] == townsDB['TOWNS']['GB']['TownName'][townIdx]
+    assert repr(record).startswith('TownRecord(')
@@ -0,0 +1,131 @@
+'''Tests of the scrapers (ScrapeSession, CountryInfo, recompileDB(Scrape=True))
+against the local stand-in server of conftest.py.'''
+import os
+import re
+import json
+import random
+from html import unescape
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+import TownsDataBase as tdb
+
+#arrival times at the server jitter by a few milliseconds around the client's schedule:
+tolerance = 0.015
+
+searchPaths = ['/search.html?q=&country={}&startRow={}'.format(CC, row) for CC, row in
+               [('IE', 0), ('IE', 50), ('GB', 0), ('GB', 50), ('FR', 0)]]
+
+
+
+def makeSession(standin, **kwargs):
+    settings = {'maxPerHost':4, 'minInterval':0.0, 'retries':0, 'backoff':0.05, 'timeout':10}
+    settings.update(kwargs)
+    return tdb.ScrapeSession(geonamesURL=standin.url, wikipediaURL='{}wiki/'.format(standin.url), **settings)
+
+
+
+#the town name link of a row of a GeoNames search page (the first link of a row only holds the marker image):
+townLink = re.compile(r'<td><a href="https://www.geonames.org/[0-9]+/[^"]*">([^<]+)</a>')
+
+
+
+def fixtureTownNames(CountryCode):
+    #TownNames of a country in the order of its saved search pages
+    names = []
+    for row in range(0, 1000, 50):
+        fileName = os.path.join(os.path.dirname(__file__), 'fixtures', 'geonames', 'search_{}_{}.html'.format(CountryCode, row))
+        if not os.path.isfile(fileName):
+            break
+        with open(fileName, 'r', encoding='utf-8') as page:
+            names += [unescape(name) for name in townLink.findall(page.read())]
+    return names
+
+
+
+def test_rateLimitSpacesRequestStarts(standin):
+    session = makeSession(standin, maxPerHost=8, minInterval=0.05)
+    with ThreadPoolExecutor(8) as executor:
+        pages = list(executor.map(session.get, [standin.url[:-1]+path for path in searchPaths*2]))
+    assert all('restable' in page for page in pages)
+    arrivals = [entry[0] for entry in standin.requests()]
+    assert len(arrivals) == 2*len(searchPaths)
+    for previous, following in zip(arrivals, arrivals[1:]):
+        assert following - previous >= 0.05 - tolerance
+
+
+
+def test_maxPerHostLimitsRequestsInFlight(standin):
+    standin.delay = lambda path: 0.05
+    session = makeSession(standin, maxPerHost=2)
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(session.get, [standin.url[:-1]+path for path in searchPaths*2]))
+    assert standin.maxInFlight == 2
+
+
+
+def test_retriesWithExponentialBackoff(standin):
+    standin.failures['/countries/'] = 2
+    session = makeSession(standin, retries=3, backoff=0.05)
+    page = session.get('{}countries/'.format(standin.url))
+    assert 'restable' in page
+    attempts = standin.requests('/countries/')
+    assert [entry[2] for entry in attempts] == [503, 503, 200]
+    assert attempts[1][0] - attempts[0][0] >= 0.05 - tolerance
+    assert attempts[2][0] - attempts[1][0] >= 0.10 - tolerance
+
+
+
+def test_raisesWhenRetriesAreSpent(standin):
+    standin.failures['/countries/'] = 5
+    session = makeSession(standin, retries=2, backoff=0.01)
+    with pytest.raises(requests.HTTPError):
+        session.get('{}countries/'.format(standin.url))
+    assert [entry[2] for entry in standin.requests('/countries/')] == [503, 503, 503]
+
+
+
+def test_countryInfoFollowsPagesInOrder(standin):
+    session = makeSession(standin)
+    Towns = tdb.CountryInfo('IE', session=session)
+    assert Towns['TownIndex'] == list(range(1, 56))
+    assert Towns['TownName'] == fixtureTownNames('IE')
+    #a full last page is followed by one more (empty) page:
+    Towns = tdb.CountryInfo('GB', session=session)
+    assert Towns['TownIndex'] == list(range(1, 51))
+    assert [entry[1] for entry in standin.requests() if 'country=GB' in entry[1]] == [searchPaths[2], searchPaths[3]]
+
+
+
+def scrapeFiles(standin, PATH, seed):
+    #Scrapes the stand-in site into PATH, with randomly delayed responses and a few failed
+    #requests, and returns the contents of the written files (except the scrape manifest).
+    delays = random.Random(seed)
+    standin.delay = lambda path: delays.uniform(0, 0.03)
+    standin.failures.update({searchPaths[0]:1, searchPaths[4]:2, '/countries/':1})
+    tdb.recompileDB(PATH, Scrape=True, session=makeSession(standin, retries=3, backoff=0.01), workers=4)
+    files = {}
+    for fileName in sorted(os.listdir(PATH)):
+        if fileName != 'ScrapeManifest.json': #(timestamps)
+            with open(os.path.join(PATH, fileName), 'rb') as file:
+                files[fileName] = file.read()
+    return files
+
+
+
+def test_scrapeRowOrderIsDeterministic(standin, tmp_path):
+    first = scrapeFiles(standin, '{}/first/'.format(tmp_path), seed=1)
+    second = scrapeFiles(standin, '{}/second/'.format(tmp_path), seed=2)
+    assert sorted(first) == ['CountriesDB.json', 'CountryAliasDB.json', 'CountryAliasDB_scraped.json',
+                             'FR.json', 'GB.json', 'IE.json', 'ProvinceDB.json']
+    assert first == second
+    COUNTRIES = json.loads(first['CountriesDB.json'])
+    assert COUNTRIES['id2c'] == ['FR', 'GB', 'IE']
+    for CountryCode in COUNTRIES['id2c']:
+        Towns = json.loads(first['{}.json'.format(CountryCode)])
+        assert Towns['TownName'] == fixtureTownNames(CountryCode)
+        assert Towns['TownIndex'] == list(range(1, len(Towns['TownName'])+1))
+    aliases = json.loads(first['CountryAliasDB_scraped.json'])
+    assert aliases['countryID'] == ['FR', 'FR', 'IE', 'IE', 'IE', 'GB', 'GB']
@@ -0,0 +1,112 @@
+'''Tests of the HTTP front end of the matching service (serveConnection, MatchService),
+with the matching itself replaced by an echo of the requests.'''
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import TownsDataBase as tdb
+
+
+
+def echoChunk(args):
+    items, options = args
+    return [{'echo':item} for item in items]
+
+
+
+async def exchange(service, request):
+    #Sends the raw request to a serveConnection server of service and returns all it answers (until it closes).
+    server = await asyncio.start_server(lambda r, w: tdb.serveConnection(r, w, service), '127.0.0.1', 0)
+    async with server:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(request)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+    return response
+
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(tdb, 'matchServiceChunk', echoChunk)
+    executor = ThreadPoolExecutor(1)
+    yield tdb.MatchService(executor, 1, (0.95, 0.65, None))
+    executor.shutdown()
+
+
+
+@pytest.mark.parametrize('length', ['abc', '-5', '1.5'])
+def test_malformedContentLengthIsABadRequest(service, length):
+    request = 'POST /match HTTP/1.1\r\nContent-Length: {}\r\n\r\n{{}}'.format(length).encode('latin-1')
+    response = asyncio.run(exchange(service, request))
+    head, _, body = response.partition(b'\r\n\r\n')
+    assert head.startswith(b'HTTP/1.1 400 Bad Request')
+    assert b'Connection: close' in head
+    assert json.loads(body) == {'error':'malformed Content-Length header'}
+
+
+
+def test_batchesAreTrackedUntilDone(service):
+    async def run():
+        batcher = asyncio.create_task(service.batcher())
+        try:
+            request = b'GET /match?city=Dublin&countryID=IE HTTP/1.1\r\nConnection: close\r\n\r\n'
+            response = await exchange(service, request)
+            await asyncio.sleep(0)
+            return response, len(service.tasks)
+        finally:
+            batcher.cancel()
+    response, running = asyncio.run(run())
+    head, _, body = response.partition(b'\r\n\r\n')
+    assert head.startswith(b'HTTP/1.1 200 OK')
+    assert json.loads(body) == {'echo':{'city':'Dublin', 'countryID':'IE'}}
+    assert service.stats['batches'] == 1
+    assert running == 0
+
+
+
+@pytest.fixture
+def datasetService(townsDB, monkeypatch):
+    #a service matching with the test dataset, on a thread of this process
+    monkeypatch.setattr(tdb, 'sharedTownsDB', townsDB)
+    executor = ThreadPoolExecutor(1)
+    yield tdb.MatchService(executor, 1, (0.95, 0.65, None))
+    executor.shutdown()
+
+
+
+def get(service, *targets):
+    #[(status, JSON payload)] of GET requests of the targets (in one event loop, as the service queue is bound to it)
+    async def run():
+        batcher = asyncio.create_task(service.batcher())
+        try:
+            return [await exchange(service, 'GET {} HTTP/1.1\r\nConnection: close\r\n\r\n'.format(target).encode('latin-1'))
+                    for target in targets]
+        finally:
+            batcher.cancel()
+    answers = []
+    for response in asyncio.run(run()):
+        head, _, body = response.partition(b'\r\n\r\n')
+        answers.append((int(head.split()[1]), json.loads(body)))
+    return answers
+
+
+
+def test_unknownCountryIDIsNoMatch(datasetService, townsDB):
+    assert tdb.queryCityName('Dublin', townsDB, 'XX') == [None, 0.0, None, None]
+    assert get(datasetService, '/match?countryID=XX&city=Dublin', '/match?countryID=IE&city=Dublin') == [
+        (200, {'countryID':None, 'countryScore':0.0, 'townName':None, 'cityScore':0.0, 'townIdx':None}),
+        (200, {'countryID':'IE', 'countryScore':1.0, 'townName':'Dublin', 'cityScore':1.0, 'townIdx':0})]
+    assert datasetService.stats['errors'] == 0
+
+
+
+def test_failedItemsAreCounted(datasetService, monkeypatch):
+    def failingMatch(item, townsDB, *options):
+        raise RuntimeError('boom')
+    monkeypatch.setattr(tdb, 'matchItem', failingMatch)
+    assert get(datasetService, '/match?city=Dublin') == [(500, {'error':'RuntimeError: boom'})]
+    assert datasetService.stats['errors'] == 1
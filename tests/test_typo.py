@@ -0,0 +1,62 @@
+'''Tests of the typo indexes (delete variants & Soundex, see buildTypoIndex).'''
+import pytest
+
+import TownsDataBase as tdb
+
+misspelledCountries = ['Britin', 'Brtain', 'Germny', 'Frnace', 'Irelnd', 'Deutchland', 'Swtizerland']
+misspelledCities = [('Dublni', None), ('Hamburgg', None), ('Lomalma', None), ('Marseile', 'FR'), ('Lodnon', 'GB'), ('Bleafst', None),
+                    ('Besancn', None), ('Longyerbyen', None)]
+
+
+
+@pytest.mark.parametrize('key, distance', [('', 0), ('ab', 0), ('abc', 0), ('abcd', 1), ('britin', 1), ('abcdefg', 2),
+                                           ('switzerland', 2), ('a'*30, 2)])
+def test_typoDistanceGrowsWithTheLength(key, distance):
+    assert tdb.typoDistance(key, 2) == distance
+    assert tdb.typoDistance(key, 1) == min(1, distance)
+
+
+
+def test_deleteVariants():
+    assert tdb.deleteVariants('abc') == {'abc', 'bc', 'ac', 'ab'}
+    assert tdb.deleteVariants('abc', 2) == {'abc', 'bc', 'ac', 'ab', 'a', 'b', 'c'}
+    assert tdb.deleteVariants('abcdef', 1, prefixLength=3) == {'abc', 'bc', 'ac', 'ab'}
+
+
+
+@pytest.mark.parametrize('key, code', [('britain', 'B635'), ('britin', 'B635'), ('robert', 'R163'), ('ashcraft', 'A261'),
+                                       ('tymczak', 'T522'), ('ny alesund', 'N425'), ('123', '')])
+def test_soundex(key, code):
+    assert tdb.soundex(key) == code
+
+
+
+def test_countryTypoCandidates(townsDB):
+    index = tdb.getTypoIndex(townsDB, 'COUNTRIES')
+    positions, within = tdb.typoCandidates('Britin', index)
+    found = {index['nameKey'][p]:w for p, w in zip(positions.tolist(), within.tolist())}
+    assert found['britain'] is True
+    assert set(index['countryID'][p] for p in positions[within].tolist()) == {'GB'}
+
+
+
+def test_townTypoCandidates(townsDB):
+    index = tdb.getTypoIndex(townsDB, 'TOWNS')
+    nameTable = tdb.getNameTable(townsDB)
+    positions, within = tdb.typoCandidates('Dublni', index)
+    assert ('dublin', True) in [(nameTable['key'][p], w) for p, w in zip(positions.tolist(), within.tolist())]
+    assert len(positions) < len(nameTable['key'])//10 #a few candidates instead of every name
+
+
+
+def test_misspelledCountries(townsDB):
+    assert tdb.queryCountryName('Britin', townsDB) == ['GB', pytest.approx(0.852, abs=0.001)]
+
+
+
+def test_typoIndexesKeepTheRecallOfTheScan(datasetPATH, townsDB):
+    scanDB = tdb.loadDB(datasetPATH, typoIndex=False)
+    for entry in misspelledCountries:
+        assert tdb.queryCountryName(entry, townsDB) == tdb.queryCountryName(entry, scanDB)
+    for entry, countryID in misspelledCities:
+        assert tdb.queryCityName(entry, townsDB, countryID) == tdb.queryCityName(entry, scanDB, countryID)